@@ -0,0 +1,193 @@
+"""
+midi_curves.py
+
+Vectorized MIDI curves for the harmonograph and sine melody scripts.
+
+The parametric curves are evaluated as NumPy arrays (one value per step),
+mapped to MIDI values, and thinned before they are written: a CC value
+equal to the previous one of its lane is redundant (REAPER holds the CC
+value until the next event), and with linear CC shapes, the points
+within a tolerance of the line between their neighbors are redundant too
+(Ramer-Douglas-Peucker thinning). The remaining events are then written
+to the take in a single call to REAPER, sorted once at the end, instead
+of a call per event.
+
+Times are in quarter notes (QN) from the start of the project, and
+converted to PPQ (MIDI ticks) of the take when written.
+"""
+
+import time
+from collections import Counter
+
+import numpy as np
+import reapy
+
+# MIDI_SetCCShape shapes
+SQUARE = 0
+LINEAR = 1
+
+
+def map_values(values, in_min, in_max, out_min, out_max, clamp=False):
+    """
+    Maps the values (an array) from the input range to the output range,
+    clamping them to the input range if clamp.
+    """
+    values = np.asarray(values, dtype=float)
+    if clamp:
+        values = np.clip(values, in_min, in_max)
+    return (values - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
+
+
+def to_midi(values, in_min, in_max, out_min=0, out_max=127, clamp=False):
+    """
+    Maps the values to MIDI values (ints, truncated like int()).
+    """
+    mapped = map_values(values, in_min, in_max, out_min, out_max, clamp)
+    return np.clip(np.trunc(mapped), 0, 127).astype(int)
+
+
+def remove_unchanged(times, values):
+    """
+    Returns the times and values without the values equal to the previous
+    one (lossless for square CC shapes).
+    """
+    values = np.asarray(values)
+    changed = np.ones(len(values), dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    return np.asarray(times)[changed], values[changed]
+
+
+def thin(times, values, tolerance):
+    """
+    Returns the times and values of the points of the curve kept by the
+    Ramer-Douglas-Peucker algorithm: the first and last points, and
+    recursively the point farthest from the line between the kept points
+    around it, while farther than tolerance (in value units, vertically).
+    With linear CC shapes, the thinned curve stays within tolerance of the
+    original one.
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values)
+    n = len(values)
+    if n <= 2:
+        return times, values
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # Explicit stack of the (first, last) segments to check
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment_times = times[first + 1:last]
+        slope = (values[last] - values[first]) / (times[last] - times[first])
+        line = values[first] + slope * (segment_times - times[first])
+        errors = np.abs(values[first + 1:last] - line)
+        farthest = int(np.argmax(errors))
+        if errors[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return times[keep], values[keep]
+
+
+def thin_cc(times, values, tolerance=0):
+    """
+    Removes the redundant points of a CC lane: the unchanged values for
+    square CC shapes (tolerance 0), or the points within tolerance of the
+    line between the points kept for linear CC shapes (tolerance > 0,
+    the unchanged values on a plateau are removed by the thinning).
+    """
+    if tolerance > 0:
+        return thin(times, values, tolerance)
+    return remove_unchanged(times, values)
+
+
+@reapy.inside_reaper()
+def insert_ccs(take, lanes, channel=0, shape=SQUARE):
+    """
+    Inserts the CC events of the lanes, a list of (cc_number, times_qn,
+    values), in the take in a single call to REAPER, sorting them once at
+    the end. With shape LINEAR, REAPER interpolates between the events,
+    only the inserted events are reshaped (the events already in the take
+    are left as is). Returns the number of events inserted.
+    """
+    # (ppq, cc number, value) -> number of events inserted, to find them
+    # back after the sort changed their indices
+    inserted = Counter()
+    for cc_number, times_qn, values in lanes:
+        for time_qn, value in zip(np.asarray(times_qn).tolist(),
+                                  np.asarray(values).tolist()):
+            # RPR.MIDI_InsertCC(take, selected, muted, ppqpos, chanmsg, chan, msg2, msg3, noSort)
+            ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, time_qn)
+            reapy.RPR.MIDI_InsertCC(take.id, False, False, ppq, 0xB0, channel,
+                                    cc_number, int(value), True)
+            inserted[(round(ppq), cc_number, int(value))] += 1
+    reapy.RPR.MIDI_Sort(take.id)
+    count = sum(inserted.values())
+
+    if shape != SQUARE:
+        num_ccs = reapy.RPR.MIDI_CountEvts(take.id, 0, 0, 0)[3]
+        for index in range(num_ccs):
+            # (retval, take, ccidx, selected, muted, ppqpos, chanmsg, chan, msg2, msg3)
+            cc = reapy.RPR.MIDI_GetCC(take.id, index, 0, 0, 0, 0, 0, 0, 0)
+            if cc[6] != 0xB0 or cc[7] != channel:
+                continue
+            key = (round(cc[5]), cc[8], cc[9])
+            if inserted[key]:
+                inserted[key] -= 1
+                reapy.RPR.MIDI_SetCCShape(take.id, index, shape, 0.0, True)
+        reapy.RPR.MIDI_Sort(take.id)
+    return count
+
+
+@reapy.inside_reaper()
+def insert_notes(take, starts_qn, ends_qn, pitches, velocities, channel=0):
+    """
+    Inserts the notes in the take in a single call to REAPER, sorting them
+    once at the end. Returns the number of notes inserted.
+    """
+    starts_qn = np.atleast_1d(starts_qn).tolist()
+    ends_qn = np.atleast_1d(ends_qn).tolist()
+    pitches = np.broadcast_to(pitches, len(starts_qn)).tolist()
+    velocities = np.broadcast_to(velocities, len(starts_qn)).tolist()
+    for start_qn, end_qn, pitch, velocity in zip(starts_qn, ends_qn, pitches,
+                                                 velocities):
+        # RPR.MIDI_InsertNote(take, selected, muted, start, end, chan, pitch, vel, noSort)
+        start_ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, start_qn)
+        end_ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, end_qn)
+        reapy.RPR.MIDI_InsertNote(take.id, False, False, start_ppq, end_ppq,
+                                  channel, int(pitch), int(velocity), True)
+    reapy.RPR.MIDI_Sort(take.id)
+    return len(starts_qn)
+
+
+def benchmark(get_lanes, densities=(10, 100, 1000, 10000), tolerance=1.0):
+    """
+    For each density, evaluates the curves of get_lanes(density), a
+    function returning the list of (cc_number, times_qn, values) lanes,
+    and prints the number of CC events without thinning, without the
+    unchanged values, and thinned with tolerance, and the time taken.
+    """
+    for density in densities:
+        start = time.perf_counter()
+        lanes = get_lanes(density)
+        evaluate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        unchanged = [remove_unchanged(times, values) for _, times, values in lanes]
+        unchanged_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        thinned = [thin_cc(times, values, tolerance) for _, times, values in lanes]
+        thin_time = time.perf_counter() - start
+
+        total = sum(len(values) for _, _, values in lanes)
+        print(f"density {density}: {total} events, "
+              f"{sum(len(values) for _, values in unchanged)} without unchanged "
+              f"values ({unchanged_time * 1000:.1f} ms), "
+              f"{sum(len(values) for _, values in thinned)} thinned with "
+              f"tolerance {tolerance} ({thin_time * 1000:.1f} ms), "
+              f"curves evaluated in {evaluate_time * 1000:.1f} ms")
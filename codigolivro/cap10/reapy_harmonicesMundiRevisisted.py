@@ -3,14 +3,22 @@ reapy_harmonicesMundiRevisisted.py
 
 Sonify mean planetary velocities in the solar system.
 Creates 9 tracks in REAPER, one for each planet.
+The notes and pan CCs of each planet are computed as arrays and inserted
+at once (see midi_curves.py).
 
 Ported from harmonicesMundiRevisisted.py
 """
 
 import reapy
-import math
 import random
 
+import numpy as np
+
+from midi_curves import to_midi, remove_unchanged, insert_ccs, insert_notes
+
+import shared
+from scales import get_scale_notes
+
 # Constants
 # Notes
 C3 = 48
@@ -40,27 +48,6 @@ def map_value(value, in_min, in_max, out_min, out_max):
     val = (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
     return max(out_min, min(out_max, val)) # Clamp
 
-def get_scale_notes(root, intervals, bottom_midi, top_midi):
-    """Generates a list of valid MIDI notes in the scale within range."""
-    notes = []
-    # Start usually from C0 (12) or so
-    # Simple generation: check all MIDI notes
-    for midi_note in range(bottom_midi, top_midi + 1):
-        # Calculate interval from root (modulo 12)
-        # root is C4 (60) usually, or we can just say Scale Root C (0, 12, 24...).
-        # Assuming C Mixolydian.
-        # Note % 12 should be in [(root + i) % 12 for i in intervals]
-        # If root is C (0), intervals are absolute mod 12.
-        
-        # Let's assume Scale is C Mixolydian.
-        root_class = root % 12
-        note_class = midi_note % 12
-        interval_class = (note_class - root_class) % 12
-        
-        if interval_class in MIXOLYDIAN_INTERVALS:
-            notes.append(midi_note)
-    return notes
-
 def map_to_scale(value, in_min, in_max, scale_notes):
     """Maps continuous value to nearest note in scale list."""
     # Map value to index in scale_notes
@@ -81,44 +68,27 @@ def sonify_planet(project, index, velocity, name):
     scale_notes = get_scale_notes(C4, MIXOLYDIAN_INTERVALS, C3, C6)
     
     # Generate Note Data
-    current_qn = 0.0
-    
-    # Store events to write in bulk if possible, or just sequential write
-    # We need total length for item first? 
     # Since durations are random, we calculate logic first.
     
-    note_events = []
-    total_qn = 0.0
+    # Pitch is constant for the planet in original code logic:
+    # pitch = mapScale(planetVelocity...) -> Based on Planet Velocity which is const for the loop
+    pitch = map_to_scale(velocity, MIN_VELOCITY, MAX_VELOCITY, scale_notes)
     
-    for i in range(NUM_NOTES):
-        # Pitch is constant for the planet in original code logic:
-        # pitch = mapScale(planetVelocity...) -> Based on Planet Velocity which is const for the loop
-        
-        pitch = map_to_scale(velocity, MIN_VELOCITY, MAX_VELOCITY, scale_notes)
-        
-        # Duration
-        dur = random.choice(DURATIONS)
-        
-        # Dynamics & Pan oscillate
-        # pan = mapValue(sin(i * planetVelocity * speedFactor * 2)...)
-        pan_osc = math.sin(i * velocity * SPEED_FACTOR * 2)
-        pan = int(map_value(pan_osc, -1.0, 1.0, 0, 127))
-        
-        # dyn = mapValue(cos(i * planetVelocity * speedFactor * 3)...)
-        dyn_osc = math.cos(i * velocity * SPEED_FACTOR * 3)
-        dyn = int(map_value(dyn_osc, -1.0, 1.0, 40, 127))
-        
-        note_events.append({
-            "start": current_qn,
-            "end": current_qn + dur,
-            "pitch": pitch,
-            "vel": dyn,
-            "pan": pan
-        })
-        
-        current_qn += dur
-        
-    total_qn = current_qn
+    # Duration
+    durations = np.array([random.choice(DURATIONS) for i in range(NUM_NOTES)])
+    
+    # Dynamics & Pan oscillate
+    steps = np.arange(NUM_NOTES)
+    # pan = mapValue(sin(i * planetVelocity * speedFactor * 2)...)
+    pans = to_midi(np.sin(steps * velocity * SPEED_FACTOR * 2), -1.0, 1.0, 0, 127, clamp=True)
+    
+    # dyn = mapValue(cos(i * planetVelocity * speedFactor * 3)...)
+    dyns = to_midi(np.cos(steps * velocity * SPEED_FACTOR * 3), -1.0, 1.0, 40, 127, clamp=True)
+    
+    # Each note starts where the previous one ends
+    ends_qn = np.cumsum(durations)
+    starts_qn = ends_qn - durations
+    total_qn = ends_qn[-1]
     
     # BPM to seconds
     bpm = 120
@@ -126,19 +96,15 @@ def sonify_planet(project, index, velocity, name):
     total_sec = total_qn * qn_to_sec
     
     # Create Item
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     if not take: return
     
-    # Write Events
-    for evt in note_events:
-        # Note
-        reapy.RPR.MIDI_InsertNote(take.id, False, False, evt["start"], evt["end"], 0, evt["pitch"], evt["vel"], True)
-        
-        # Pan CC (10)
-        reapy.RPR.MIDI_InsertCC(take.id, False, False, evt["start"], 176, 10, evt["pan"], True)
-
-    reapy.RPR.MIDI_Sort(take.id)
+    # Write Events, the notes and the Pan CCs (10) in a call each,
+    # the Pan CCs only when the pan changes
+    insert_notes(take, starts_qn, ends_qn, pitch, dyns)
+    pan_times, pan_values = remove_unchanged(starts_qn, pans)
+    insert_ccs(take, [(10, pan_times, pan_values)])
 
 def main():
     try:
@@ -8,14 +8,56 @@ Harmonograph parameters:
 - Freq 1: Controls Pan (CC 10)
 - Freq 2: Controls Expression (CC 11)
 
+The CC curves are computed as arrays and thinned (see midi_curves.py).
+
 Ported from harmonographLateral.py
 """
 
 import reapy
 import math
+import sys
+
+import numpy as np
+
+from midi_curves import (to_midi, thin_cc, insert_ccs, insert_notes, benchmark,
+                         SQUARE, LINEAR)
+
+# Harmonograph Parameters
+# Freq 1 (Pan) vs Freq 2 (Expression)
+FREQ1 = 2 
+FREQ2 = 3
+AMPL = 1.0 # Normalized amplitude for calc
 
-def map_value(value, in_min, in_max, out_min, out_max):
-    return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
+DENSITY = 25.0
+CYCLES = 6
+
+# Duration of each step in QN
+# Make it dense enough to be smooth
+STEP_QN = 0.05 
+
+# Max error of the thinned CC curves, in CC values (0 keeps every change)
+TOLERANCE = 1.0
+
+def get_cc_lanes(density, cycles=CYCLES):
+    """
+    Returns the [(cc_number, times_qn, values)] of the Pan and Expression
+    lanes of the harmonograph, one CC value per step.
+    """
+    cycle_steps = int(2 * math.pi * density)
+    total_steps = cycle_steps * cycles
+    rotation = np.arange(total_steps) / density
+    
+    # Calculate Sine Waves
+    # In original: x = sin(rot * freq1), y = sin(rot * freq2)
+    
+    # Map X to Pan (CC 10)
+    pan_vals = to_midi(np.sin(rotation * FREQ1), -1.0, 1.0)
+    
+    # Map Y to Expression (CC 11)
+    expr_vals = to_midi(np.sin(rotation * FREQ2), -1.0, 1.0)
+    
+    times_qn = np.arange(total_steps) * STEP_QN
+    return [(10, times_qn, pan_vals), (11, times_qn, expr_vals)]
 
 def main():
     try:
@@ -25,34 +67,20 @@ def main():
         print("Error: Could not connect to REAPER.")
         return
 
-    # Harmonograph Parameters
-    # Freq 1 (Pan) vs Freq 2 (Expression)
-    FREQ1 = 2 
-    FREQ2 = 3
-    AMPL = 1.0 # Normalized amplitude for calc
-
-    DENSITY = 25.0
-    CYCLE_STEPS = int(2 * math.pi * DENSITY)
-    CYCLES = 6
-    TOTAL_STEPS = CYCLE_STEPS * CYCLES
-    
-    # Duration of each step in QN
-    # Make it dense enough to be smooth
-    STEP_QN = 0.05 
-
     # Create Track
     track = project.add_track()
     track.name = f"Harmonograph {FREQ1}:{FREQ2}"
     track.select()
     
     # Calculate Total Length
+    lanes = get_cc_lanes(DENSITY)
     bpm = 120
     qn_to_sec = 60 / bpm
-    total_qn = TOTAL_STEPS * STEP_QN
+    total_qn = len(lanes[0][1]) * STEP_QN
     total_sec = total_qn * qn_to_sec
 
     # Create Item
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     
     if not take:
@@ -63,33 +91,13 @@ def main():
 
     # Insert a single long note so we can hear the synth
     # Pitch C4 (60), Vel 100
-    reapy.RPR.MIDI_InsertNote(take.id, False, False, 0, total_qn, 0, 60, 100, True)
+    insert_notes(take, 0.0, total_qn, 60, 100)
 
-    current_qn = 0.0
-    
-    # Loop
-    for i in range(TOTAL_STEPS):
-        rotation = i / DENSITY
-        
-        # Calculate Sine Waves
-        # In original: x = sin(rot * freq1), y = sin(rot * freq2)
-        
-        # Map X to Pan (CC 10)
-        val_x = math.sin(rotation * FREQ1)
-        pan_val = int(map_value(val_x, -1.0, 1.0, 0, 127))
-        
-        # Map Y to Expression (CC 11)
-        val_y = math.sin(rotation * FREQ2)
-        expr_val = int(map_value(val_y, -1.0, 1.0, 0, 127))
-        
-        # Insert CCs
-        # MIDI_InsertCC(take, selected, muted, time_qn, msg_type (176), cc_num, value, noSort)
-        reapy.RPR.MIDI_InsertCC(take.id, False, False, current_qn, 176, 10, pan_val, True)
-        reapy.RPR.MIDI_InsertCC(take.id, False, False, current_qn, 176, 11, expr_val, True)
-        
-        current_qn += STEP_QN
-
-    reapy.RPR.MIDI_Sort(take.id)
+    # Thin the CC curves, then insert them at once
+    thinned = [(cc_number,) + thin_cc(times_qn, values, TOLERANCE)
+               for cc_number, times_qn, values in lanes]
+    count = insert_ccs(take, thinned, shape=LINEAR if TOLERANCE > 0 else SQUARE)
+    print(f"{count} CC events written ({sum(len(lane[2]) for lane in lanes)} steps).")
     
     # Open Editor
     item.selected = True
@@ -101,4 +109,8 @@ def main():
     print("Done! Check CC Lane 10 (Pan) and 11 (Expression) to see the waves.")
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        # CC events and time at high densities, without REAPER
+        benchmark(get_cc_lanes, tolerance=TOLERANCE)
+    else:
+        main()
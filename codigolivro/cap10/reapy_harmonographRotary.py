@@ -11,16 +11,71 @@ Mapping:
 - X-Axis -> Pan (CC 10)
 - Y-Axis -> Expression (CC 11)
 
+The CC curves are computed as arrays and thinned (see midi_curves.py).
+
 Ported from harmonographRotary.py
 """
 
 import reapy
 import math
+import sys
+
+import numpy as np
+
+from midi_curves import (to_midi, thin_cc, insert_ccs, insert_notes, benchmark,
+                         SQUARE, LINEAR)
+
+# Harmonograph Parameters
+FREQ1 = 8     
+FREQ2 = 13     
+AMPL1 = 40.0   
+AMPL2 = 40.0 
+
+# We use a lower density than the original py script to avoid freezing REAPER with too many CCs
+# Original density=100. We'll use 10. Each step is STEP_QN long, so a
+# higher density also makes the item longer (run with --benchmark for the
+# thinning at high densities).
+DENSITY = 10.0
+CYCLES = 4
+
+STEP_QN = 0.05 
+
+# Max error of the thinned CC curves, in CC values (0 keeps every change)
+TOLERANCE = 1.0
 
-def map_value(value, in_min, in_max, out_min, out_max):
+def get_cc_lanes(density, cycles=CYCLES):
+    """
+    Returns the [(cc_number, times_qn, values)] of the Pan and Expression
+    lanes of the harmonograph, one CC value per step.
+    """
+    cycle_steps = int(2 * math.pi * density)
+    total_steps = cycle_steps * cycles
+    rotation = np.arange(total_steps) / density
+    
+    # Circle 1
+    x1 = np.sin(rotation * FREQ1) * AMPL1
+    y1 = np.cos(rotation * FREQ1) * AMPL1
+    
+    # Circle 2
+    x2 = np.sin(rotation * FREQ2) * AMPL2
+    y2 = np.cos(rotation * FREQ2) * AMPL2
+    
+    # Combine (Vector subtraction as per original script)
+    x = x1 - x2
+    y = y1 - y2
+    
+    # Pre-calc max range for mapping
+    # Max possible X = AMPL1 + AMPL2 (constructive interference)
+    # Min possible X = -(AMPL1 + AMPL2)
+    max_amp = AMPL1 + AMPL2
+    
+    # Map X -> Pan (CC 10), Y -> Expression (CC 11)
     # Clamp value to input range to avoid out of bounds CC
-    value = max(in_min, min(in_max, value))
-    return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
+    pan_vals = to_midi(x, -max_amp, max_amp, clamp=True)
+    expr_vals = to_midi(y, -max_amp, max_amp, clamp=True)
+    
+    times_qn = np.arange(total_steps) * STEP_QN
+    return [(10, times_qn, pan_vals), (11, times_qn, expr_vals)]
 
 def main():
     try:
@@ -30,34 +85,20 @@ def main():
         print("Error: Could not connect to REAPER.")
         return
 
-    # Harmonograph Parameters
-    FREQ1 = 8     
-    FREQ2 = 13     
-    AMPL1 = 40.0   
-    AMPL2 = 40.0 
-
-    # We use a lower density than the original py script to avoid freezing REAPER with too many CCs
-    # Original density=100. We'll use 10.
-    DENSITY = 10.0
-    CYCLE_STEPS = int(2 * math.pi * DENSITY)
-    CYCLES = 4
-    TOTAL_STEPS = CYCLE_STEPS * CYCLES
-    
-    STEP_QN = 0.05 
-
     # Create Track
     track = project.add_track()
     track.name = f"Harmonograph Rotary {FREQ1}:{FREQ2}"
     track.select()
     
     # Calculate Total Length
+    lanes = get_cc_lanes(DENSITY)
     bpm = 120
     qn_to_sec = 60 / bpm
-    total_qn = TOTAL_STEPS * STEP_QN
+    total_qn = len(lanes[0][1]) * STEP_QN
     total_sec = total_qn * qn_to_sec
 
     # Create Item
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     
     if not take:
@@ -67,43 +108,13 @@ def main():
     print(f"Generating Rotary Harmonograph ({FREQ1}:{FREQ2})...")
 
     # Insert a single long note
-    reapy.RPR.MIDI_InsertNote(take.id, False, False, 0, total_qn, 0, 60, 100, True)
+    insert_notes(take, 0.0, total_qn, 60, 100)
 
-    current_qn = 0.0
-    
-    # Pre-calc max range for mapping
-    # Max possible X = AMPL1 + AMPL2 (constructive interference)
-    # Min possible X = -(AMPL1 + AMPL2)
-    max_amp = AMPL1 + AMPL2
-    
-    for i in range(TOTAL_STEPS):
-        rotation = i / DENSITY
-        
-        # Circle 1
-        x1 = math.sin(rotation * FREQ1) * AMPL1
-        y1 = math.cos(rotation * FREQ1) * AMPL1
-        
-        # Circle 2
-        x2 = math.sin(rotation * FREQ2) * AMPL2
-        y2 = math.cos(rotation * FREQ2) * AMPL2
-        
-        # Combine (Vector subtraction as per original script)
-        x = x1 - x2
-        y = y1 - y2
-        
-        # Map X -> Pan (CC 10)
-        pan_val = int(map_value(x, -max_amp, max_amp, 0, 127))
-        
-        # Map Y -> Expression (CC 11)
-        expr_val = int(map_value(y, -max_amp, max_amp, 0, 127))
-        
-        # Insert CCs
-        reapy.RPR.MIDI_InsertCC(take.id, False, False, current_qn, 176, 10, pan_val, True)
-        reapy.RPR.MIDI_InsertCC(take.id, False, False, current_qn, 176, 11, expr_val, True)
-        
-        current_qn += STEP_QN
-
-    reapy.RPR.MIDI_Sort(take.id)
+    # Thin the CC curves, then insert them at once
+    thinned = [(cc_number,) + thin_cc(times_qn, values, TOLERANCE)
+               for cc_number, times_qn, values in lanes]
+    count = insert_ccs(take, thinned, shape=LINEAR if TOLERANCE > 0 else SQUARE)
+    print(f"{count} CC events written ({sum(len(lane[2]) for lane in lanes)} steps).")
     
     # Open Editor
     item.selected = True
@@ -114,4 +125,8 @@ def main():
     print("Done! Complex rotary patterns generated.")
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        # CC events and time at high densities, without REAPER
+        benchmark(get_cc_lanes, tolerance=TOLERANCE)
+    else:
+        main()
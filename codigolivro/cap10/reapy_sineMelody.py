@@ -3,7 +3,8 @@ reapy_sineMelody.py
 
 This program demonstrates how to create a melody from a sine wave.
 It maps the sine function to a melodic (i.e., pitch) contour.
-It creates a MIDI item in REAPER with the generated notes.
+It creates a MIDI item in REAPER with the generated notes, computed as
+arrays and inserted at once (see midi_curves.py).
 
 Ported from sineMelody.py
 """
@@ -11,8 +12,9 @@ Ported from sineMelody.py
 import reapy
 import math
 
-def map_value(value, in_min, in_max, out_min, out_max):
-    return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
+import numpy as np
+
+from midi_curves import to_midi, insert_notes
 
 def main():
     try:
@@ -59,7 +61,7 @@ def main():
 
     # Add item to track
     # add_item(position=0, length=total_sec)
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     
     if not take:
@@ -68,25 +70,17 @@ def main():
 
     print(f"Generating {CYCLE} notes...")
 
-    # Start a transaction for speed
-    # with project.undo_block("Generate Sine Melody"):
-    for i in range(CYCLE):
-        value = math.sin(i / DENSITY) # calculate sine value
-        
-        # Map to pitch C2-C8
-        pitch = int(map_value(value, -1.0, 1.0, C2, C8))
-        
-        start_qn = i * QN_DURATION
-        end_qn = start_qn + QN_DURATION
-        
-        start_sec = start_qn * qn_to_sec
-        end_sec = end_qn * qn_to_sec
-        
-        # Use high-level API which takes seconds
-        take.add_note(start_sec, end_sec, pitch, 100, 0)
-
-    # Sort MIDI (required after bulk inserts) - High level might handle it, but good to be safe if mixing
-    reapy.RPR.MIDI_Sort(take.id)
+    # calculate sine values
+    values = np.sin(np.arange(CYCLE) / DENSITY)
+    
+    # Map to pitch C2-C8
+    pitches = to_midi(values, -1.0, 1.0, C2, C8)
+    
+    starts_qn = np.arange(CYCLE) * QN_DURATION
+    ends_qn = starts_qn + QN_DURATION
+    
+    # Insert all the notes in a single call (sorted at the end)
+    insert_notes(take, starts_qn, ends_qn, pitches, 100)
 
     # Open in MIDI Editor
     cmd_open_midi = 40153 # Item: Open in built-in MIDI editor
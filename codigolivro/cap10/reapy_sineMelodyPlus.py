@@ -8,12 +8,19 @@ It maps the sine function to several musical parameters:
 - Dynamics (Velocity)
 - Panning (CC 10)
 
+The notes and CC events are computed as arrays and inserted at once
+(see midi_curves.py).
+
 Ported from sineMelodyPlus.py
 """
 
 import reapy
 import math
 
+import numpy as np
+
+from midi_curves import map_values, to_midi, remove_unchanged, insert_ccs, insert_notes
+
 # Constants
 TN = 0.125 # 32nd note (approx, usually TN is 32nd, SN is 16th? Or 8th/16th? 
 # Jython Music: TN = Thirty-second note? No, TN usually means Tenth Note? 
@@ -37,9 +44,6 @@ FORTISSIMO = 120
 C2 = 36
 C8 = 108
 
-def map_value(value, in_min, in_max, out_min, out_max):
-    return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
-
 def main():
     try:
         project = reapy.Project()
@@ -58,24 +62,17 @@ def main():
     
     # Calculate Total Length (since duration is variable, we need to pre-calc or just make it big enough)
     # Let's pre-calculate to be precise.
-    total_qn = 0
-    notes_data = [] # Store tuple: (pitch, duration, velocity, pan)
+    values = np.sin(np.arange(CYCLE) / DENSITY)
     
-    for i in range(CYCLE):
-        value = math.sin(i / DENSITY)
-        
-        pitch = int(map_value(value, -1.0, 1.0, C2, C8))
-        duration = map_value(value, -1.0, 1.0, TN_DURATION, SN_DURATION)
-        velocity = int(map_value(value, -1.0, 1.0, PIANISSIMO, FORTISSIMO))
-        panning = int(map_value(value, -1.0, 1.0, PAN_LEFT, PAN_RIGHT))
-        
-        notes_data.append({
-            "pitch": pitch,
-            "dur": duration,
-            "vel": velocity,
-            "pan": panning
-        })
-        total_qn += duration
+    pitches = to_midi(values, -1.0, 1.0, C2, C8)
+    durations = map_values(values, -1.0, 1.0, TN_DURATION, SN_DURATION)
+    velocities = to_midi(values, -1.0, 1.0, PIANISSIMO, FORTISSIMO)
+    pannings = to_midi(values, -1.0, 1.0, PAN_LEFT, PAN_RIGHT)
+    
+    # Each note starts where the previous one ends
+    ends_qn = np.cumsum(durations)
+    starts_qn = ends_qn - durations
+    total_qn = ends_qn[-1]
 
     # Create MIDI Item
     # Convert QN to Seconds (assuming 120 BPM)
@@ -83,7 +80,7 @@ def main():
     qn_to_sec = 60 / bpm
     total_sec = total_qn * qn_to_sec
     
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     
     if not take:
@@ -92,28 +89,14 @@ def main():
 
     print(f"Generating {CYCLE} notes with modulation...")
 
-    current_qn = 0.0
-    
-    # Batch Insert
-    # We use RPR directly for CC and Notes to ensure sync
-    
-    for note in notes_data:
-        start_qn = current_qn
-        end_qn = current_qn + note["dur"]
-        
-        # Insert Note
-        # RPR.MIDI_InsertNote(take, selected, muted, start_qn, end_qn, chan, pitch, vel, noSort)
-        reapy.RPR.MIDI_InsertNote(take.id, False, False, start_qn, end_qn, 0, note["pitch"], note["vel"], True)
-        
-        # Insert CC 10 (Pan)
-        # RPR.MIDI_InsertCC(take, selected, muted, time_qn, msg_type, msg2, msg3, noSort)
-        # msg_type 0xB0 (176) = CC. msg2 = CC#, msg3 = Value
-        reapy.RPR.MIDI_InsertCC(take.id, False, False, start_qn, 176, 10, note["pan"], True)
-        
-        current_qn += note["dur"]
-
-    reapy.RPR.MIDI_Sort(take.id)
+    # Batch Insert, a single call to REAPER for the notes and one for the CCs
+    insert_notes(take, starts_qn, ends_qn, pitches, velocities)
     
+    # CC 10 (Pan) at the start of each note, only when the panning changes
+    pan_times, pan_values = remove_unchanged(starts_qn, pannings)
+    count = insert_ccs(take, [(10, pan_times, pan_values)])
+    print(f"{count} CC events written ({CYCLE} notes).")
+
     # Open Editor
     item.selected = True
     cmd_open_midi = 40153 
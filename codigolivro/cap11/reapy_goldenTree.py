@@ -1,7 +1,8 @@
 """
 reapy_goldenTree.py
 
-Demonstrates how to generate a "Golden Tree" musical structure using recursion.
+Demonstrates how to generate a "Golden Tree" musical structure, a binary tree
+generated level by level.
 The tree branches in time and pitch.
 - Time: Each branch starts after its parent.
 - Pitch: Left/Right branches diverge in pitch.
@@ -12,6 +13,10 @@ Ported from goldenTree.py
 
 import reapy
 import math
+import sys
+import time
+
+import numpy as np
 
 # Constants
 PHI = (math.sqrt(5) - 1) / 2 # approx 0.618
@@ -20,47 +25,90 @@ ROOT_PITCH = 60 # C4
 INITIAL_DURATION_QN = 4.0 # Whole Note
 INTERVAL = 5 # Semitones (Perfect 4th/5th rough interval)
 
-def generate_tree(take, start_qn, duration_qn, pitch, angle, depth):
+def generate_tree(start_qn, duration_qn, pitch, depth):
+    """
+    Returns the arrays of start and end (in quarter notes) and pitches of
+    the notes of the tree, without the coincident notes.
+
+    The tree is generated level by level: all the branches of a level
+    start and last the same, each one branching into a left (pitch down)
+    and a right (pitch up) branch. With a constant interval, many branches
+    reach the same pitch, so only the distinct pitches of each level are
+    kept (depth + 1 at most, instead of 2^depth).
+    """
+    starts, ends, pitches = [], [], []
+    level_pitches = np.array([pitch])
+
+    for level in range(depth):
+        end_qn = start_qn + duration_qn
+
+        # Clamp pitch to valid MIDI range (0-127)
+        valid_pitches = np.unique(np.clip(level_pitches.astype(int), 0, 127))
+        starts.append(np.full(len(valid_pitches), start_qn))
+        ends.append(np.full(len(valid_pitches), end_qn))
+        pitches.append(valid_pitches)
+
+        # Calculate next generation parameters
+        duration_qn = duration_qn * PHI
+        start_qn = end_qn # Branches start where parent ends
+
+        # Angle in visual tree affected x/y. Here we affect pitch.
+        # Left branch: Pitch down
+        # Right branch: Pitch up
+        # Constant interval, more audible as "branching".
+        level_pitches = np.unique(np.concatenate([level_pitches - INTERVAL,
+                                                  level_pitches + INTERVAL]))
+
+    if not starts:
+        return np.zeros(0), np.zeros(0), np.zeros(0, dtype=int)
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(pitches)
+
+def generate_tree_recursive(start_qn, duration_qn, pitch, depth, notes):
     """
-    Recursively adds notes to the MIDI take.
+    Adds the (start, end, pitch) of each branch of the tree to the notes
+    set, recursively (the original algorithm, to check generate_tree).
     """
     if depth == 0:
         return
-
-    # Insert Note for current branch
-    # RPR.MIDI_InsertNote(take, selected, muted, start, end, chan, pitch, vel, noSort)
-    
     end_qn = start_qn + duration_qn
-    vel = 100
-    
-    # Clamp pitch to valid MIDI range (0-127)
-    valid_pitch = max(0, min(127, int(pitch)))
-    
-    reapy.RPR.MIDI_InsertNote(take.id, False, False, start_qn, end_qn, 0, valid_pitch, vel, True)
-    
-    # Calculate next generation parameters
+    notes.add((start_qn, end_qn, max(0, min(127, int(pitch)))))
     new_duration = duration_qn * PHI
-    new_start = end_qn # Branches start where parent ends
-    
-    # Angle in visual tree affected x/y. Here we affect pitch.
-    # We can simulate "angle" as pitch deviation.
-    # Left branch: Pitch down
-    # Right branch: Pitch up
-    # We also reduce the "angle" (interval) slightly or keep it constant?
-    # In original: angle - rotation / angle + rotation.
-    # Let's keep a constant interval for musical clarity or scale it?
-    # Let's scale interval too for fractal-ness? 
-    # Or just constant interval is more audible as "branching".
-    
-    left_pitch = pitch - INTERVAL
-    right_pitch = pitch + INTERVAL
-    
-    # Recurse
-    # Left Branch
-    generate_tree(take, new_start, new_duration, left_pitch, angle, depth - 1)
-    
-    # Right Branch
-    generate_tree(take, new_start, new_duration, right_pitch, angle, depth - 1)
+    generate_tree_recursive(end_qn, new_duration, pitch - INTERVAL, depth - 1, notes)
+    generate_tree_recursive(end_qn, new_duration, pitch + INTERVAL, depth - 1, notes)
+
+@reapy.inside_reaper()
+def insert_notes(take, starts_qn, ends_qn, pitches, vel=100):
+    """
+    Inserts all the notes in the MIDI take in a single call to REAPER,
+    sorting them once at the end.
+    """
+    for start_qn, end_qn, pitch in zip(starts_qn.tolist(), ends_qn.tolist(),
+                                       pitches.tolist()):
+        # RPR.MIDI_InsertNote(take, selected, muted, start, end, chan, pitch, vel, noSort)
+        # start and end in PPQ
+        start_ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, start_qn)
+        end_ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, end_qn)
+        reapy.RPR.MIDI_InsertNote(take.id, False, False, start_ppq, end_ppq,
+                                  0, pitch, vel, True)
+    reapy.RPR.MIDI_Sort(take.id)
+
+def benchmark(depths=(8, 12, 14, 20)):
+    """
+    Prints the number of branches and of distinct notes of the tree, and
+    the time to generate it, at each depth, checking the notes against the
+    recursive algorithm up to depth 14.
+    """
+    for depth in depths:
+        start = time.perf_counter()
+        starts, ends, pitches = generate_tree(0.0, INITIAL_DURATION_QN, ROOT_PITCH, depth)
+        elapsed = time.perf_counter() - start
+        result = f"depth {depth}: {2 ** depth - 1} branches, {len(pitches)} notes in {elapsed * 1000:.2f} ms"
+        if depth <= 14:
+            notes = set()
+            generate_tree_recursive(0.0, INITIAL_DURATION_QN, ROOT_PITCH, depth, notes)
+            identical = notes == set(zip(starts.tolist(), ends.tolist(), pitches.tolist()))
+            result += f", identical to recursive: {identical}"
+        print(result)
 
 def main():
     try:
@@ -87,17 +135,16 @@ def main():
     total_sec = total_qn * qn_to_sec
 
     # Create Item
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     if not take: return
 
     print(f"Generating Golden Tree (Depth {DEPTH})...")
 
-    # Start Recursion
+    # Compute all the notes, then insert them at once
     # visual angle was 90 deg (Up). Pitch is 60.
-    generate_tree(take, 0.0, INITIAL_DURATION_QN, ROOT_PITCH, 90, DEPTH)
-    
-    reapy.RPR.MIDI_Sort(take.id)
+    starts, ends, pitches = generate_tree(0.0, INITIAL_DURATION_QN, ROOT_PITCH, DEPTH)
+    insert_notes(take, starts, ends, pitches)
     
     # Open Editor
     item.selected = True
@@ -108,4 +155,7 @@ def main():
     print("Done! Fractal tree generated.")
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        benchmark()
+    else:
+        main()
@@ -1,7 +1,8 @@
 """
 reapy_sierpinskiTriangle.py
 
-Demonstrates how to generate a Sierpinski Triangle musical structure using recursion.
+Demonstrates how to generate a Sierpinski Triangle musical structure, its
+sub-triangles computed level by level.
 The visual structure is mapped to the piano roll:
 - X-Axis: Time
 - Y-Axis: Pitch
@@ -12,12 +13,17 @@ Ported from sierpinskiTriangle.py
 """
 
 import reapy
+import sys
+import time
+
+import numpy as np
 
 # Constants
 DEPTH = 6
 TOTAL_DURATION_QN = 16.0 # 4 bars of 4/4
 MIN_PITCH = 48 # C3
 MAX_PITCH = 84 # C6 (3 Octaves range)
+PPQ = 960 # Ticks per quarter note, the coincident notes are found in ticks
 
 # We define the triangle "space" as 0.0 to 1.0
 # Then we map to Time/Pitch
@@ -25,59 +31,115 @@ MAX_PITCH = 84 # C6 (3 Octaves range)
 def map_value(value, in_min, in_max, out_min, out_max):
     return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
-def insert_note_at_point(take, x_norm, y_norm, depth):
+def insert_note_at_point(notes, x_norm, y_norm):
+    """
+    Adds the (start tick, pitch) of the note at the point to the notes set
+    (the original algorithm, to check sierpinski).
+    """
     # Map X (0..1) to Time QN
     time_qn = map_value(x_norm, 0.0, 1.0, 0.0, TOTAL_DURATION_QN)
     
     # Map Y (0..1) to Pitch
     # Y=1.0 is TOP (High Pitch), Y=0.0 is BOTTOM (Low Pitch)
-    # Actually in Py GUI, Y=0 is top. We inverted logic in recursion?
-    # Let's assume input y_norm is consistent such that 1.0 = High Pitch Concept.
     pitch = int(map_value(y_norm, 0.0, 1.0, MIN_PITCH, MAX_PITCH))
     pitch = max(0, min(127, pitch))
     
-    # Duration based on depth (Depper = smaller triangle = shorter note)
-    # Base duration
-    dur = 0.5 / depth # arbitrary scaling
-    
-    reapy.RPR.MIDI_InsertNote(take.id, False, False, time_qn, time_qn + dur, 0, pitch, 100, True)
+    notes.add((round(time_qn * PPQ), pitch))
 
-def sierpinski(take, x, y, w, h, depth):
+def sierpinski_recursive(notes, x, y, w, h, depth):
     """
-    x, y: Coordinates of the TOP vertex of the current sub-triangle.
+    Adds the notes at the vertices of the sub-triangles to the notes set,
+    recursively (the original algorithm, to check sierpinski).
+    """
+    if depth == 1:
+        # Leaf Node: Top, Left Bottom and Right Bottom vertices
+        insert_note_at_point(notes, x, y)
+        insert_note_at_point(notes, x - w/2, y - h)
+        insert_note_at_point(notes, x + w/2, y - h)
+    else:
+        sierpinski_recursive(notes, x, y, w/2, h/2, depth - 1)
+        sierpinski_recursive(notes, x - w/4, y - h/2, w/2, h/2, depth - 1)
+        sierpinski_recursive(notes, x + w/4, y - h/2, w/2, h/2, depth - 1)
+
+def sierpinski(x, y, w, h, depth):
+    """
+    Returns the arrays of start ticks (at PPQ) and pitches of the notes at
+    the vertices of the leaf sub-triangles, sorted, without the coincident
+    notes (the vertices shared by neighboring sub-triangles, or mapped to
+    the same tick and pitch).
+
+    x, y: Coordinates of the TOP vertex of the triangle.
     w: Width of base
     h: Height of triangle
     
     Coordinate System:
     y = 1.0 is TOP (Highest Pitch)
     y = 0.0 is BOTTOM (Lowest Pitch)
+
+    The sub-triangles are computed level by level, as arrays of their top
+    vertices (all the sub-triangles of a level have the same size).
     """
-    
-    if depth == 1:
-        # Leaf Node: Draw the triangle by placing notes at vertices
-        # Top Vertex
-        insert_note_at_point(take, x, y, DEPTH)
-        # Left Bottom
-        insert_note_at_point(take, x - w/2, y - h, DEPTH)
-        # Right Bottom
-        insert_note_at_point(take, x + w/2, y - h, DEPTH)
-    else:
+    xs = np.array([x])
+    ys = np.array([y])
+    for level in range(depth - 1):
         # Subdivide
-        # Top Sub-triangle
-        # Top vertex is same: x, y
+        # Top Sub-triangle: top vertex is same: x, y
+        # Left Sub-triangle: top vertex at the middle of the left edge
+        # (x - w/4, y - h/2)
+        # Right Sub-triangle: top vertex at the middle of the right edge
+        # (x + w/4, y - h/2)
         # New Width = w/2, New Height = h/2
-        sierpinski(take, x, y, w/2, h/2, depth - 1)
-        
-        # Left Sub-triangle
-        # Top vertex is at middle of left edge of current triangle
-        # Left edge goes from (x, y) to (x - w/2, y - h)
-        # Midpoint is (x - w/4, y - h/2)
-        sierpinski(take, x - w/4, y - h/2, w/2, h/2, depth - 1)
-        
-        # Right Sub-triangle
-        # Top vertex is at middle of right edge
-        # Midpoint is (x + w/4, y - h/2)
-        sierpinski(take, x + w/4, y - h/2, w/2, h/2, depth - 1)
+        xs = np.concatenate([xs, xs - w/4, xs + w/4])
+        ys = np.concatenate([ys, ys - h/2, ys - h/2])
+        w, h = w/2, h/2
+
+    # Leaf sub-triangles: notes at the Top, Left Bottom and Right Bottom vertices
+    vertices_x = np.concatenate([xs, xs - w/2, xs + w/2])
+    vertices_y = np.concatenate([ys, ys - h, ys - h])
+
+    # Map X (0..1) to Time (ticks) and Y (0..1) to Pitch
+    time_qn = map_value(vertices_x, 0.0, 1.0, 0.0, TOTAL_DURATION_QN)
+    ticks = np.round(time_qn * PPQ).astype(np.int64)
+    pitches = map_value(vertices_y, 0.0, 1.0, MIN_PITCH, MAX_PITCH).astype(int)
+    pitches = np.clip(pitches, 0, 127)
+
+    # Remove the coincident notes, a single key per (tick, pitch)
+    keys = np.unique(ticks * 128 + pitches)
+    return keys // 128, keys % 128
+
+@reapy.inside_reaper()
+def insert_notes(take, ticks, pitches, duration_qn, vel=100):
+    """
+    Inserts all the notes in the MIDI take in a single call to REAPER,
+    sorting them once at the end.
+    """
+    for tick, pitch in zip(ticks.tolist(), pitches.tolist()):
+        # RPR.MIDI_InsertNote(take, selected, muted, start, end, chan, pitch, vel, noSort)
+        # start and end in PPQ
+        time_qn = tick / PPQ
+        start_ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, time_qn)
+        end_ppq = reapy.RPR.MIDI_GetPPQPosFromProjQN(take.id, time_qn + duration_qn)
+        reapy.RPR.MIDI_InsertNote(take.id, False, False, start_ppq, end_ppq,
+                                  0, pitch, vel, True)
+    reapy.RPR.MIDI_Sort(take.id)
+
+def benchmark(depths=(6, 10, 12, 14)):
+    """
+    Prints the number of vertices and of distinct notes of the triangle,
+    and the time to generate it, at each depth, checking the notes against
+    the recursive algorithm up to depth 10.
+    """
+    for depth in depths:
+        start = time.perf_counter()
+        ticks, pitches = sierpinski(0.5, 0.9, 0.8, 0.8, depth)
+        elapsed = time.perf_counter() - start
+        result = f"depth {depth}: {3 ** depth} vertices, {len(ticks)} notes in {elapsed:.3f} s"
+        if depth <= 10:
+            notes = set()
+            sierpinski_recursive(notes, 0.5, 0.9, 0.8, 0.8, depth)
+            identical = notes == set(zip(ticks.tolist(), pitches.tolist()))
+            result += f", identical to recursive: {identical}"
+        print(result)
 
 def main():
     try:
@@ -97,7 +159,7 @@ def main():
     total_sec = TOTAL_DURATION_QN * qn_to_sec
 
     # Create Item
-    item = track.add_item(0, total_sec)
+    item = track.add_midi_item(0, end=total_sec)
     take = item.active_take
     if not take: return
 
@@ -110,9 +172,12 @@ def main():
     # Let's say Width = 0.8
     # Height = 0.8
     
-    sierpinski(take, 0.5, 0.9, 0.8, 0.8, DEPTH)
+    # Compute all the notes, then insert them at once
+    ticks, pitches = sierpinski(0.5, 0.9, 0.8, 0.8, DEPTH)
     
-    reapy.RPR.MIDI_Sort(take.id)
+    # Duration based on depth (Deeper = smaller triangle = shorter note)
+    dur = 0.5 / DEPTH # arbitrary scaling
+    insert_notes(take, ticks, pitches, dur)
     
     # Open Editor
     item.selected = True
@@ -122,4 +187,7 @@ def main():
     print("Done! Musical fractal generated.")
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        benchmark()
+    else:
+        main()
@@ -3,13 +3,16 @@ reapy_zipfMetrics.py
 
 Demonstrates how to calculate Zipf metrics from MIDI files (or selected items)
 for comparative analysis. It calculates Zipf slopes and R^2 values
-for pitch distribution.
+for the distribution of pitches, durations, melodic intervals and
+pitch-duration pairs.
 
 Top-down design:
 1. main() -> Orchestrates analysis
-2. analyze_item() -> Counts pitches in a REAPER item
-3. count_pitches() -> Returns histogram
-4. calculate_zipf() -> Performs regression
+2. analyze_item() -> Analyzes the notes of a REAPER item
+3. get_note_data() -> Reads all the notes of a take in a single call
+4. ZipfMetrics -> Histograms of each dimension, updated as notes are added
+5. calculate_zipf() -> Performs regression
+(ZipfMetrics and calculate_zipf are in zipf_metrics.py, without reapy)
 
 Ported from zipfMetrics.py
 """
@@ -17,102 +20,44 @@ Ported from zipfMetrics.py
 import reapy
 import math
 import os
+import sys
+import time
 
-# --- Mathematical Functions (Pure Python to avoid external dependencies) ---
+import numpy as np
 
-def mean(values):
-    return sum(values) / len(values)
+from zipf_metrics import ZipfMetrics, DIMENSIONS
 
-def linear_regression(x, y):
+# --- REAPER Interaction ---
+
+@reapy.inside_reaper()
+def get_note_data(take, first=0):
     """
-    Calculates the least squares regression line y = mx + b.
-    Returns (slope, r_squared, y_intercept).
+    Returns the lists of start and end positions (in ticks) and pitches of
+    the notes of the take, from the note index first, in a single call to
+    REAPER (instead of a call per attribute of each note).
     """
-    n = len(x)
-    if n != len(y) or n == 0:
-        return 0, 0, 0
-    
-    sum_x = sum(x)
-    sum_y = sum(y)
-    sum_xy = sum(xi * yi for xi, yi in zip(x, y))
-    sum_x2 = sum(xi ** 2 for xi in x)
-    sum_y2 = sum(yi ** 2 for yi in y)
-    
-    # Calculate Slope (m)
-    # m = (N * sum(xy) - sum(x) * sum(y)) / (N * sum(x^2) - (sum(x))^2)
-    numerator = (n * sum_xy) - (sum_x * sum_y)
-    denominator = (n * sum_x2) - (sum_x ** 2)
-    
-    if denominator == 0:
-        slope = 0
-    else:
-        slope = numerator / denominator
-        
-    # Calculate Intercept (b)
-    # b = (sum(y) - m * sum(x)) / N
-    intercept = (sum_y - slope * sum_x) / n
-    
-    # Calculate R-squared
-    # r = (N * sum(xy) - sum(x)sum(y)) / sqrt( [N*sum(x^2)-(sum(x))^2] * [N*sum(y^2)-(sum(y))^2] )
-    numerator_r = (n * sum_xy) - (sum_x * sum_y)
-    denom_r_x = (n * sum_x2) - (sum_x ** 2)
-    denom_r_y = (n * sum_y2) - (sum_y ** 2)
-    
-    if denom_r_x * denom_r_y == 0:
-        r_squared = 0
-    else:
-        r = numerator_r / math.sqrt(denom_r_x * denom_r_y)
-        r_squared = r ** 2
-        
-    return slope, r_squared, intercept
-
-# --- Zipf Analysis ---
-
-def calculate_zipf(histogram):
+    starts, ends, pitches = [], [], []
+    for index in range(first, take.n_notes):
+        note = reapy.RPR.MIDI_GetNote(take.id, index, 0, 0, 0, 0, 0, 0, 0)
+        starts.append(note[5])
+        ends.append(note[6])
+        pitches.append(note[8])
+    return starts, ends, pitches
+
+def update_from_take(metrics, take):
     """
-    Calculates Zipf slope and R^2 from a histogram of pitch counts.
-    X = Log(Rank)
-    Y = Log(Frequency)
+    Adds the notes of the take not added yet to the metrics (appended since
+    the last update), returns the number of notes added.
     """
-    # Sort counts descending
-    counts = sorted(histogram.values(), reverse=True)
-    
-    if not counts:
-        return 0, 0, 0
-    
-    # Calculate Log(Rank) and Log(Frequency)
-    log_ranks = []
-    log_freqs = []
-    
-    for rank, count in enumerate(counts):
-        # Rank is 1-based (1, 2, 3...)
-        # Log(Rank)
-        log_ranks.append(math.log(rank + 1))
-        # Log(Frequency)
-        log_freqs.append(math.log(count))
-        
-    return linear_regression(log_ranks, log_freqs)
-
-# --- REAPER Interaction ---
+    starts, ends, pitches = get_note_data(take, first=metrics.num_notes)
+    metrics.add_notes(pitches, np.subtract(ends, starts))
+    return len(pitches)
 
 def count_pitches_in_take(take):
     """Returns a dictionary of {pitch: count} for a given MIDI take."""
-    histogram = {}
-    
-    # Iterate all notes
-    # reapy notes are iterators
-    notes = take.midi_events
-    # This might be raw events. Let's use the property 'notes' if available or iterate enumerator
-    # reapy Take.notes is simpler
-    
-    # We'll use RPR for raw speed and reliability on events if reapy abstraction is slow
-    # But reapy logic: take.notes
-    
-    for note in take.notes:
-        pitch = note.pitch
-        histogram[pitch] = histogram.get(pitch, 0) + 1
-            
-    return histogram
+    pitches = get_note_data(take)[2]
+    counts = np.bincount(np.asarray(pitches, dtype=np.int64), minlength=128)
+    return {pitch: int(counts[pitch]) for pitch in np.flatnonzero(counts).tolist()}
 
 def analyze_item(item, source_name="Unknown"):
     take = item.active_take
@@ -120,16 +65,66 @@ def analyze_item(item, source_name="Unknown"):
         print(f"Skipping {source_name}: Not a MIDI item.")
         return
 
-    histogram = count_pitches_in_take(take)
-    slope, r2, yint = calculate_zipf(histogram)
+    metrics = ZipfMetrics()
+    update_from_take(metrics, take)
     
     print(f"Analysis for: {source_name}")
-    print(f"  Unique Pitches: {len(histogram)}")
-    print(f"  Total Notes:    {sum(histogram.values())}")
-    print(f"  Zipf Slope:     {slope:.4f}")
-    print(f"  R^2:            {r2:.4f}")
+    print(f"  Total Notes:    {metrics.num_notes}")
+    print(f"  {'Dimension':<16}{'Unique':>8}{'Zipf Slope':>12}{'R^2':>8}")
+    for dimension, (slope, r2, yint, unique) in metrics.metrics().items():
+        print(f"  {dimension:<16}{unique:>8}{slope:>12.4f}{r2:>8.4f}")
     print("-" * 40)
 
+def benchmark(num_notes=50000, batch_size=1000):
+    """
+    Analyzes a synthetic item of num_notes notes without REAPER: the pitch
+    histogram and regression in pure Python (as before), all the dimensions
+    with ZipfMetrics, and ZipfMetrics updated as batches of notes are
+    appended, and prints the times.
+    """
+    rng = np.random.default_rng(0)
+    # Zipf distributed pitches around middle C, a few durations (in ticks)
+    pitches = np.clip(60 + rng.zipf(1.5, num_notes) * rng.choice([-1, 1], num_notes), 0, 127)
+    durations = rng.choice([240, 480, 960, 1920], num_notes, p=[0.4, 0.3, 0.2, 0.1])
+    pitch_list = pitches.tolist()
+
+    start = time.perf_counter()
+    histogram = {}
+    for pitch in pitch_list:
+        histogram[pitch] = histogram.get(pitch, 0) + 1
+    counts = sorted(histogram.values(), reverse=True)
+    x = [math.log(rank + 1) for rank in range(len(counts))]
+    y = [math.log(count) for count in counts]
+    n = len(x)
+    sum_xy = sum(xi * yi for xi, yi in zip(x, y))
+    sum_x2 = sum(xi ** 2 for xi in x)
+    expected_slope = (n * sum_xy - sum(x) * sum(y)) / (n * sum_x2 - sum(x) ** 2)
+    python_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics = ZipfMetrics()
+    metrics.add_notes(pitches, durations)
+    results = metrics.metrics()
+    engine_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    incremental = ZipfMetrics()
+    for first in range(0, num_notes, batch_size):
+        incremental.add_notes(pitches[first:first + batch_size],
+                              durations[first:first + batch_size])
+        incremental_results = incremental.metrics()
+    incremental_time = time.perf_counter() - start
+
+    identical = (math.isclose(results["pitch"][0], expected_slope) and
+                 incremental_results == results)
+    print(f"Analyzed {num_notes} notes, identical: {identical}")
+    print(f"  pitch only, pure Python:       {python_time * 1000:.1f} ms")
+    print(f"  {len(DIMENSIONS)} dimensions, ZipfMetrics:     {engine_time * 1000:.1f} ms")
+    print(f"  {num_notes // batch_size} incremental updates of {batch_size}: "
+          f"{incremental_time * 1000:.1f} ms")
+    for dimension, (slope, r2, yint, unique) in results.items():
+        print(f"  {dimension:<16}{unique:>8}{slope:>12.4f}{r2:>8.4f}")
+
 def main():
     try:
         project = reapy.Project()
@@ -140,6 +135,8 @@ def main():
 
     # 1. Check for filenames provided in script (Original Use Case)
     # We don't have these files, so we skip unless user provides them.
+    # To analyze whole MIDI corpora without REAPER, use the batch mode:
+    #     python reapy_zipfMetrics.py --corpus CORPUS_DIR (see zipf_corpus.py)
     midi_files = [
         # "sonifyBiosignals.mid", 
         # "ArvoPart.CantusInMemoriam.mid",
@@ -170,4 +167,12 @@ def main():
         print("Please select a MIDI item in REAPER to analyze.")
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        # Synthetic 50k-note item, without REAPER
+        benchmark()
+    elif "--corpus" in sys.argv:
+        # Batch analysis of the MIDI files of a directory, without REAPER
+        from zipf_corpus import analyze_corpus
+        analyze_corpus(sys.argv[sys.argv.index("--corpus") + 1])
+    else:
+        main()
@@ -0,0 +1,264 @@
+"""
+zipf_corpus.py
+
+Batch Zipf analysis of MIDI corpora, without REAPER, to compare
+generators (or composers) over thousands of files.
+
+The MIDI files are parsed directly with mido, and the histograms of all
+the Zipf dimensions of each file (see ZipfMetrics) are computed in worker
+processes. The histograms are cached in a JSON Lines file, keyed by the
+file path, size and modification time, so an interrupted or repeated run
+only analyzes the new or changed files. The slopes and R^2 of each file
+are written to a single CSV table.
+
+Usage:
+    python zipf_corpus.py CORPUS_DIR [--output results.csv]
+                          [--cache zipf_cache.jsonl] [--workers N]
+    python zipf_corpus.py --benchmark [NUM_FILES]
+"""
+
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import mido
+import numpy as np
+
+from zipf_metrics import ZipfMetrics, DIMENSIONS, calculate_zipf
+
+# Durations are converted to ticks at REAPER's default resolution, so
+# files with different resolutions are comparable
+PPQ = 960
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+
+def find_midi_files(directory):
+    """Returns the sorted list of the MIDI files under the directory."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(MIDI_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+def read_midi_notes(path):
+    """
+    Returns the arrays of start and end positions (in ticks at PPQ) and
+    pitches of the notes of the MIDI file, all tracks merged, ordered by
+    start. Each note off ends the earliest open note of its channel and
+    pitch, the notes still open end at the end of their track.
+    """
+    midi = mido.MidiFile(path, clip=True)
+    starts, ends, pitches = [], [], []
+    # Each track separately (faster than mido.merge_tracks), the notes
+    # are sorted by start at the end
+    for track in midi.tracks:
+        open_notes = {} # (channel, pitch) -> deque of note indices
+        tick = 0
+        for message in track:
+            tick += message.time
+            message_type = message.type
+            if message_type == "note_on" and message.velocity > 0:
+                key = (message.channel, message.note)
+                indices = open_notes.get(key)
+                if indices is None:
+                    indices = open_notes[key] = deque()
+                indices.append(len(starts))
+                starts.append(tick)
+                ends.append(-1)
+                pitches.append(message.note)
+            elif message_type == "note_on" or message_type == "note_off":
+                indices = open_notes.get((message.channel, message.note))
+                if indices:
+                    ends[indices.popleft()] = tick
+        for indices in open_notes.values():
+            for index in indices:
+                ends[index] = tick
+
+    order = np.argsort(starts, kind="stable")
+    scale = PPQ / midi.ticks_per_beat
+    return (np.round(np.array(starts, dtype=float)[order] * scale).astype(np.int64),
+            np.round(np.array(ends, dtype=float)[order] * scale).astype(np.int64),
+            np.array(pitches, dtype=np.int64)[order])
+
+def get_histograms(metrics):
+    """Returns the {dimension: {value: count}} of the metrics."""
+    pitches = np.flatnonzero(metrics.pitch_counts)
+    intervals = np.flatnonzero(metrics.interval_counts)
+    return {
+        "pitch": dict(zip(pitches.tolist(),
+                          metrics.pitch_counts[pitches].tolist())),
+        "duration": dict(metrics.duration_counts),
+        "interval": dict(zip((intervals - 127).tolist(),
+                             metrics.interval_counts[intervals].tolist())),
+        "pitch_duration": dict(metrics.pitch_duration_counts),
+    }
+
+def analyze_file(path):
+    """
+    Returns (path, number of notes, histograms, error) for the MIDI file,
+    run in the worker processes. An unreadable file returns its error
+    instead of stopping the batch.
+    """
+    try:
+        starts, ends, pitches = read_midi_notes(path)
+        metrics = ZipfMetrics()
+        metrics.add_notes(pitches, ends - starts)
+        return path, metrics.num_notes, get_histograms(metrics), None
+    except Exception as e:
+        return path, 0, None, f"{type(e).__name__}: {e}"
+
+def file_key(path):
+    """The cache key of the file, changing when the file changes."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+def load_cache(cache_path):
+    """Returns the {key: (notes, histograms, error)} of the cache file."""
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # Line cut by an interrupted run
+                cache[entry["key"]] = (entry["notes"], entry["histograms"],
+                                       entry["error"])
+    return cache
+
+def get_row(path, notes, histograms, error):
+    """Returns the results table row of a file."""
+    row = {"file": path, "notes": notes}
+    for dimension in DIMENSIONS:
+        if histograms:
+            slope, r2, yint = calculate_zipf(histograms[dimension])
+            row[f"{dimension}_slope"] = round(slope, 6)
+            row[f"{dimension}_r2"] = round(r2, 6)
+            row[f"{dimension}_unique"] = len(histograms[dimension])
+        else:
+            row[f"{dimension}_slope"] = row[f"{dimension}_r2"] = ""
+            row[f"{dimension}_unique"] = ""
+    row["error"] = error or ""
+    return row
+
+def analyze_corpus(directory, output="zipf_results.csv",
+                   cache_path="zipf_cache.jsonl", workers=None,
+                   chunksize=64, progress_interval=1.0):
+    """
+    Analyzes all the MIDI files under the directory with workers processes
+    (None for one per CPU), writes the results table to output (CSV), and
+    returns the number of files analyzed and read from the cache.
+    """
+    paths = find_midi_files(directory)
+    cache = load_cache(cache_path)
+    keys = {path: file_key(path) for path in paths}
+    pending = [path for path in paths if keys[path] not in cache]
+    print(f"{len(paths)} MIDI files, {len(paths) - len(pending)} cached, "
+          f"{len(pending)} to analyze")
+
+    start = last_report = time.perf_counter()
+    if pending:
+        cache_file = open(cache_path, "a") if cache_path else None
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for done, (path, notes, histograms, error) in enumerate(
+                    executor.map(analyze_file, pending, chunksize=chunksize), 1):
+                key = keys[path]
+                cache[key] = (notes, histograms, error)
+                if cache_file:
+                    cache_file.write(json.dumps({"key": key, "notes": notes,
+                                                 "histograms": histograms,
+                                                 "error": error}) + "\n")
+                now = time.perf_counter()
+                if now - last_report >= progress_interval or done == len(pending):
+                    last_report = now
+                    rate = done / (now - start)
+                    eta = (len(pending) - done) / rate
+                    print(f"\r  {done}/{len(pending)} files, "
+                          f"{rate:.0f} files/sec, ETA {eta:.0f} s  ",
+                          end="", flush=True)
+        print()
+        if cache_file:
+            cache_file.close()
+
+    errors = 0
+    with open(output, "w", newline="") as f:
+        writer = None
+        for path in paths:
+            notes, histograms, error = cache[keys[path]]
+            # JSON keys are strings, only the counts are needed
+            row = get_row(path, notes, histograms, error)
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            errors += bool(error)
+    print(f"Results of {len(paths)} files ({errors} unreadable) "
+          f"written to {output} in {time.perf_counter() - start:.1f} s")
+    return len(pending), len(paths) - len(pending)
+
+def write_random_midi(path, rng, num_notes=500):
+    """Writes a random melody of num_notes notes to a MIDI file."""
+    midi = mido.MidiFile(ticks_per_beat=480)
+    track = mido.MidiTrack()
+    midi.tracks.append(track)
+    pitches = np.clip(60 + np.cumsum(rng.integers(-4, 5, num_notes)), 0, 127)
+    durations = rng.choice([120, 240, 480, 960], num_notes)
+    for pitch, duration in zip(pitches.tolist(), durations.tolist()):
+        track.append(mido.Message("note_on", note=pitch, velocity=100, time=0))
+        track.append(mido.Message("note_off", note=pitch, velocity=0,
+                                  time=duration))
+    midi.save(path)
+
+def benchmark(num_files=2000, workers=None):
+    """
+    Analyzes a synthetic corpus of num_files random MIDI files, then again
+    from the cache, and prints the times.
+    """
+    directory = tempfile.mkdtemp(prefix="zipf_corpus_")
+    try:
+        print(f"Generating {num_files} MIDI files: {directory}")
+        rng = np.random.default_rng(0)
+        corpus = os.path.join(directory, "corpus")
+        for i in range(num_files):
+            subdirectory = os.path.join(corpus, f"{i // 1000:03d}")
+            os.makedirs(subdirectory, exist_ok=True)
+            write_random_midi(os.path.join(subdirectory, f"{i:06d}.mid"), rng)
+
+        output = os.path.join(directory, "results.csv")
+        cache_path = os.path.join(directory, "cache.jsonl")
+        for run in ("first run", "cached run"):
+            start = time.perf_counter()
+            analyze_corpus(corpus, output, cache_path, workers)
+            elapsed = time.perf_counter() - start
+            print(f"{run}: {num_files} files in {elapsed:.2f} s "
+                  f"({num_files / elapsed:.0f} files/sec, "
+                  f"{workers or os.cpu_count()} workers)")
+    finally:
+        shutil.rmtree(directory)
+
+def parse_option(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+if __name__ == "__main__":
+    workers = parse_option("--workers", None)
+    workers = int(workers) if workers else None
+    if "--benchmark" in sys.argv:
+        arguments = sys.argv[sys.argv.index("--benchmark") + 1:]
+        num_files = int(arguments[0]) if arguments and arguments[0].isdigit() else 2000
+        benchmark(num_files, workers)
+    elif len(sys.argv) > 1:
+        analyze_corpus(sys.argv[1],
+                       parse_option("--output", "zipf_results.csv"),
+                       parse_option("--cache", "zipf_cache.jsonl"),
+                       workers)
+    else:
+        print(__doc__)
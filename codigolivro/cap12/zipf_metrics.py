@@ -0,0 +1,160 @@
+"""
+zipf_metrics.py
+
+The Zipf metrics of a piece, without REAPER: the histograms of the notes
+in each Zipf dimension (pitch, duration, melodic interval and
+pitch-duration pair), and the Zipf slope and R^2 of each histogram.
+
+Shared by reapy_zipfMetrics.py (items in REAPER) and zipf_corpus.py
+(MIDI corpora, in worker processes that don't import reapy).
+"""
+
+import math
+
+import numpy as np
+
+# --- Mathematical Functions ---
+
+def mean(values):
+    return sum(values) / len(values)
+
+def linear_regression(x, y):
+    """
+    Calculates the least squares regression line y = mx + b.
+    Returns (slope, r_squared, y_intercept).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n != len(y) or n == 0:
+        return 0, 0, 0
+    
+    sum_x = x.sum()
+    sum_y = y.sum()
+    sum_xy = np.dot(x, y)
+    sum_x2 = np.dot(x, x)
+    sum_y2 = np.dot(y, y)
+    
+    # Calculate Slope (m)
+    # m = (N * sum(xy) - sum(x) * sum(y)) / (N * sum(x^2) - (sum(x))^2)
+    numerator = (n * sum_xy) - (sum_x * sum_y)
+    denominator = (n * sum_x2) - (sum_x ** 2)
+    
+    if denominator == 0:
+        slope = 0
+    else:
+        slope = numerator / denominator
+        
+    # Calculate Intercept (b)
+    # b = (sum(y) - m * sum(x)) / N
+    intercept = (sum_y - slope * sum_x) / n
+    
+    # Calculate R-squared
+    # r = (N * sum(xy) - sum(x)sum(y)) / sqrt( [N*sum(x^2)-(sum(x))^2] * [N*sum(y^2)-(sum(y))^2] )
+    numerator_r = (n * sum_xy) - (sum_x * sum_y)
+    denom_r_x = (n * sum_x2) - (sum_x ** 2)
+    denom_r_y = (n * sum_y2) - (sum_y ** 2)
+    
+    if denom_r_x * denom_r_y == 0:
+        r_squared = 0
+    else:
+        r = numerator_r / math.sqrt(denom_r_x * denom_r_y)
+        r_squared = r ** 2
+        
+    return float(slope), float(r_squared), float(intercept)
+
+# --- Zipf Analysis ---
+
+def calculate_zipf(histogram):
+    """
+    Calculates Zipf slope and R^2 from a histogram of counts, a dictionary
+    {value: count} or an array of counts (the zero counts are ignored).
+    X = Log(Rank)
+    Y = Log(Frequency)
+    """
+    if isinstance(histogram, dict):
+        histogram = list(histogram.values())
+    counts = np.asarray(histogram)
+    
+    # Sort counts descending
+    counts = -np.sort(-counts[counts > 0])
+    
+    if len(counts) == 0:
+        return 0, 0, 0
+    
+    # Log(Rank), rank is 1-based (1, 2, 3...), and Log(Frequency)
+    log_ranks = np.log(np.arange(1, len(counts) + 1))
+    log_freqs = np.log(counts)
+        
+    return linear_regression(log_ranks, log_freqs)
+
+# The Zipf dimensions measured by ZipfMetrics
+DIMENSIONS = ("pitch", "duration", "interval", "pitch_duration")
+
+class ZipfMetrics:
+    """
+    The histograms of the notes of a piece in each Zipf dimension, updated
+    incrementally as notes are added.
+
+    Pitches (0-127) and melodic intervals (-127 to 127, between consecutive
+    notes) are counted with np.bincount in fixed size arrays, durations (in
+    ticks) and pitch-duration pairs, unbounded, in dictionaries.
+    """
+
+    def __init__(self):
+        self.pitch_counts = np.zeros(128, dtype=np.int64)
+        self.interval_counts = np.zeros(255, dtype=np.int64)
+        self.duration_counts = {}
+        self.pitch_duration_counts = {}
+        self.num_notes = 0
+        self.last_pitch = None
+
+    def add_notes(self, pitches, durations):
+        """Adds the notes (arrays of pitches and durations), in order."""
+        pitches = np.asarray(pitches, dtype=np.int64)
+        durations = np.asarray(durations, dtype=np.int64)
+        if len(pitches) == 0:
+            return
+
+        self.pitch_counts += np.bincount(pitches, minlength=128)
+
+        # The first interval is from the last note added before
+        if self.last_pitch is not None:
+            pitches_from = np.concatenate([[self.last_pitch], pitches])
+        else:
+            pitches_from = pitches
+        intervals = np.diff(pitches_from)
+        self.interval_counts += np.bincount(intervals + 127, minlength=255)
+
+        add_counts(self.duration_counts, durations)
+        add_counts(self.pitch_duration_counts, durations * 128 + pitches)
+
+        self.num_notes += len(pitches)
+        self.last_pitch = int(pitches[-1])
+
+    def histograms(self):
+        """Returns the {dimension: counts array} of each dimension."""
+        return {
+            "pitch": self.pitch_counts,
+            "duration": np.fromiter(self.duration_counts.values(), np.int64),
+            "interval": self.interval_counts,
+            "pitch_duration": np.fromiter(self.pitch_duration_counts.values(),
+                                          np.int64),
+        }
+
+    def metrics(self):
+        """
+        Returns the {dimension: (slope, r_squared, y_intercept, unique)}
+        of each dimension, unique being the number of distinct values.
+        """
+        metrics = {}
+        for dimension, counts in self.histograms().items():
+            unique = int(np.count_nonzero(counts))
+            metrics[dimension] = calculate_zipf(counts) + (unique,)
+        return metrics
+
+def add_counts(histogram, values):
+    """Adds the counts of the values (an array) to the histogram dictionary."""
+    values, counts = np.unique(values, return_counts=True)
+    for value, count in zip(values.tolist(), counts.tolist()):
+        histogram[value] = histogram.get(value, 0) + count
@@ -0,0 +1,213 @@
+#
+# This program is a vectorized version of the boids simulation in
+# boids_reaper.py, for thousands of musical voices.
+#
+# Instead of one Boid object per boid, the flock keeps the coordinates
+# and velocities of all the boids in NumPy arrays (as complex numbers,
+# like the Boid class), and the rules of separation, alignment and
+# cohesion are computed for all the boids at once at each frame:
+# from all the pairs of boids on a small flock, and from the pairs of
+# neighbors found with a KD-tree on a large flock.
+#
+# Run this script to check that both engines produce the same notes
+# for the same seed, and to compare their frames per second.
+#
+
+import sys
+import time
+from random import seed
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from boids_reaper import (universeWidth, universeHeight, minSeparation,
+                          flockThreshold, separationFactor, alignmentFactor,
+                          cohesionFactor, frictionFactor, boidNote,
+                          createBoids, generateNotes, simulateFrame,
+                          SpatialGrid)
+
+
+### Define Flock class ###
+class Flock:
+    """
+    A flock of boids stored as arrays, following the same rules as the
+    Boid class, all the boids sensing before any of them moves.
+    """
+
+    def __init__(self, coordinates, velocities, pairwiseLimit=64):
+        """Initialize the flock from the coordinates and velocities of
+           the boids (complex arrays). Up to pairwiseLimit boids, all the
+           pairs are compared, above the neighbors are found with a
+           KD-tree.
+        """
+
+        self.coordinates = np.array(coordinates, dtype=complex)
+        self.velocities = np.array(velocities, dtype=complex)
+        self.pairwiseLimit = pairwiseLimit
+
+    @classmethod
+    def fromBoids(cls, boids, pairwiseLimit=64):
+        """Create a flock with the coordinates and velocities of the
+           given Boid objects.
+        """
+
+        return cls([boid.coordinates for boid in boids],
+                   [boid.velocity for boid in boids],
+                   pairwiseLimit)
+
+    def offsets(self, i, j):
+        """Return the vectors from boids i to boids j, taking the
+           shortest way around the time axis (like Boid.offset).
+        """
+
+        offsets = self.coordinates[j] - self.coordinates[i]
+        xOffsets = (offsets.real + universeWidth / 2) % universeWidth - \
+                   universeWidth / 2
+
+        return xOffsets + 1j * offsets.imag
+
+    def neighborPairs(self, radius):
+        """Return the (i, j) arrays of all the ordered pairs of distinct
+           boids closer than radius.
+        """
+
+        n = len(self.coordinates)
+        if n <= self.pairwiseLimit:
+            # All the pairs, except each boid with itself
+            i, j = np.nonzero(~np.eye(n, dtype=bool))
+        else:
+            # The y box is large enough for the tree never to wrap
+            # around on the pitch axis. x % universeWidth rounds to
+            # universeWidth for tiny negative x, outside of the box.
+            x = self.coordinates.real % universeWidth
+            x = np.where(x >= universeWidth, 0.0, x)
+            points = np.column_stack([x, self.coordinates.imag])
+            tree = cKDTree(points,
+                           boxsize=[universeWidth,
+                                    universeHeight + radius + 1])
+            pairs = tree.query_pairs(radius, output_type='ndarray')
+            i = np.concatenate([pairs[:, 0], pairs[:, 1]])
+            j = np.concatenate([pairs[:, 1], pairs[:, 0]])
+
+        distances = np.abs(self.offsets(i, j))
+        close = distances < radius
+
+        return i[close], j[close]
+
+    def step(self, center):
+        """Advance all the boids by one frame."""
+
+        n = len(self.coordinates)
+        i, j = self.neighborPairs(flockThreshold)
+        offsets = self.offsets(i, j)
+
+        # 1. Rule of Separation - move away from the boids too close
+        #                         for comfort
+        tooClose = np.abs(offsets) < minSeparation
+        separation = -(np.bincount(i[tooClose],
+                                   weights=offsets.real[tooClose],
+                                   minlength=n) +
+                       1j * np.bincount(i[tooClose],
+                                        weights=offsets.imag[tooClose],
+                                        minlength=n))
+        separation = separation * separationFactor
+
+        # 2. Rule of Alignment - move towards the average heading
+        #                        of local flockmates
+        numLocalFlockmates = np.bincount(i, minlength=n)
+        totalVelocity = (np.bincount(i, weights=self.velocities[j].real,
+                                     minlength=n) +
+                         1j * np.bincount(i, weights=self.velocities[j].imag,
+                                          minlength=n))
+        avgVelocity = totalVelocity / np.maximum(numLocalFlockmates, 1)
+        alignment = (avgVelocity - self.velocities) * alignmentFactor
+
+        # 3. Rule of Cohesion - move toward the center of the universe
+        cohesion = (center - self.coordinates) * cohesionFactor
+
+        # Create composite behavior
+        self.velocities = (self.velocities / frictionFactor) + \
+                          separation + alignment + cohesion
+
+        # Move, keeping boids within bounds (wrap around)
+        self.coordinates = self.coordinates + self.velocities
+        self.coordinates = (self.coordinates.real % universeWidth +
+                            1j * np.clip(self.coordinates.imag, 0,
+                                         universeHeight))
+
+    def generateNotes(self, frames):
+        """Simulate the flock for the given number of frames, and return
+           the notes of each boid at each frame (like generateNotes in
+           boids_reaper.py).
+        """
+
+        attractPoint = complex(universeWidth / 2, universeHeight / 2)
+
+        notes = []
+        for frame in range(frames):
+            self.step(attractPoint)
+            notes.extend(boidNote(frame, y, speed) for y, speed in
+                         zip(self.coordinates.imag.tolist(),
+                             np.abs(self.velocities).tolist()))
+
+        return notes
+
+
+def checkEquivalence(numBoids=300, frames=50, randomSeed=1):
+    """Check that the Boid and Flock engines produce the same notes
+       from the same seed, comparing all the pairs and with the KD-tree.
+    """
+
+    equivalent = True
+    for pairwiseLimit in (numBoids, 0):
+        seed(randomSeed)
+        boids = createBoids(numBoids)
+        flock = Flock.fromBoids(boids, pairwiseLimit)
+
+        expected = generateNotes(boids, frames)
+        notes = flock.generateNotes(frames)
+
+        differences = sum(1 for a, b in zip(expected, notes) if a != b)
+        maxDistance = max(abs(boid.coordinates - coordinates)
+                          for boid, coordinates in
+                          zip(boids, flock.coordinates))
+        mode = "all pairs" if pairwiseLimit else "KD-tree"
+        print(f"{mode}: {differences} of {len(notes)} notes differ, "
+              f"max position difference {maxDistance:.2e}")
+        equivalent = equivalent and differences == 0 and \
+                     len(notes) == len(expected)
+
+    return equivalent
+
+
+def benchmark(sizes=(50, 500, 5000), seconds=2.0):
+    """Print the frames per second for each number of boids, with the
+       Boid objects (and SpatialGrid) and with the Flock arrays.
+    """
+
+    center = complex(universeWidth / 2, universeHeight / 2)
+    for n in sizes:
+        boids = createBoids(n)
+        flock = Flock.fromBoids(boids)
+        grid = SpatialGrid(flockThreshold)
+
+        results = []
+        for advance in (lambda: simulateFrame(boids, center, grid),
+                        lambda: flock.step(center)):
+            frames = 0
+            start = time.perf_counter()
+            # At least one frame, for at most about the given seconds
+            while frames == 0 or time.perf_counter() - start < seconds:
+                advance()
+                frames = frames + 1
+            results.append(frames / (time.perf_counter() - start))
+        print(f"{n} boids: {results[0]:.2f} frames/sec (Boid), "
+              f"{results[1]:.2f} frames/sec (Flock)")
+
+
+# Run the script
+if __name__ == "__main__":
+    if not checkEquivalence():
+        print("The engines produce different notes!")
+        sys.exit(1)
+    benchmark()
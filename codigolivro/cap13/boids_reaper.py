@@ -7,7 +7,8 @@
 #
 
 import reapy
-from math import sqrt
+import sys
+import time
 from random import randint, uniform
 
 # Universe parameters
@@ -55,6 +56,8 @@ class Boid:
         """
         Sense other boids' positions, etc., and adjust velocity
         (i.e., the displacement of where to move next).
+        The boids can be the whole flock, or only the local flockmates
+        found with a SpatialGrid.
         """
         
         # Use individual rules of thumb to decide where to move next
@@ -70,13 +73,18 @@ class Boid:
         # 3. Rule of Cohesion - move toward the center of the universe
         self.cohesion = self.rule3_Cohesion(boids, center)
         
-        # Create composite behavior
-        self.velocity = (self.velocity / frictionFactor) + \
-                        self.separation + self.alignment + \
-                        self.cohesion
+        # Create composite behavior (adopted in act, so that the other
+        # boids sensing in the same frame still see the current velocity)
+        self.newVelocity = (self.velocity / frictionFactor) + \
+                           self.separation + self.alignment + \
+                           self.cohesion
 
     def act(self):
-        """Move boid to a new position using current velocity."""
+        """Move boid to a new position using the velocity decided
+           in sense.
+        """
+        
+        self.velocity = self.newVelocity
         
         # Update coordinates
         self.coordinates = self.coordinates + self.velocity
@@ -105,8 +113,7 @@ class Boid:
             # Too close for comfort (excluding ourself)?
             if separation < minSeparation and boid != self:
                 # Yes, so let's move away from this boid
-                newVelocity = newVelocity - \
-                              (boid.coordinates - self.coordinates)
+                newVelocity = newVelocity - self.offset(boid)
         
         return newVelocity * separationFactor  # return new velocity
 
@@ -149,20 +156,193 @@ class Boid:
         
         return newVelocity * cohesionFactor  # return new velocity
 
-    ##### Helper function ####################
+    ##### Helper functions ####################
+    def offset(self, other):
+        """Return the vector from this to another boid, taking the
+           shortest way around the time axis (which wraps around).
+        """
+        
+        offset = other.coordinates - self.coordinates
+        xOffset = (offset.real + universeWidth / 2) % universeWidth - \
+                  universeWidth / 2
+        
+        return complex(xOffset, offset.imag)
+
     def distance(self, other):
         """Calculate the Euclidean distance between this and
            another boid.
         """
         
-        xDistance = (self.coordinates.real - other.coordinates.real)
-        yDistance = (self.coordinates.imag - other.coordinates.imag)
+        return abs(self.offset(other))
+
+
+### Define SpatialGrid class ###
+class SpatialGrid:
+    """
+    A uniform grid of cells indexing the boids by position, rebuilt at
+    each frame. Since the cells are at least as large as the search
+    radius, the neighbors of a boid are all in its cell and the 8 cells
+    around it (wrapping around on the time axis), so each boid only
+    inspects nearby boids instead of the whole flock.
+    """
+
+    def __init__(self, cellSize):
+        """Initialize the grid with cells of at least cellSize."""
+        
+        self.columns = max(1, int(universeWidth // cellSize))
+        self.rows = int(universeHeight // cellSize) + 1
+        self.cellWidth = universeWidth / self.columns
+        self.cellHeight = cellSize
+        self.cells = {}
+
+    def cell(self, coordinates):
+        """Return the (column, row) of the cell containing coordinates."""
+        
+        column = int(coordinates.real // self.cellWidth) % self.columns
+        row = min(self.rows - 1, int(coordinates.imag // self.cellHeight))
+        
+        return column, row
+
+    def rebuild(self, boids):
+        """Index the boids at their current positions."""
+        
+        self.cells = {}
+        for boid in boids:
+            self.cells.setdefault(self.cell(boid.coordinates), []).append(boid)
+
+    def neighbors(self, boid, radius):
+        """Return the other boids closer than radius (at most the cell
+           size) to this boid.
+        """
+        
+        column, row = self.cell(boid.coordinates)
+        
+        # Wrap around on the time axis (a set, in case of < 3 columns)
+        columns = {(column + i) % self.columns for i in (-1, 0, 1)}
+        
+        neighbors = []
+        for c in columns:
+            for r in (row - 1, row, row + 1):
+                cell = self.cells.get((c, r))
+                if cell:
+                    neighbors.extend(other for other in cell
+                                     if other is not boid and
+                                     boid.distance(other) < radius)
+        
+        return neighbors
+
+
+### Simulation ###
+def createBoids(n):
+    """Create n boids with random positions and velocities."""
+    
+    boids = []
+    for i in range(n):
+        # Get random position for this boid
+        x = randint(0, universeWidth)
+        y = randint(0, universeHeight)
+        
+        # Random initial velocity
+        vx = uniform(-2, 2)
+        vy = uniform(-2, 2)
+        
+        # Create a boid with random position and velocity
+        boids.append(Boid(x, y, vx, vy))
+    
+    return boids
+
+
+def simulateFrame(boids, center, grid=None):
+    """Advance the boids by one frame. With a grid, each boid only
+       senses its local flockmates, otherwise it senses all the boids.
+    """
+    
+    if grid is not None:
+        grid.rebuild(boids)
+    
+    # First all boids observe the others and decide how to adjust
+    # movement (from the positions and velocities at the start of
+    # the frame)
+    for boid in boids:
+        if grid is not None:
+            boid.sense(grid.neighbors(boid, flockThreshold), center)
+        else:
+            boid.sense(boids, center)
+    
+    # Then move!
+    for boid in boids:
+        boid.act()
+
+
+def benchmark(sizes=(50, 500, 5000), seconds=2.0):
+    """Print the frames per second for each number of boids, sensing
+       all the boids and sensing the neighbors from the grid.
+    """
+    
+    center = complex(universeWidth / 2, universeHeight / 2)
+    for n in sizes:
+        results = []
+        for grid in (None, SpatialGrid(flockThreshold)):
+            boids = createBoids(n)
+            frames = 0
+            start = time.perf_counter()
+            # At least one frame, for at most about the given seconds
+            while frames == 0 or time.perf_counter() - start < seconds:
+                simulateFrame(boids, center, grid)
+                frames = frames + 1
+            results.append(frames / (time.perf_counter() - start))
+        print(f"{n} boids: {results[0]:.2f} frames/sec (all pairs), "
+              f"{results[1]:.2f} frames/sec (grid)")
+
+
+def boidNote(frame, y, speed):
+    """Return the MIDI note of a boid at height y moving at speed."""
+    
+    # Create a MIDI note based on boid position
+    # X coordinate -> time (in beats)
+    # Y coordinate -> pitch
+    noteTime = frame * timeScale
+    pitch = int(y) + pitchOffset
+    
+    # Ensure pitch is in valid MIDI range (0-127)
+    pitch = max(0, min(127, pitch))
+    
+    # Velocity based on boid's movement speed
+    velocity = int(min(127, max(40, speed * 20)))
+    
+    return {
+        'pitch': pitch,
+        'start': noteTime,
+        'end': noteTime + noteLength,
+        'velocity': velocity
+    }
+
+
+def generateNotes(boids, frames):
+    """Simulate the boids for the given number of frames, and return
+       the notes of each boid at each frame.
+    """
+    
+    attractPoint = complex(universeWidth / 2, universeHeight / 2)
+    
+    # Neighbor index, with cells as large as the local flock distance
+    grid = SpatialGrid(flockThreshold)
+    
+    notes = []  # Collect all notes first
+    for frame in range(frames):
+        
+        # Sensing and acting for all boids
+        simulateFrame(boids, attractPoint, grid)
         
-        return sqrt(xDistance * xDistance + yDistance * yDistance)
+        for boid in boids:
+            notes.append(boidNote(frame, boid.coordinates.imag,
+                                  abs(boid.velocity)))
+    
+    return notes
 
 
 ### Main REAPER integration ###
-def create_boid_music():
+def create_boid_music(useNumpy=False):
     """Create musical composition based on boid flocking behavior."""
     
     # Connect to REAPER
@@ -179,58 +359,16 @@ def create_boid_music():
     # Get the take (MIDI data container)
     take = item.active_take
     
-    # Initialize boid universe
-    boids = []
-    attractPoint = complex(universeWidth / 2, universeHeight / 2)
-    
     # Create and place boids with random positions and velocities
-    for i in range(numBoids):
-        # Get random position for this boid
-        x = randint(0, universeWidth)
-        y = randint(0, universeHeight)
-        
-        # Random initial velocity
-        vx = uniform(-2, 2)
-        vy = uniform(-2, 2)
-        
-        # Create a boid with random position and velocity
-        boid = Boid(x, y, vx, vy)
-        boids.append(boid)
+    boids = createBoids(numBoids)
     
     # Simulate boid movement and create notes
-    notes_data = []  # Collect all notes first
-    
-    for frame in range(numFrames):
-        
-        # Sensing and acting loop for all boids
-        for boid in boids:
-            
-            # First observe other boids and decide how to adjust movement
-            boid.sense(boids, attractPoint)
-            
-            # Then move!
-            boid.act()
-            
-            # Create a MIDI note based on boid position
-            # X coordinate -> time (in beats)
-            # Y coordinate -> pitch
-            time = frame * timeScale
-            pitch = int(boid.coordinates.imag) + pitchOffset
-            
-            # Ensure pitch is in valid MIDI range (0-127)
-            pitch = max(0, min(127, pitch))
-            
-            # Velocity based on boid's movement speed
-            speed = abs(boid.velocity)
-            velocity = int(min(127, max(40, speed * 20)))
-            
-            # Store note data
-            notes_data.append({
-                'pitch': pitch,
-                'start': time,
-                'end': time + noteLength,
-                'velocity': velocity
-            })
+    if useNumpy:
+        # Vectorized engine (see boids_numpy.py)
+        from boids_numpy import Flock
+        notes_data = Flock.fromBoids(boids).generateNotes(numFrames)
+    else:
+        notes_data = generateNotes(boids, numFrames)
     
     # Add all notes to the MIDI take
     for note in notes_data:
@@ -249,9 +387,13 @@ def create_boid_music():
 
 # Run the script
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        # Frames per second without REAPER
+        benchmark()
+        sys.exit(0)
     try:
         print("Connecting to REAPER...")
-        create_boid_music()
+        create_boid_music(useNumpy="--numpy" in sys.argv)
     except Exception as e:
         print(f"Error: {e}")
         print("\nMake sure REAPER is running and reapy is properly configured.")
@@ -13,9 +13,16 @@
 #
 
 import reapy
-from random import random, randint
+import sys
+import time
+from random import random, randint, seed
 from math import sin, cos, pi
 
+import numpy as np
+
+import shared
+from scales import quantize
+
 # Musical parameters
 SCALE = [0, 2, 4, 5, 7, 9, 11]  # Major scale intervals
 LOW_PITCH = 36   # C2
@@ -40,14 +47,10 @@ def map_to_scale(value, in_min, in_max, low_pitch, high_pitch, scale):
     # First map to the pitch range
     pitch = map_value(value, in_min, in_max, low_pitch, high_pitch)
     
-    # Round to nearest scale degree
-    octave = int(pitch / 12)
-    pitch_class = int(pitch % 12)
-    
-    # Find closest note in scale
-    closest = min(scale, key=lambda x: abs(x - pitch_class))
-    
-    return octave * 12 + closest
+    # Round to nearest scale degree (value may also be an array)
+    if isinstance(pitch, np.ndarray):
+        return quantize(pitch.astype(int), mode=scale)
+    return quantize(int(pitch), mode=scale)
 
 
 def spherical_to_cartesian(r, phi, theta):
@@ -130,6 +133,122 @@ class MusicalSphere:
                 self.theta_values[i] = new_theta
         
         return self.notes
+    
+    def crossing_frames(self):
+        """
+        Return the (frames, points) arrays of all the meridian crossings,
+        sorted by frame then point, as detected by simulate().
+        
+        Since the rotation is uniform, the crossings are computed in closed
+        form: point i crosses for the m-th time at the first frame where
+        theta + (frame + 1) * velocity >= m * 2*pi. simulate() accumulates
+        a rounding error of at most half an ulp per frame, so the points
+        with a crossing closer than that to the meridian are simulated
+        frame by frame instead, to get exactly the same frames.
+        """
+        
+        theta = np.array(self.theta_values)
+        velocity = self.velocity
+        num_frames = self.num_frames
+        full_turn = 2*pi
+        # Max error of simulate() (half an ulp of 8 per frame), plus the
+        # rounding error of the closed form
+        tolerance = num_frames * 4.5e-16 + 1e-11
+        
+        # Number of crossings of each point (maybe one more if ambiguous)
+        counts = np.floor((theta + num_frames * velocity + tolerance)
+                          / full_turn).astype(np.int64)
+        points = np.repeat(np.arange(self.num_points), counts)
+        starts = np.cumsum(counts) - counts
+        turns = np.arange(len(points)) - np.repeat(starts, counts) + 1
+        
+        # First frame where the m-th turn is reached
+        frames = np.ceil((turns * full_turn - theta[points]) / velocity) - 1
+        frames = np.maximum(frames, 0).astype(np.int64)
+        
+        # How far past the meridian the point is after the crossing
+        past = theta[points] + (frames + 1) * velocity - turns * full_turn
+        ambiguous = np.unique(points[(past < tolerance) |
+                                     (past > velocity - tolerance)])
+        
+        keep = (frames < num_frames) & ~np.isin(points, ambiguous)
+        frames, points = frames[keep], points[keep]
+        
+        # Simulates the ambiguous points frame by frame, like simulate()
+        for i in ambiguous.tolist():
+            old_theta = self.theta_values[i]
+            point_frames = []
+            for frame in range(num_frames):
+                new_theta = (old_theta + velocity) % (2*pi)
+                if old_theta > new_theta:
+                    point_frames.append(frame)
+                old_theta = new_theta
+            frames = np.concatenate([frames, point_frames]).astype(np.int64)
+            points = np.concatenate([points, [i] * len(point_frames)])
+        
+        order = np.lexsort((points, frames))
+        return frames[order], points[order]
+    
+    def simulate_vectorized(self):
+        """
+        Generate the same notes as simulate(), from the crossings computed
+        in closed form (see crossing_frames), in a fraction of the time.
+        """
+        
+        frames, points = self.crossing_frames()
+        
+        # Pitch of each point, based on its latitude (phi)
+        pitches = map_to_scale(np.array(self.phi_values), 0, pi,
+                               LOW_PITCH, HIGH_PITCH, SCALE).tolist()
+        
+        for frame, i in zip(frames.tolist(), points.tolist()):
+            # Current time in beats
+            time = frame * TIME_SCALE
+            velocity = randint(60, 100)  # random velocity
+            
+            # Store note data
+            self.notes.append({
+                'pitch': pitches[i],
+                'start': time,
+                'end': time + NOTE_DURATION,
+                'velocity': velocity
+            })
+        
+        # Final rotation of the points (up to rounding, as after simulate())
+        self.theta_values = ((np.array(self.theta_values) +
+                              self.num_frames * self.velocity) %
+                             (2*pi)).tolist()
+        
+        return self.notes
+
+
+def benchmark():
+    """
+    Check that simulate() and simulate_vectorized() generate the same
+    notes, compare their time, and time the crossings of a large sphere.
+    """
+    
+    for num_points, num_frames in [(NUM_POINTS, NUM_FRAMES), (1000, 10000)]:
+        results = []
+        for vectorized in (False, True):
+            seed(1)
+            sphere = MusicalSphere(RADIUS, num_points, VELOCITY, num_frames)
+            start = time.perf_counter()
+            if vectorized:
+                notes = sphere.simulate_vectorized()
+            else:
+                notes = sphere.simulate()
+            results.append((notes, time.perf_counter() - start))
+        (loop_notes, loop_time), (notes, vectorized_time) = results
+        print(f"{num_points} points x {num_frames} frames: "
+              f"{len(notes)} notes, identical: {notes == loop_notes}, "
+              f"loop {loop_time:.3f} s, vectorized {vectorized_time:.3f} s")
+    
+    sphere = MusicalSphere(RADIUS, 100000, VELOCITY, 100000)
+    start = time.perf_counter()
+    frames, points = sphere.crossing_frames()
+    print(f"100000 points x 100000 frames: {len(frames)} crossings "
+          f"in {time.perf_counter() - start:.2f} s")
 
 
 def create_musical_sphere():
@@ -146,7 +265,7 @@ def create_musical_sphere():
     )
     
     print(f"Simulating {NUM_FRAMES} frames with {NUM_POINTS} points...")
-    notes = sphere.simulate()
+    notes = sphere.simulate_vectorized()
     
     print(f"Generated {len(notes)} notes")
     
@@ -187,6 +306,10 @@ def create_musical_sphere():
 
 # Run the script
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        # Loop vs vectorized simulation, without REAPER
+        benchmark()
+        sys.exit(0)
     try:
         print("=" * 60)
         print("MUSICAL SPHERE - REAPER Generator")
@@ -1,5 +1,15 @@
 import reapy
+import itertools
 import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+import numpy as np
+
+import shared
+from scales import quantize
 
 def map_value(val, in_min, in_max, out_min, out_max):
     """Linearly maps a value from one range to another."""
@@ -7,15 +17,133 @@ def map_value(val, in_min, in_max, out_min, out_max):
         return out_min
     return (val - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
-def quantize_to_c_major(pitch):
-    """Quantizes a MIDI pitch to the nearest note in the C Major scale."""
-    c_major_intervals = [0, 2, 4, 5, 7, 9, 11]
-    octave = pitch // 12
-    note_in_octave = pitch % 12
-    closest_note = min(c_major_intervals, key=lambda x: abs(x - note_in_octave))
-    return (octave * 12) + closest_note
+def data_lines(f):
+    """
+    Yields the data lines of the file, those with at least the 3 (time,
+    skin conductance, heart rate) fields, skipping the blank and short
+    lines.
+    """
+    for line in f:
+        if len(line.split()) >= 3:
+            yield line
+
+def count_data_lines(path):
+    """Counts the data lines of the file (see data_lines)."""
+    with open(path, "r") as f:
+        return sum(1 for _ in data_lines(f))
+
+def read_biosignal_chunks(path, chunk_lines=100000):
+    """
+    Reads the data lines of the file (see data_lines) in chunks of
+    chunk_lines, parsed with np.loadtxt, and yields the skin and heart
+    arrays of each chunk.
+    """
+    with open(path, "r") as f:
+        lines = data_lines(f)
+        while True:
+            chunk = list(itertools.islice(lines, chunk_lines))
+            if not chunk:
+                return
+            # parts[1] is skin conductance, parts[2] is heart rate
+            data = np.loadtxt(chunk, usecols=(1, 2), ndmin=2)
+            yield data[:, 0], data[:, 1]
+
+class RunningRange:
+    """
+    The min and max of a signal read in chunks, over all the chunks read
+    so far, or over the last chunks covering at least window samples.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.chunks = deque() # (count, min, max) of each chunk
+        self.count = 0
+
+    def update(self, values):
+        """Adds the chunk values, returns the current (min, max)."""
+        chunk = (len(values), values.min(), values.max())
+        if self.window is None and self.chunks:
+            # Running range: a single entry for all the chunks
+            count, low, high = self.chunks.pop()
+            chunk = (count + chunk[0], min(low, chunk[1]), max(high, chunk[2]))
+        self.chunks.append(chunk)
+        self.count += len(values)
+        if self.window is not None:
+            while self.count - self.chunks[0][0] >= self.window:
+                self.count -= self.chunks.popleft()[0]
+        return (min(chunk[1] for chunk in self.chunks),
+                max(chunk[2] for chunk in self.chunks))
+
+def get_global_ranges(path, chunk_lines=100000):
+    """Returns the global (min, max) of the skin and heart data, in a
+    streaming first pass over the file."""
+    skin_range, heart_range = RunningRange(), RunningRange()
+    for skin, heart in read_biosignal_chunks(path, chunk_lines):
+        skin_min_max = skin_range.update(skin)
+        heart_min_max = heart_range.update(heart)
+    return skin_min_max, heart_min_max
+
+def sonify_chunks(chunks, dur_beats=0.125, ranges=None, window=None):
+    """
+    Maps each chunk of (skin, heart) data to notes, yields the arrays of
+    pitches, start and end beats and velocities of each chunk.
+
+    ranges: the global ((skin_min, skin_max), (heart_min, heart_max)),
+    if None the ranges are normalized while streaming, over all the
+    data so far or over the last window samples
+    """
+    skin_range, heart_range = RunningRange(window), RunningRange(window)
+    first_note = 0
+    for skin, heart in chunks:
+        if ranges is None:
+            (skin_min, skin_max) = skin_range.update(skin)
+            (heart_min, heart_max) = heart_range.update(heart)
+        else:
+            (skin_min, skin_max), (heart_min, heart_max) = ranges
+
+        # Map skin conductance to base pitch (C3=48 to C6=84)
+        base_pitch = map_value(skin, skin_min, skin_max, 48, 84)
+        
+        # Map heart data to pitch variation (0 to 24 semitones)
+        variation = map_value(heart, heart_min, heart_max, 0, 24)
+        
+        # Resulting pitch
+        raw_pitch = base_pitch + variation
+        
+        # Quantize to C Major
+        pitches = quantize(np.asarray(raw_pitch).astype(int)) # C Major
+        
+        # Map heart data to velocity (0-127)
+        velocities = np.asarray(map_value(heart, heart_min, heart_max, 60, 110)).astype(int) # Using a narrower range for better sound
+
+        # map_value returns out_min for a constant signal
+        pitches = np.broadcast_to(pitches, skin.shape)
+        velocities = np.broadcast_to(velocities, skin.shape)
+
+        starts = (first_note + np.arange(len(skin))) * dur_beats
+        first_note += len(skin)
+        yield pitches, starts, starts + dur_beats * 0.9, velocities
 
-def create_biosignal_sonification():
+@reapy.inside_reaper()
+def add_notes(take, pitches, starts, ends, velocities, spb):
+    """Adds a chunk of notes to the take, without sorting them."""
+    for pitch, start, end, velocity in zip(pitches.tolist(), starts.tolist(),
+                                           ends.tolist(), velocities.tolist()):
+        take.add_note(
+            pitch=pitch,
+            start=start * spb,
+            end=end * spb,
+            velocity=velocity,
+            channel=0,
+            sort=False
+        )
+
+def create_biosignal_sonification(running=False, window=None):
+    """
+    Sonifies biosignals.txt, streaming the file in chunks. The data is
+    normalized with its global ranges, read in a first streaming pass,
+    or while streaming (running, or over the last window samples).
+    """
     # Connect to REAPER
     project = reapy.Project()
     
@@ -26,26 +154,14 @@ def create_biosignal_sonification():
         print(f"Error: {data_file} not found. Please run the dummy data creation first.")
         return
 
-    # 1. Read and process data
-    skin_data = []
-    heart_data = []
-    
-    with open(data_file, "r") as f:
-        for line in f:
-            parts = line.split()
-            if len(parts) >= 3:
-                # time = float(parts[0])
-                # parts[1] is skin conductance, parts[2] is heart rate
-                skin_data.append(float(parts[1]))
-                heart_data.append(float(parts[2]))
-
-    if not skin_data:
+    # 1. Count the data points (the item length) and find the ranges
+    num_points = count_data_lines(data_file)
+    if num_points == 0:
         print("Error: No data found in biosignals.txt")
         return
-
-    # Find ranges for mapping
-    skin_min, skin_max = min(skin_data), max(skin_data)
-    heart_min, heart_max = min(heart_data), max(heart_data)
+    ranges = None
+    if not running and window is None:
+        ranges = get_global_ranges(data_file)
 
     # 2. REAPER Integration
     track = project.add_track(name="Biosignal Sonification")
@@ -65,42 +181,78 @@ def create_biosignal_sonification():
     # 1 beat = QN, 0.5 = EN, 0.25 = SN, 0.125 = TN
     dur_beats = 0.125 
     
-    total_beats = len(heart_data) * dur_beats
+    total_beats = num_points * dur_beats
     item = track.add_midi_item(0, end=total_beats * spb)
     item.name = "Biological Data Melody"
     take = item.active_take
     
-    current_beat = 0.0
-    for i in range(len(heart_data)):
-        # Map skin conductance to base pitch (C3=48 to C6=84)
-        base_pitch = map_value(skin_data[i], skin_min, skin_max, 48, 84)
-        
-        # Map heart data to pitch variation (0 to 24 semitones)
-        variation = map_value(heart_data[i], heart_min, heart_max, 0, 24)
-        
-        # Resulting pitch
-        raw_pitch = base_pitch + variation
-        
-        # Quantize to C Major
-        pitch = quantize_to_c_major(int(raw_pitch))
-        
-        # Map heart data to velocity (0-127)
-        velocity = map_value(heart_data[i], heart_min, heart_max, 60, 110) # Using a narrower range for better sound
-        
-        take.add_note(
-            pitch=int(pitch),
-            start=float(current_beat * spb),
-            end=float((current_beat + dur_beats * 0.9) * spb),
-            velocity=int(velocity),
-            channel=0
-        )
-        current_beat += dur_beats
+    # 3. Stream the notes to the take, chunk by chunk
+    count = 0
+    chunks = read_biosignal_chunks(data_file)
+    for notes in sonify_chunks(chunks, dur_beats, ranges, window):
+        add_notes(take, *notes, spb=spb)
+        count += len(notes[0])
+    take.sort_events()
+
+    print(f"Biosignal sonification with {count} data points generated in REAPER successfully.")
+
+def benchmark(num_lines=10000000, chunk_lines=100000):
+    """
+    Sonifies a synthetic file of num_lines data points without REAPER,
+    and prints the time and peak memory of each normalization.
+    """
+    data_file = os.path.join(tempfile.gettempdir(), "biosignals_benchmark.txt")
+    print(f"Generating {num_lines} lines: {data_file}")
+    rng = np.random.default_rng(0)
+    with open(data_file, "w") as f:
+        for first in range(0, num_lines, 1000000):
+            n = min(1000000, num_lines - first)
+            t = (first + np.arange(n)) * 0.1
+            skin = 45 + np.cumsum(rng.normal(0, 0.1, n))
+            heart = 75 + 10 * np.sin(t / 60) + rng.normal(0, 2, n)
+            f.write("\n".join(f"{a:.1f} {b:.2f} {c:.2f}" for a, b, c in
+                              zip(t.tolist(), skin.tolist(), heart.tolist())))
+            f.write("\n")
+
+    def sonify(two_pass, window):
+        ranges = None
+        if two_pass:
+            ranges = get_global_ranges(data_file, chunk_lines)
+        count = 0
+        chunks = read_biosignal_chunks(data_file, chunk_lines)
+        for notes in sonify_chunks(chunks, ranges=ranges, window=window):
+            count += len(notes[0])
+        return count
+
+    for name, two_pass, window in [("two-pass global", True, None),
+                                   ("running", False, None),
+                                   ("window 1M", False, 1000000)]:
+        start = time.perf_counter()
+        count = sonify(two_pass, window)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {count} notes in {elapsed:.2f} s "
+              f"({count / elapsed:.0f} points/sec)")
 
-    print(f"Biosignal sonification with {len(heart_data)} data points generated in REAPER successfully.")
+    # Separate run, since tracing the allocations slows it down
+    tracemalloc.start()
+    sonify(False, None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"Peak memory while streaming: {peak / 1e6:.0f} MB "
+          f"(file size {os.path.getsize(data_file) / 1e6:.0f} MB)")
+    os.remove(data_file)
 
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        # Synthetic 10M-line recording, without REAPER
+        benchmark()
+        sys.exit(0)
+    window = None
+    if "--window" in sys.argv:
+        window = int(sys.argv[sys.argv.index("--window") + 1])
     try:
-        create_biosignal_sonification()
+        create_biosignal_sonification(running="--running" in sys.argv,
+                                      window=window)
     except Exception as e:
         print(f"Error: {e}")
         print("Ensure REAPER is open and reapy is configured.")
@@ -1,36 +1,102 @@
 import reapy
-import random
 import os
+import sys
+import tempfile
+import time
+import numpy as np
 try:
     from PIL import Image, ImageDraw
 except ImportError:
     print("Error: The 'Pillow' library is required. Please install it with: pip install Pillow")
     Image = None
 
+import shared
+from scales import quantize
+
 def map_value(val, in_min, in_max, out_min, out_max):
     if in_max == in_min: return out_min
     return (val - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
-def quantize_to_mixolydian(pitch):
-    # C Mixolydian: C, D, E, F, G, A, Bb (0, 2, 4, 5, 7, 9, 10)
-    scale = [0, 2, 4, 5, 7, 9, 10]
-    octave = pitch // 12
-    note = pitch % 12
-    closest = min(scale, key=lambda x: abs(x - note))
-    return (octave * 12) + closest
-
-def create_dummy_image(path):
+def create_dummy_image(path, width=300, height=300):
     if Image is None: return
     print(f"Generating test image: {path}")
-    img = Image.new('RGB', (300, 300))
-    pixels = img.load()
-    for i in range(img.size[0]):
-        for j in range(img.size[1]):
-            # Red gradient horizontally, Blue vertically
-            pixels[i, j] = (i % 256, (i+j) % 256, j % 256)
-    img.save(path)
-
-def create_image_sonification():
+    # Red gradient horizontally, Blue vertically
+    x = np.arange(width)[None, :]
+    y = np.arange(height)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = x % 256
+    pixels[..., 1] = (x + y) % 256
+    pixels[..., 2] = y % 256
+    Image.fromarray(pixels, 'RGB').save(path)
+
+def load_pixels(image_path):
+    """Loads the image as a (height, width, 3) RGB array."""
+    with Image.open(image_path) as img:
+        return np.asarray(img.convert('RGB'))
+
+def sample_pixels(pixels, rows=None, block_width=1, block_height=1):
+    """
+    Samples the image in blocks, returns an array of (rows, columns, 3)
+    mean RGB values.
+
+    rows: the row indices to sonify, each sampled in blocks of block_width
+    pixels; if None, the whole image is scanned in blocks of block_height
+    by block_width pixels (the last partial blocks are dropped)
+    """
+    height, width, _ = pixels.shape
+    columns = width // block_width
+    if rows is not None:
+        pixels = pixels[rows, :columns * block_width]
+        return pixels.reshape(len(rows), columns, block_width, 3).mean(axis=2)
+    block_rows = height // block_height
+    pixels = pixels[:block_rows * block_height, :columns * block_width]
+    return pixels.reshape(block_rows, block_height, columns, block_width,
+                          3).mean(axis=(1, 3))
+
+def sonify_pixels(samples, min_duration=0.8, max_duration=6.0,
+                  time_displacements=(0.75, 0.5, 0.25, 0.125), rng=None):
+    """
+    Maps the (rows, columns, 3) RGB samples to notes, all at once.
+    Returns the arrays of pitches, start and end beats and velocities,
+    the notes of each column starting on the column beat.
+    """
+    rng = rng or np.random.default_rng()
+    red, green, blue = samples[..., 0], samples[..., 1], samples[..., 2]
+
+    # 1. Luminosity -> Pitch
+    lum = (red + green + blue) / 3
+    raw_pitch = map_value(lum, 0, 255, 36, 96) # C2 to C7
+    pitches = quantize(raw_pitch.astype(int), mode="mixolydian") # C Mixolydian
+
+    # 2. Red -> Duration
+    durations = map_value(red, 0, 255, min_duration, max_duration)
+
+    # 3. Blue -> Velocity
+    velocities = map_value(blue, 0, 255, 40, 110).astype(int)
+
+    # Start Time = column + random displacement
+    columns = np.broadcast_to(np.arange(samples.shape[1]), lum.shape)
+    starts = columns + rng.choice(time_displacements, size=lum.shape)
+
+    return (pitches.ravel(), starts.ravel(), (starts + durations).ravel(),
+            velocities.ravel())
+
+@reapy.inside_reaper()
+def add_notes(take, pitches, starts, ends, velocities, spb=1.0):
+    """Adds all the notes to the take, sorting them once at the end."""
+    for pitch, start, end, velocity in zip(pitches.tolist(), starts.tolist(),
+                                           ends.tolist(), velocities.tolist()):
+        take.add_note(
+            pitch=pitch,
+            start=start * spb,
+            end=end * spb,
+            velocity=velocity,
+            channel=0,
+            sort=False
+        )
+    take.sort_events()
+
+def create_image_sonification(full_scan=False, block_size=16):
     if Image is None: return
 
     # Connect to REAPER
@@ -43,11 +109,16 @@ def create_image_sonification():
     if not os.path.exists(image_path):
         create_dummy_image(image_path)
 
-    img = Image.open(image_path)
-    width, height = img.size
+    pixels = load_pixels(image_path)
+    height, width, _ = pixels.shape
     
-    # Selected rows to sonify (as suggested in original script)
-    pixel_rows = [0, height // 4, height // 2, (3 * height) // 4, height - 1]
+    if full_scan:
+        # Whole image, in blocks of block_size x block_size pixels
+        samples = sample_pixels(pixels, None, block_size, block_size)
+    else:
+        # Selected rows to sonify (as suggested in original script)
+        pixel_rows = [0, height // 4, height // 2, (3 * height) // 4, height - 1]
+        samples = sample_pixels(pixels, pixel_rows)
     
     # Musical Parameters
     min_duration, max_duration = 0.8, 6.0
@@ -62,44 +133,44 @@ def create_image_sonification():
 
     # Create a MIDI item long enough for all columns
     # Every column is 1 beat + displacement
-    total_beats = width + max_duration + 1 
+    total_beats = samples.shape[1] + max_duration + 1 
     item = track.add_midi_item(0, end=total_beats * spb)
     item.name = f"Sonification of {os.path.basename(image_path)}"
     take = item.active_take
 
-    print(f"Sonifying {len(pixel_rows)} rows of {width} pixels each...")
-
-    for row_y in pixel_rows:
-        for col_x in range(width):
-            r, g, b = img.getpixel((col_x, row_y))
-            
-            # 1. Luminosity -> Pitch
-            lum = (r + g + b) / 3
-            raw_pitch = map_value(lum, 0, 255, 36, 96) # C2 to C7
-            pitch = quantize_to_mixolydian(int(raw_pitch))
-            
-            # 2. Red -> Duration
-            dur = map_value(r, 0, 255, min_duration, max_duration)
-            
-            # 3. Blue -> Velocity
-            vel = map_value(b, 0, 255, 40, 110)
-            
-            # Start Time = column + random displacement
-            start_beat = float(col_x) + random.choice(time_displacements)
-            
-            take.add_note(
-                pitch=int(pitch),
-                start=float(start_beat * spb),
-                end=float((start_beat + dur) * spb),
-                velocity=int(vel),
-                channel=0
-            )
+    print(f"Sonifying {samples.shape[0]} rows of {samples.shape[1]} samples each...")
+
+    notes = sonify_pixels(samples, min_duration, max_duration, time_displacements)
+    add_notes(take, *notes, spb=spb)
 
     print("Image sonification generated in REAPER successfully.")
 
+def benchmark(width=3840, height=2160, block_size=16):
+    """Times the sonification of a 4K image, selected rows and full scan."""
+    image_path = os.path.join(tempfile.gettempdir(), "sonify_benchmark.png")
+    create_dummy_image(image_path, width, height)
+
+    start = time.perf_counter()
+    pixels = load_pixels(image_path)
+    load_time = time.perf_counter() - start
+
+    rows = [0, height // 4, height // 2, (3 * height) // 4, height - 1]
+    for name, sample in [("5 rows", lambda: sample_pixels(pixels, rows)),
+                         (f"full scan {block_size}x{block_size}",
+                          lambda: sample_pixels(pixels, None, block_size, block_size))]:
+        start = time.perf_counter()
+        notes = sonify_pixels(sample())
+        print(f"{width}x{height} {name}: {len(notes[0])} notes in "
+              f"{time.perf_counter() - start:.3f} s (image loaded in {load_time:.3f} s)")
+    os.remove(image_path)
+
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        # Compute time only, without REAPER
+        benchmark()
+        sys.exit(0)
     try:
-        create_image_sonification()
+        create_image_sonification(full_scan="--full-scan" in sys.argv)
     except Exception as e:
         print(f"Error: {e}")
         print("Ensure REAPER is open and reapy is configured.")
@@ -0,0 +1,15 @@
+"""
+shared.py
+
+Makes the modules shared by the chapters importable from the scripts of
+this chapter (see codigolivro/shared_modules.py):
+
+    import shared
+    from scales import quantize
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import shared_modules
@@ -0,0 +1,170 @@
+"""
+midi_sequencer.py
+
+A real-time MIDI sequencer thread for the tkinter instruments.
+
+root.after() timing depends on the Tk event loop and drifts under GUI
+load. Here, the note on/off events are kept in a priority queue ordered by
+their monotonic time, and a dedicated thread sleeps until just before the
+next event, then spins until its exact time. The GUI only posts commands
+(notes, or callbacks scheduling the next notes) to the sequencer.
+
+The error between the scheduled and actual send time of each message is
+recorded, measure_timing() prints it for a stream of 16th notes.
+"""
+
+import heapq
+import itertools
+import statistics
+import threading
+import time
+from collections import deque
+
+import reapy
+
+
+def stuff_midi_message(status, data1, data2):
+    """
+    Sends a MIDI message to REAPER's Virtual MIDI Keyboard (mode 0).
+    """
+    reapy.RPR.StuffMIDIMessage(0, status, data1, data2)
+
+
+class Sequencer(threading.Thread):
+
+    def __init__(self, send=stuff_midi_message, spin=0.001,
+                 max_errors=10000):
+        """
+        Creates the sequencer, call start() to start its thread.
+
+        send: the function sending a (status, data1, data2) MIDI message
+        spin: seconds before each event for which the thread busy waits,
+        since the OS sleep isn't precise enough for the final millisecond
+        max_errors: number of timing errors kept for stats()
+        """
+        super().__init__(daemon=True)
+        self.send = send
+        self.spin = spin
+        self._events = []
+        self._counter = itertools.count()
+        self._cv = threading.Condition()
+        self._stop_signal = False
+        self._errors = deque(maxlen=max_errors)
+
+    def now(self):
+        """
+        Returns the sequencer time (monotonic, in seconds).
+        """
+        return time.monotonic()
+
+    def _push(self, event_time, action, payload):
+        with self._cv:
+            heapq.heappush(self._events,
+                           (event_time, next(self._counter), action, payload))
+            self._cv.notify()
+
+    def send_at(self, event_time, status, data1, data2):
+        """
+        Sends the MIDI message at event_time (sequencer time).
+        """
+        self._push(event_time, "midi", (status, data1, data2))
+
+    def note(self, start_time, duration, pitch, velocity, channel=0):
+        """
+        Plays the note at start_time for duration seconds.
+        """
+        self.send_at(start_time, 0x90 | channel, pitch, velocity)
+        self.send_at(start_time + duration, 0x80 | channel, pitch, 0)
+
+    def call_at(self, event_time, callback):
+        """
+        Calls callback(event_time) in the sequencer thread at event_time,
+        the callback scheduling the next notes from event_time (not from
+        the current time) so the timing errors don't accumulate.
+        """
+        self._push(event_time, "call", callback)
+
+    def clear(self):
+        """
+        Removes all the pending events and sends an All Notes Off.
+        """
+        with self._cv:
+            self._events.clear()
+        self.send_at(self.now(), 0xB0, 123, 0)
+
+    def run(self):
+        while True:
+            with self._cv:
+                # Sleeps until the spin window of the next event
+                while not self._stop_signal:
+                    if not self._events:
+                        self._cv.wait()
+                        continue
+                    remaining = self._events[0][0] - time.monotonic()
+                    if remaining <= self.spin:
+                        break
+                    self._cv.wait(remaining - self.spin)
+                if self._stop_signal:
+                    return
+                event_time = self._events[0][0]
+
+            while time.monotonic() < event_time:
+                pass
+
+            with self._cv:
+                # Another event may have been posted before this one
+                # (or the queue cleared) while spinning
+                if not self._events or self._events[0][0] > time.monotonic():
+                    continue
+                event_time, _, action, payload = heapq.heappop(self._events)
+
+            if action == "midi":
+                self._errors.append(time.monotonic() - event_time)
+                self.send(*payload)
+            else:
+                payload(event_time)
+
+    def stop(self):
+        """
+        Stops the sequencer thread, the pending events are dropped.
+        """
+        with self._cv:
+            self._stop_signal = True
+            self._cv.notify()
+        self.join()
+
+    def stats(self):
+        """
+        Returns the number of messages and the mean, p99 and max error
+        between their scheduled and actual send time, in milliseconds.
+        """
+        errors = sorted(self._errors)
+        if not errors:
+            return {"messages": 0}
+        return {
+            "messages": len(errors),
+            "error_mean_ms": 1000 * statistics.mean(errors),
+            "error_p99_ms": 1000 * errors[int(0.99 * (len(errors) - 1))],
+            "error_max_ms": 1000 * errors[-1],
+        }
+
+
+def measure_timing(bpm=180, seconds=10.0):
+    """
+    Plays a stream of 16th notes at bpm for seconds on a sequencer
+    discarding the messages, and prints the timing error stats.
+    """
+    sequencer = Sequencer(send=lambda status, data1, data2: None)
+    sequencer.start()
+    step = 60.0 / bpm / 4
+
+    def play_step(step_time):
+        sequencer.note(step_time, step * 0.9, 60, 100)
+        sequencer.call_at(step_time + step, play_step)
+
+    sequencer.call_at(sequencer.now() + 0.1, play_step)
+    time.sleep(seconds)
+    sequencer.stop()
+    stats = sequencer.stats()
+    print(f"16th notes at {bpm} BPM, timing error: {stats}")
+    return stats
@@ -1,6 +1,9 @@
 import reapy
 import tkinter as tk
 
+import shared
+from midi_output_queue import MidiOutputQueue
+
 def setup_reaper():
     """Sets up a track in REAPER for real-time playback."""
     project = reapy.Project()
@@ -25,6 +28,9 @@ def setup_reaper():
 class IPianoParallelApp:
     def __init__(self):
         self.project = setup_reaper()
+        # Key presses only queue their notes, a worker thread sends them
+        # to REAPER
+        self.output_queue = MidiOutputQueue()
         self.keys_pressed = [] # Track active keys to prevent repetition
 
         # Parallel lists representing the instrument configuration
@@ -87,7 +93,7 @@ class IPianoParallelApp:
                 self.canvas.itemconfig(self.rect_ids[i], fill=highlight)
                 
                 # Play in REAPER
-                reapy.RPR.StuffMIDIMessage(0, 0x90, pitch, 100)
+                self.output_queue.put(0x90, pitch, 100)
 
     def on_key_release(self, event):
         key = event.char.lower()
@@ -105,11 +111,14 @@ class IPianoParallelApp:
                 self.canvas.itemconfig(self.rect_ids[i], fill=original_color)
                 
                 # Stop in REAPER
-                reapy.RPR.StuffMIDIMessage(0, 0x80, pitch, 0)
+                self.output_queue.put(0x80, pitch, 0)
 
     def run(self):
         print("iPiano Parallel Active. Play Z S X D C V!")
+        self.output_queue.start()
         self.root.mainloop()
+        self.output_queue.stop()
+        print(f"Output queue stats: {self.output_queue.stats()}")
 
 if __name__ == "__main__":
     try:
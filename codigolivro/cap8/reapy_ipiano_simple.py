@@ -1,6 +1,9 @@
 import reapy
 import tkinter as tk
 
+import shared
+from midi_output_queue import MidiOutputQueue
+
 def setup_reaper():
     """Sets up a track in REAPER for real-time playback."""
     project = reapy.Project()
@@ -25,6 +28,9 @@ def setup_reaper():
 class IPianoApp:
     def __init__(self):
         self.project = setup_reaper()
+        # Key presses only queue their notes, a worker thread sends them
+        # to REAPER (a chord of keys pressed together in a single call)
+        self.output_queue = MidiOutputQueue()
         self.notes_active = set() # Track active MIDI pitches to prevent key-repeat
         
         # Mapping PC keys to MIDI notes (C4 = 60)
@@ -103,7 +109,7 @@ class IPianoApp:
             self.canvas.itemconfig(self.key_rects[char], fill=fill)
             
             # Play in REAPER
-            reapy.RPR.StuffMIDIMessage(0, 0x90, pitch, 100)
+            self.output_queue.put(0x90, pitch, 100)
 
     def on_key_release(self, event):
         char = event.char.lower()
@@ -116,11 +122,14 @@ class IPianoApp:
             self.canvas.itemconfig(self.key_rects[char], fill=original_fill)
             
             # Stop in REAPER
-            reapy.RPR.StuffMIDIMessage(0, 0x80, pitch, 0)
+            self.output_queue.put(0x80, pitch, 0)
 
     def run(self):
         print("iPiano Active. Play your computer keyboard!")
+        self.output_queue.start()
         self.root.mainloop()
+        self.output_queue.stop()
+        print(f"Output queue stats: {self.output_queue.stats()}")
 
 if __name__ == "__main__":
     try:
@@ -1,6 +1,11 @@
 import reapy
 import tkinter as tk
 import random
+import queue
+from midi_sequencer import Sequencer
+
+import shared
+from scales import quantize # C Major by default
 
 def setup_reaper():
     """Sets up a track in REAPER for real-time playback."""
@@ -23,23 +28,21 @@ def setup_reaper():
     target_track.set_info_value("I_RECMON", 1) # Monitoring ON
     return project
 
-def quantize_to_major(pitch):
-    """Quantizes MIDI pitch to C Major scale."""
-    scale = [0, 2, 4, 5, 7, 9, 11]
-    octave = pitch // 12
-    note = pitch % 12
-    closest = min(scale, key=lambda x: abs(x - note))
-    return (octave * 12) + closest
-
 class RandomCirclesTimedApp:
     def __init__(self):
         self.project = setup_reaper()
         self.delay = 500 # ms
         self.is_running = True
+        # Circles generated by the sequencer thread, drawn by the GUI
+        self.circles = queue.Queue()
         
         self.setup_gui()
-        # Start the generation loop
-        self.root.after(self.delay, self.draw_cycle)
+        # Start the generation loop, timed by the sequencer thread
+        self.sequencer = Sequencer()
+        self.sequencer.start()
+        self.sequencer.call_at(self.sequencer.now() + self.delay / 1000,
+                               self.draw_cycle)
+        self.root.after(20, self.draw_circles)
 
     def setup_gui(self):
         self.root = tk.Tk()
@@ -64,7 +67,11 @@ class RandomCirclesTimedApp:
         self.delay = int(val)
         self.root.title(f"Random Timed Circles (Delay: {self.delay}ms)")
 
-    def draw_cycle(self):
+    def draw_cycle(self, cycle_time):
+        """
+        Called by the sequencer thread at cycle_time (sequencer time),
+        plays a random circle and schedules the next cycle from cycle_time.
+        """
         if not self.is_running: return
 
         # 1. Random parameters
@@ -76,30 +83,38 @@ class RandomCirclesTimedApp:
         blue = random.randint(0, 100)
         color_hex = '#{:02x}00{:02x}'.format(red, blue)
         
-        # 2. Draw on canvas
-        self.canvas.create_oval(x-radius, y-radius, x+radius, y+radius, fill=color_hex, outline="")
+        # 2. Post to the GUI to draw on canvas (tkinter isn't thread safe)
+        self.circles.put((x, y, radius, color_hex))
 
         # 3. Sonify
         # map 255-red+blue to pitch range C4 (60) to C6 (84)
         input_val = 255 - red + blue
         pitch_raw = 60 + (input_val / 255.0) * (84 - 60)
-        pitch = quantize_to_major(int(pitch_raw))
+        pitch = quantize(int(pitch_raw))
         
         # map radius (5-40) to velocity (20-127)
         velocity = int(20 + ((radius - 5) / 35.0) * (127 - 20))
         
-        # Play in REAPER
-        reapy.RPR.StuffMIDIMessage(0, 0x90, pitch, velocity)
-        # Schedule Note Off after 5 seconds
-        self.root.after(5000, lambda p=pitch: reapy.RPR.StuffMIDIMessage(0, 0x80, p, 0))
+        # Play in REAPER, Note Off after 5 seconds
+        self.sequencer.note(cycle_time, 5.0, pitch, velocity)
 
         # 4. Schedule next cycle
-        self.root.after(self.delay, self.draw_cycle)
+        self.sequencer.call_at(cycle_time + self.delay / 1000, self.draw_cycle)
+
+    def draw_circles(self):
+        """Draws the circles posted by the sequencer thread."""
+        while not self.circles.empty():
+            x, y, radius, color_hex = self.circles.get()
+            self.canvas.create_oval(x-radius, y-radius, x+radius, y+radius, fill=color_hex, outline="")
+        self.root.after(20, self.draw_circles)
 
     def run(self):
         print("Generative Artist active. Circles and sound started.")
         self.root.mainloop()
         self.is_running = False
+        self.sequencer.stop()
+        reapy.RPR.StuffMIDIMessage(0, 0xb0, 123, 0) # All notes off
+        print(f"Sequencer timing: {self.sequencer.stats()}")
 
 if __name__ == "__main__":
     try:
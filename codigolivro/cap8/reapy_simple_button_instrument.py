@@ -1,6 +1,12 @@
 import reapy
 import tkinter as tk
 
+import shared
+from midi_output_queue import MidiOutputQueue
+
+# The buttons only queue their notes, a worker thread sends them to REAPER
+output_queue = MidiOutputQueue()
+
 def setup_reaper_track():
     """Sets up a track in REAPER for real-time playback."""
     project = reapy.Project()
@@ -29,17 +35,17 @@ def start_note(pitch=69):
     # Using REAPER's StuffMIDIMessage (mode 0 = Virtual MIDI Keyboard)
     # 0x90 is Note On, 0x80 is Note Off
     # channel 1 (0x90)
-    reapy.RPR.StuffMIDIMessage(0, 0x90, pitch, 100)
+    output_queue.put(0x90, pitch, 100)
 
 def stop_note(pitch=69):
     # Send Note Off
-    reapy.RPR.StuffMIDIMessage(0, 0x80, pitch, 0)
+    output_queue.put(0x80, pitch, 0)
 
 def stop_all_notes():
     # Loop through a reasonable range and send Note Off
     # REAPER doesn't have a single "All Notes Off" StuffMIDIMessage shorthand
     # but we can send a CC 123 to channel 1
-    reapy.RPR.StuffMIDIMessage(0, 0xB0, 123, 0)
+    output_queue.put(0xB0, 123, 0)
 
 def run_button_instrument():
     # 1. Setup REAPER
@@ -77,7 +83,10 @@ def run_button_instrument():
     status_label.pack(side="bottom", pady=5)
 
     print("Instrument GUI active. Click buttons to play.")
+    output_queue.start()
     root.mainloop()
+    output_queue.stop()
+    print(f"Output queue stats: {output_queue.stats()}")
 
 if __name__ == "__main__":
     run_button_instrument()
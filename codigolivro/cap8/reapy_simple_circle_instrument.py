@@ -2,6 +2,10 @@ import reapy
 import tkinter as tk
 import math
 
+import shared
+from scales import quantize # C Major by default
+from midi_output_queue import MidiOutputQueue
+
 def setup_reaper():
     """Sets up a track in REAPER for real-time playback."""
     project = reapy.Project()
@@ -23,17 +27,12 @@ def setup_reaper():
     target_track.set_info_value("I_RECMON", 1) # Monitoring ON
     return project
 
-def quantize_to_major(pitch):
-    """Quantizes MIDI pitch to C Major scale."""
-    scale = [0, 2, 4, 5, 7, 9, 11]
-    octave = pitch // 12
-    note = pitch % 12
-    closest = min(scale, key=lambda x: abs(x - note))
-    return (octave * 12) + closest
-
 class CircleInstrument:
     def __init__(self):
         self.project = setup_reaper()
+        # The GUI events only queue their notes, a worker thread sends
+        # them to REAPER
+        self.output_queue = MidiOutputQueue()
         self.begin_x = 0
         self.begin_y = 0
         
@@ -90,27 +89,30 @@ class CircleInstrument:
         pitch = self.max_pitch - pitch_val
         
         # Quantize and clamp
-        midi_pitch = quantize_to_major(int(pitch))
+        midi_pitch = quantize(int(pitch))
         midi_pitch = max(self.min_pitch, min(self.max_pitch, midi_pitch))
         
         # Play in REAPER (StuffMIDIMessage mode 0 = Virtual MIDI Keyboard)
         # 0x90 = Note On. Note: We use a fixed duration approach by sending Off later
         # However, the original says 'Note(pitch, 0, 5000)' which holds for 5s.
         # We'll send Note On now.
-        reapy.RPR.StuffMIDIMessage(0, 0x90, midi_pitch, 100)
+        self.output_queue.put(0x90, midi_pitch, 100)
         
         # Schedule Note Off after 5 seconds
-        self.root.after(5000, lambda p=midi_pitch: reapy.RPR.StuffMIDIMessage(0, 0x80, p, 0))
+        self.root.after(5000, self.output_queue.put, 0x80, midi_pitch, 0)
 
     def clear_canvas(self, event):
         self.canvas.delete("all")
         # All Notes Off (CC 123)
-        reapy.RPR.StuffMIDIMessage(0, 0xB0, 123, 0)
+        self.output_queue.put(0xB0, 123, 0)
         print("Canvas cleared and sound stopped.")
 
     def run(self):
         print("Circle Instrument active. Draw on the canvas!")
+        self.output_queue.start()
         self.root.mainloop()
+        self.output_queue.stop()
+        print(f"Output queue stats: {self.output_queue.stats()}")
 
 if __name__ == "__main__":
     try:
@@ -1,5 +1,7 @@
 import reapy
+import sys
 import tkinter as tk
+from midi_sequencer import Sequencer, measure_timing
 
 # REDEFINE THESE NOTES AT WILL (Live Coding)
 PITCHES   = [64, 65, 64] # E4, F4, E4
@@ -30,6 +32,9 @@ class InCPerformance:
     def __init__(self):
         self.project = setup_reaper()
         self.is_playing = False
+        # Plays the notes from its own thread, the GUI only posts to it
+        self.sequencer = Sequencer()
+        self.sequencer.start()
         
         self.setup_gui()
 
@@ -52,35 +57,47 @@ class InCPerformance:
             self.is_playing = True
             self.btn_toggle.config(text="Stop Performance", bg="red")
             print("Performance started...")
-            self.loop_music(0) # Start from first note
+            # Start from first note
+            self.sequencer.call_at(self.sequencer.now(),
+                                   lambda t: self.loop_music(0, t))
         else:
             self.is_playing = False
             self.btn_toggle.config(text="Start Performance", bg="green")
             print("Performance stopped.")
-            # Silence all notes
-            reapy.RPR.StuffMIDIMessage(0, 0xb0, 123, 0) # All notes off
+            # Drops the pending notes and silences all notes
+            self.sequencer.clear()
 
-    def loop_music(self, note_idx):
+    def loop_music(self, note_idx, start_time):
+        """
+        Called by the sequencer thread at start_time (sequencer time),
+        plays the note and schedules the next one from start_time.
+        """
         if not self.is_playing: return
 
         # Play current note
         pitch = PITCHES[note_idx]
-        duration = DURATIONS[note_idx]
+        duration = DURATIONS[note_idx] / 1000
         
-        # Note On
-        reapy.RPR.StuffMIDIMessage(0, 0x90, pitch, 100)
-        
-        # Schedule Note Off
-        self.root.after(duration - 10, lambda p=pitch: reapy.RPR.StuffMIDIMessage(0, 0x80, p, 0))
+        # Note On, and Note Off 10 ms before the next note
+        self.sequencer.note(start_time, duration - 0.01, pitch, 100)
         
         # Schedule NEXT Note in the theme
         next_idx = (note_idx + 1) % len(PITCHES)
-        self.root.after(duration, lambda: self.loop_music(next_idx))
+        self.sequencer.call_at(start_time + duration,
+                               lambda t: self.loop_music(next_idx, t))
 
     def run(self):
         self.root.mainloop()
+        self.is_playing = False
+        self.sequencer.stop()
+        reapy.RPR.StuffMIDIMessage(0, 0xb0, 123, 0) # All notes off
+        print(f"Sequencer timing: {self.sequencer.stats()}")
 
 if __name__ == "__main__":
+    if "--measure" in sys.argv:
+        # Timing error of a 16th-note stream at 180 BPM, without REAPER
+        measure_timing(bpm=180)
+        sys.exit(0)
     try:
         app = InCPerformance()
         app.run()
@@ -0,0 +1,269 @@
+"""
+async_osc_server.py
+
+An asyncio OSC server (AsyncIOOSCUDPServer) which never blocks its
+receive loop:
+- the handlers run in a bounded pool of worker threads, the messages
+  arriving while the pool backlog is full are dropped (and counted),
+- delayed actions (e.g. note-offs) are scheduled as timers on the event
+  loop with call_later(), instead of sleeping in the handler,
+- sensor streams can be rate-limited: only the latest message of an
+  address is kept between two calls of its handler.
+
+load_test() replays accelerometer packets at 1 kHz from a local sender
+and reports how many were received, decimated, dropped and handled.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_server import AsyncIOOSCUDPServer
+from pythonosc.udp_client import SimpleUDPClient
+
+
+class AsyncOSCServer:
+
+    def __init__(self, ip="0.0.0.0", port=8000, max_workers=1,
+                 max_pending=64):
+        """
+        Creates the server, call map() to register the handlers, then run().
+
+        max_workers: number of threads running the handlers, with more than
+        one worker the handlers may run out of order
+        max_pending: max number of handler calls waiting for a worker,
+        messages beyond are dropped
+        """
+        self.ip = ip
+        self.port = port
+        self.max_pending = max_pending
+        self.dispatcher = Dispatcher()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._loop = None
+        self._stop_event = None
+        self._rate_limits = {}
+        self._timers = {}
+        self._closed = False
+        self._timers_fired = False
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.received = 0
+        self.decimated = 0
+        self.dropped = 0
+        self.handled = 0
+        self.max_pending_seen = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def map(self, address, handler, rate=None):
+        """
+        Registers handler(address, *args) for the OSC address.
+
+        rate: max number of handler calls per second, the messages in
+        between are dropped except the latest (for sensor streams)
+        """
+        if rate is None:
+            self.dispatcher.map(address, self._on_message, handler)
+        else:
+            self._rate_limits[address] = {"period": 1.0 / rate,
+                                          "next_time": 0.0,
+                                          "latest": None,
+                                          "scheduled": False}
+            self.dispatcher.map(address, self._on_rate_limited, handler)
+
+    def _on_message(self, address, handler_args, *args):
+        # Called by the dispatcher on the event loop, must not block
+        self.received += 1
+        self._submit(handler_args[0], address, args, time.perf_counter())
+
+    def _on_rate_limited(self, address, handler_args, *args):
+        self.received += 1
+        state = self._rate_limits[address]
+        if state["latest"] is not None:
+            # Replaced by this message before its handler was called
+            self.decimated += 1
+        state["latest"] = (args, time.perf_counter())
+        if not state["scheduled"]:
+            state["scheduled"] = True
+            delay = max(0.0, state["next_time"] - self._loop.time())
+            self._loop.call_later(delay, self._flush, address,
+                                  handler_args[0])
+
+    def _flush(self, address, handler):
+        state = self._rate_limits[address]
+        args, received_time = state["latest"]
+        state["latest"] = None
+        state["scheduled"] = False
+        state["next_time"] = self._loop.time() + state["period"]
+        self._submit(handler, address, args, received_time)
+
+    def _submit(self, handler, address, args, received_time, force=False):
+        if self._closed:
+            return
+        with self._lock:
+            if not force and self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self._pending)
+        self._executor.submit(self._call, handler, address, args,
+                              received_time)
+
+    def _call(self, handler, address, args, received_time):
+        try:
+            handler(address, *args)
+        except Exception as e:
+            print(f"Error in handler for {address}: {e}")
+        with self._lock:
+            self._pending -= 1
+            if received_time is None:
+                # Timer, not a received message
+                return
+            latency = time.perf_counter() - received_time
+            self.handled += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def call_later(self, delay, callback, *args):
+        """
+        Calls callback(*args) in the handler pool after delay seconds,
+        without blocking. Can be called from the handlers. The timers are
+        never dropped, so that a note-off always follows its note-on: the
+        timers firing while the server stops are called in the event loop
+        (the pool is shutting down), and the pending ones are fired once
+        the handlers are done.
+        """
+        def submit(timer_id):
+            del self._timers[timer_id]
+            if self._closed:
+                # The pool is shutting down, called in the loop instead
+                callback(*args)
+                return
+            self._submit(lambda address, *args: callback(*args),
+                         "timer", args, None, force=True)
+
+        def schedule():
+            if self._timers_fired:
+                # Scheduled after the server stopped, fired right away
+                callback(*args)
+                return
+            timer_id = object()
+            handle = self._loop.call_later(delay, submit, timer_id)
+            self._timers[timer_id] = (handle, callback, args)
+
+        if self._timers_fired:
+            # The loop may be closed, called right away
+            callback(*args)
+            return
+        self._loop.call_soon_threadsafe(schedule)
+
+    async def serve(self, duration=None):
+        """
+        Serves until stop() is called, or for duration seconds.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        server = AsyncIOOSCUDPServer((self.ip, self.port), self.dispatcher,
+                                     self._loop)
+        transport, _ = await server.create_serve_endpoint()
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            transport.close()
+            self._closed = True
+            # Waits for the running handlers without blocking the loop,
+            # the timers firing meanwhile are called in the loop
+            await self._loop.run_in_executor(None, self._executor.shutdown)
+            # Lets the timers scheduled by the last handlers be registered,
+            # then fires all the pending timers
+            await asyncio.sleep(0)
+            self._timers_fired = True
+            for handle, callback, args in list(self._timers.values()):
+                handle.cancel()
+                callback(*args)
+            self._timers.clear()
+
+    def run(self, duration=None):
+        """
+        Runs the event loop and serves until stop() is called (or
+        Ctrl+C is pressed), or for duration seconds.
+        """
+        asyncio.run(self.serve(duration))
+
+    def stop(self):
+        """
+        Stops the server, can be called from any thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def stats(self):
+        """
+        Returns the number of messages received, decimated (replaced by a
+        newer message), dropped (backlog full) and handled, the max backlog
+        and the mean and max receive-to-handled latency in milliseconds.
+        """
+        with self._lock:
+            handled = self.handled
+            return {
+                "received": self.received,
+                "decimated": self.decimated,
+                "dropped": self.dropped,
+                "handled": handled,
+                "max_pending": self.max_pending_seen,
+                "latency_mean_ms": (1000 * self._latency_total / handled
+                                    if handled else 0.0),
+                "latency_max_ms": 1000 * self._latency_max,
+            }
+
+
+def send_packets(ip, port, address, rate=1000, seconds=5.0, noise=0.1):
+    """
+    Sends (x, y, z) accelerometer like packets to address at rate packets
+    per second, for seconds, returns the number of packets sent. The x
+    value alternates between 0.0 and 0.5 every 200 ms, plus gaussian noise.
+    """
+    client = SimpleUDPClient(ip, port)
+    period = 1.0 / rate
+    count = int(rate * seconds)
+    start = time.perf_counter()
+    for i in range(count):
+        # Waits for the packet time computed from the start, so the
+        # sender doesn't drift
+        delay = start + i * period - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        phase = i * period
+        roll = 0.5 if (phase / 0.2) % 2 >= 1 else 0.0
+        client.send_message(address, [roll + random.gauss(0.0, noise),
+                                      (phase % 2.0) - 1.0,
+                                      1.0])
+    return count
+
+
+def load_test(server, address="/accxyz", rate=1000, seconds=5.0):
+    """
+    Runs the server while a local sender replays accelerometer packets to
+    address at rate packets per second, for seconds, and prints the
+    server stats. The server must listen on a local address.
+    """
+    def sender():
+        # Leaves the server time to bind the port
+        time.sleep(0.2)
+        sent = send_packets("127.0.0.1", server.port, address, rate, seconds)
+        print(f"Sent {sent} packets at {rate} Hz")
+        time.sleep(0.5)
+        server.stop()
+
+    sender_thread = threading.Thread(target=sender, daemon=True)
+    sender_thread.start()
+    server.run()
+    sender_thread.join()
+    stats = server.stats()
+    print(f"Server stats: {stats}")
+    return stats
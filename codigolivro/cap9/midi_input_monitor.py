@@ -0,0 +1,157 @@
+"""
+midi_input_monitor.py
+
+An event-driven MIDI input monitor which dispatches incoming messages to
+registered handlers, instead of polling REAPER for every message.
+
+Two backends are available:
+- "mido": the MIDI input port is read directly with a mido callback, the
+  handlers are called from the backend thread as soon as a message arrives,
+  without any call through the reapy bridge.
+- "reaper": REAPER's MIDI input is polled, but each wakeup drains all the
+  pending messages before sleeping again, so the poll interval can be much
+  longer than 1 ms.
+
+The monitor measures the CPU usage of the process and the latency between
+the reception of a message and the end of its handlers (with the "reaper"
+backend, a message also waits up to poll_interval before being received).
+"""
+
+import threading
+import time
+
+import mido
+import reapy
+
+
+class MidiInputMonitor:
+
+    def __init__(self, backend="mido", port_name=None, device=0,
+                 poll_interval=0.005):
+        """
+        Creates the monitor.
+
+        backend: "mido" or "reaper" (see module docstring)
+        port_name: mido input port name, defaults to the first port
+        device: REAPER MIDI input device index, for the "reaper" backend
+        poll_interval: seconds between polls, for the "reaper" backend
+        """
+        self.backend = backend
+        self.port_name = port_name
+        self.device = device
+        self.poll_interval = poll_interval
+        self.handlers = []
+        self.system_handlers = []
+        self._port = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._count = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._start_wall = None
+        self._start_cpu = None
+
+    def add_handler(self, handler):
+        """
+        Registers a handler, called as handler(event, channel, data1, data2)
+        for each channel message, with event the status upper nibble
+        (0x90 Note On, 0x80 Note Off, 0xB0 Control Change...) and
+        channel from 1 to 16. System messages (status 0xF0 and above) have
+        no channel, see add_system_handler.
+        """
+        self.handlers.append(handler)
+
+    def add_system_handler(self, handler):
+        """
+        Registers a handler, called as handler(status_byte) for each system
+        message (0xF0 SysEx, 0xF8 Clock, 0xFE Active Sensing...).
+        """
+        self.system_handlers.append(handler)
+
+    def _dispatch(self, status_byte, data1, data2, received_time):
+        if status_byte < 0xF0:
+            event = status_byte & 0xF0
+            channel = (status_byte & 0x0F) + 1
+            for handler in self.handlers:
+                handler(event, channel, data1, data2)
+        else:
+            for handler in self.system_handlers:
+                handler(status_byte)
+
+        latency = time.perf_counter() - received_time
+        with self._lock:
+            self._count += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def _on_mido_message(self, msg):
+        received_time = time.perf_counter()
+        data = msg.bytes()
+        self._dispatch(data[0],
+                       data[1] if len(data) > 1 else 0,
+                       data[2] if len(data) > 2 else 0,
+                       received_time)
+
+    def _poll_reaper(self):
+        while not self._stop_event.is_set():
+            # Drains all the pending messages before sleeping again
+            while True:
+                res = reapy.RPR.GetMIDIInputMessage(self.device, 1024, 0)
+                if not res[0]:
+                    break
+                received_time = time.perf_counter()
+                msg = res[1]
+                if isinstance(msg, str):
+                    msg = [ord(char) for char in msg]
+                self._dispatch(msg[0],
+                               msg[1] if len(msg) > 1 else 0,
+                               msg[2] if len(msg) > 2 else 0,
+                               received_time)
+            self._stop_event.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Starts monitoring the MIDI input, returns immediately.
+        """
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        if self.backend == "mido":
+            port_name = self.port_name or mido.get_input_names()[0]
+            self._port = mido.open_input(port_name,
+                                         callback=self._on_mido_message)
+            print(f"Monitoring MIDI Input: {port_name}")
+        else:
+            self._thread = threading.Thread(target=self._poll_reaper,
+                                            daemon=True)
+            self._thread.start()
+            print(f"Monitoring REAPER MIDI Input on Device {self.device}...")
+
+    def stop(self):
+        """
+        Stops monitoring the MIDI input.
+        """
+        self._stop_event.set()
+        if self._port is not None:
+            self._port.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        """
+        Returns the number of messages, the CPU usage (percentage of one
+        core since start) and the mean and max input-to-handler latency
+        in milliseconds.
+        """
+        elapsed = time.perf_counter() - self._start_wall
+        cpu = time.process_time() - self._start_cpu
+        with self._lock:
+            count = self._count
+            latency_mean = self._latency_total / count if count else 0.0
+            latency_max = self._latency_max
+        return {
+            "messages": count,
+            "cpu_percent": 100.0 * cpu / elapsed if elapsed else 0.0,
+            "latency_mean_ms": latency_mean * 1000,
+            "latency_max_ms": latency_max * 1000,
+        }
@@ -0,0 +1,176 @@
+"""
+midi_output_queue.py
+
+A MIDI output queue which forwards messages to REAPER (StuffMIDIMessage)
+from a dedicated worker thread, so the MIDI input loop never waits for
+the reapy bridge.
+
+Messages arriving within a small window are coalesced and sent with a
+single call through the bridge (the whole batch runs inside REAPER), and
+Control Change messages superseded by a newer value for the same
+controller and channel in the same batch are dropped, so a CC sweep
+doesn't turn into hundreds of calls.
+
+The queue reports its depth (current and max) and the end-to-end latency
+between the put of a message and its arrival in REAPER. Run this module
+to check the coalescing of a chord and CC sweeps, without REAPER.
+"""
+
+import threading
+import time
+from collections import deque
+
+import reapy
+
+CONTROL_CHANGE = 0xB0
+
+
+@reapy.inside_reaper()
+def stuff_midi_messages(messages):
+    """
+    Sends all the (status, data1, data2) messages to REAPER's Virtual MIDI
+    Keyboard (mode 0), in a single call through the reapy bridge.
+    """
+    for status, data1, data2 in messages:
+        reapy.RPR.StuffMIDIMessage(0, status, data1, data2)
+
+
+def coalesce(messages):
+    """
+    Returns the (status, data1, data2) messages without the Control Change
+    messages superseded by a later message for the same channel and
+    controller, keeping the order of the other messages.
+    """
+    last_cc = {}
+    for index, (status, data1, data2) in enumerate(messages):
+        if status & 0xF0 == CONTROL_CHANGE:
+            last_cc[(status, data1)] = index
+    return [message for index, message in enumerate(messages)
+            if message[0] & 0xF0 != CONTROL_CHANGE
+            or last_cc[(message[0], message[1])] == index]
+
+
+class MidiOutputQueue:
+
+    def __init__(self, window=0.002, send=stuff_midi_messages):
+        """
+        Creates the queue, call start() to start the worker.
+
+        window: seconds to wait after the first message of a batch for
+        other messages to coalesce with
+        send: the function sending a list of (status, data1, data2) messages
+        """
+        self.window = window
+        self.send = send
+        # deque append and popleft are atomic, the producers never lock
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.sent = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_depth = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def put(self, status, data1, data2):
+        """
+        Queues a MIDI message to be sent to REAPER, returns immediately.
+        """
+        self._queue.append((time.perf_counter(), (status, data1, data2)))
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop_event.is_set() or self._queue:
+            self._wakeup.wait(0.1)
+            self._wakeup.clear()
+            if not self._queue:
+                continue
+            # Waits for the messages arriving right after this one
+            time.sleep(self.window)
+
+            batch = []
+            while self._queue:
+                batch.append(self._queue.popleft())
+            self.max_depth = max(self.max_depth, len(batch))
+            messages = coalesce([message for _, message in batch])
+            self.send(messages)
+
+            sent_time = time.perf_counter()
+            self.sent += len(messages)
+            self.dropped += len(batch) - len(messages)
+            self.batches += 1
+            for put_time, _ in batch:
+                latency = sent_time - put_time
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the worker, after sending the queued messages.
+        """
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        """
+        Returns the number of messages sent and dropped, the number of
+        batches, the current and max queue depth and the mean and max
+        end-to-end latency in milliseconds.
+        """
+        count = self.sent + self.dropped
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "latency_mean_ms": (1000 * self._latency_total / count
+                                if count else 0.0),
+            "latency_max_ms": 1000 * self._latency_max,
+        }
+
+
+def check_coalescing():
+    """
+    Queues a chord and two interleaved CC sweeps, and checks that the
+    queue sends the notes in order and only the last value of each
+    controller, prints the result and the queue stats.
+    """
+    batches = []
+    queue = MidiOutputQueue(send=batches.append)
+    chord = [(0x90, pitch, 100) for pitch in (60, 64, 67)]
+    messages = list(chord)
+    for value in range(128):
+        messages.append((CONTROL_CHANGE, 1, value))      # Modulation, ch 1
+        messages.append((CONTROL_CHANGE | 1, 1, 127 - value)) # Modulation, ch 2
+    messages.append((CONTROL_CHANGE, 7, 100))            # Volume, ch 1
+    messages.extend((0x80, pitch, 0) for pitch in (60, 64, 67))
+
+    # Queued before the worker starts, so they form a single batch
+    for message in messages:
+        queue.put(*message)
+    queue.start()
+    queue.stop()
+
+    sent = [message for batch in batches for message in batch]
+    expected = chord + [(CONTROL_CHANGE, 1, 127), (CONTROL_CHANGE | 1, 1, 0),
+                        (CONTROL_CHANGE, 7, 100)] + \
+               [(0x80, pitch, 0) for pitch in (60, 64, 67)]
+    coalesced = sent == expected and len(batches) == 1
+    print(f"{len(messages)} messages coalesced into {len(sent)}: "
+          f"{'OK' if coalesced else 'FAILED'}")
+    print(f"Output queue stats: {queue.stats()}")
+    return coalesced
+
+
+if __name__ == "__main__":
+    if not check_coalescing():
+        raise SystemExit(1)
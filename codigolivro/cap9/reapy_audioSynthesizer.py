@@ -14,6 +14,8 @@ import sys
 import os
 import mido
 
+from midi_output_queue import MidiOutputQueue
+
 # Constants for MIDI messages
 NOTE_ON = 0x90
 NOTE_OFF = 0x80
@@ -22,6 +24,10 @@ SAMPLE_FILE = "strings - A4.wav"
 TRACK_NAME = "Audio Synth"
 FX_NAME = "ReaSamplOmatic5000"
 
+# The notes for the sampler are sent by a worker thread, so reading the
+# controller never waits for REAPER (see midi_output_queue.py)
+output_queue = MidiOutputQueue()
+
 def setup_synth():
     """
     Sets up the REAPER track and FX for the synthesizer.
@@ -74,12 +80,12 @@ def setup_synth():
 def beginNote(channel, note, velocity):
     # Forward Note On
     status = NOTE_ON | (channel & 0x0F)
-    reapy.RPR.StuffMIDIMessage(0, status, note, velocity)
+    output_queue.put(status, note, velocity)
 
 def endNote(channel, note, velocity):
     # Forward Note Off
     status = NOTE_OFF | (channel & 0x0F)
-    reapy.RPR.StuffMIDIMessage(0, status, note, velocity)
+    output_queue.put(status, note, velocity)
 
 def main():
     try:
@@ -105,6 +111,7 @@ def main():
     print("If you don't hear sound, ensure the 'Audio Synth' track is Armed and Monitoring is ON.")
     print("Press Ctrl+C to stop.")
 
+    output_queue.start()
     try:
         with mido.open_input(port_name) as inport:
             for msg in inport:
@@ -120,6 +127,9 @@ def main():
         print("\nStopping audio synthesizer...")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        output_queue.stop()
+        print(f"Output queue stats: {output_queue.stats()}")
 
 if __name__ == "__main__":
     main()
@@ -14,6 +14,13 @@ Mapping:
 - X-Axis (Roll): Triggers a note if tilted enough.
 - Z-Axis (Shake): Controls velocity/loudness.
 
+The accelerometer frames go through a sensor stage (smoothing, hysteresis
+trigger, cooldown) processing them in blocks and only emitting the notes,
+and the note-offs are scheduled timers, so the server never blocks on a
+handler. Run with --raw to use the raw threshold callback instead, decimated
+to SENSOR_RATE messages per second, and with --load-test to replay 1 kHz
+accelerometer packets from a local sender (REAPER not needed).
+
 Ported from clementine.py (randomCirclesThroughOSCInput.py)
 """
 
@@ -21,14 +28,17 @@ import reapy
 import time
 import sys
 import random
-from pythonosc.dispatcher import Dispatcher
-from pythonosc.osc_server import BlockingOSCUDPServer
+from async_osc_server import AsyncOSCServer, load_test
+from midi_output_queue import MidiOutputQueue
+from sensor_stage import SensorStage
 
 # Constants
 TRIGGER_THRESHOLD = 0.3
 NOTE_ON = 0x90
 NOTE_OFF = 0x80
 COOLDOWN = 0.2 # Seconds between notes
+NOTE_LENGTH = 0.1 # Seconds before the Note Off
+SENSOR_RATE = 50 # Max accelerometer messages handled per second
 
 # Scale (Major) - Relative semitones
 MAJOR_SCALE_INTERVALS = [0, 2, 4, 5, 7, 9, 11, 12]
@@ -36,6 +46,10 @@ BASE_NOTE = 60 # C4
 
 last_note_time = 0
 
+# Sends the MIDI messages to REAPER from a worker thread
+output_queue = MidiOutputQueue()
+server = None
+
 def map_value(value, in_min, in_max, out_min, out_max):
     return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
@@ -62,6 +76,53 @@ def get_scale_note(pitch_val):
     note_num = BASE_NOTE + (octave_offset * 12) + MAJOR_SCALE_INTERVALS[interval_idx]
     return int(note_num)
 
+def play_note(roll, pitch_val, shake_val):
+    """
+    Plays a note from the accelerometer values:
+    - pitch (y) -> Note
+    - shake (z) -> Velocity
+    """
+    # Calculate Params
+    note = get_scale_note(pitch_val)
+    
+    # Shake usually is 1g (approx 1.0) +/- shake. 
+    # Let's map magnitude of Shake to velocity.
+    # Assuming Z is gravity + shake. simple abs mapping.
+    # Range approx 0.8 to 3.0 in original script
+    val_abs = abs(shake_val)
+    velocity = int(map_value(val_abs, 0.5, 3.0, 50, 127))
+    velocity = max(0, min(127, velocity))
+
+    # Play Note
+    # We send Note On, then schedule the Note Off to simulate a "plucked" or triggered sound
+    # that doesn't hang forever.
+    
+    status_on = NOTE_ON | 0 # Channel 1
+    output_queue.put(status_on, note, velocity)
+    print(f"Trigger! Note: {note} Vel: {velocity} (Roll: {roll:.2f} Pitch: {pitch_val:.2f})")
+    
+    # The Note Off is a timer on the server, not a sleep, so the next
+    # sensor readings keep being received.
+    status_off = NOTE_OFF | 0
+    server.call_later(NOTE_LENGTH, output_queue.put, status_off, note, 0)
+
+def play_events(events):
+    """
+    Plays the (time, smoothed frame) events of the sensor stage.
+    """
+    for _, (roll, pitch_val, shake_val) in events:
+        play_note(roll, pitch_val, shake_val)
+
+# Smooths the frames and triggers on the roll (x), with hysteresis. The
+# frames still pending max_latency after the last packet are processed by
+# the stage's timer, which plays their events.
+sensor_stage = SensorStage(channels=3,
+                           trigger_channel=0,
+                           on_threshold=TRIGGER_THRESHOLD,
+                           off_threshold=TRIGGER_THRESHOLD - 0.1,
+                           cooldown=COOLDOWN,
+                           on_events=play_events)
+
 def process_accel(address, *args):
     """
     Callback for /accxyz
@@ -70,6 +131,19 @@ def process_accel(address, *args):
     - roll (x) -> Trigger
     - pitch (y) -> Note
     - shake (z) -> Velocity
+
+    Each frame goes through the sensor stage (smoothing, hysteresis trigger
+    on the roll, cooldown), which only returns the frames triggering a note.
+    """
+    if len(args) < 3:
+        return
+
+    play_events(sensor_stage.push(args))
+
+def process_accel_raw(address, *args):
+    """
+    Callback for /accxyz without the sensor stage: raw threshold on each
+    frame and cooldown (run with --raw).
     """
     global last_note_time
 
@@ -88,35 +162,50 @@ def process_accel(address, *args):
     # Check Trigger (Roll)
     if abs(roll) > TRIGGER_THRESHOLD:
         last_note_time = current_time
-        
-        # Calculate Params
-        note = get_scale_note(pitch_val)
-        
-        # Shake usually is 1g (approx 1.0) +/- shake. 
-        # Let's map magnitude of Shake to velocity.
-        # Assuming Z is gravity + shake. simple abs mapping.
-        # Range approx 0.8 to 3.0 in original script
-        val_abs = abs(shake_val)
-        velocity = int(map_value(val_abs, 0.5, 3.0, 50, 127))
-        velocity = max(0, min(127, velocity))
-
-        # Play Note
-        # We send Note On, sleep briefly, then Note Off to simulate a "plucked" or triggered sound
-        # that doesn't hang forever.
-        
-        status_on = NOTE_ON | 0 # Channel 1
-        reapy.RPR.StuffMIDIMessage(0, status_on, note, velocity)
-        print(f"Trigger! Note: {note} Vel: {velocity} (Roll: {roll:.2f} Pitch: {pitch_val:.2f})")
-        
-        # Optional: Blocking sleep to define note length. 
-        # Since this is a Blocking Server, this will delay next sensor reading, 
-        # effectively rate limiting "machine gun" notes too.
-        time.sleep(0.1) 
-        
-        status_off = NOTE_OFF | 0
-        reapy.RPR.StuffMIDIMessage(0, status_off, note, 0)
+        play_note(roll, pitch_val, shake_val)
+
+def map_handler(raw):
+    """
+    Maps /accxyz on the server, the raw callback being decimated to
+    SENSOR_RATE, while the sensor stage receives all the frames.
+    """
+    if raw:
+        server.map("/accxyz", process_accel_raw, rate=SENSOR_RATE)
+    else:
+        server.map("/accxyz", process_accel)
+
+def run_load_test(raw, seconds=5.0):
+    """
+    Replays 1 kHz accelerometer packets through the callback, the MIDI
+    messages being counted instead of sent to REAPER.
+    """
+    global output_queue, server
+
+    output_queue = MidiOutputQueue(send=lambda messages: None)
+    server = AsyncOSCServer("127.0.0.1", 57110)
+    map_handler(raw)
+
+    output_queue.start()
+    try:
+        stats = load_test(server, "/accxyz", rate=1000, seconds=seconds)
+    finally:
+        play_events(sensor_stage.flush())
+        output_queue.stop()
+    notes = output_queue.stats()["sent"] // 2
+    print(f"{'Raw callback' if raw else 'Sensor stage'}: "
+          f"{stats['handled'] / seconds:.0f} packets/sec handled, "
+          f"{notes} notes")
+    if not raw:
+        print(f"Sensor stage stats: {sensor_stage.stats()}")
 
 def main():
+    global server
+
+    raw = "--raw" in sys.argv
+    if "--load-test" in sys.argv:
+        run_load_test(raw)
+        return
+
     try:
         # Check connection
         project = reapy.Project()
@@ -128,10 +217,8 @@ def main():
     ip = "0.0.0.0"
     port = 57110
 
-    dispatcher = Dispatcher()
-    dispatcher.map("/accxyz", process_accel)
-
-    server = BlockingOSCUDPServer((ip, port), dispatcher)
+    server = AsyncOSCServer(ip, port)
+    map_handler(raw)
     print(f"Serving at {ip}:{port}")
     print("Listening for OSC messages on /accxyz (Args: x, y, z)")
     print("Hold your device like an airplane!")
@@ -140,12 +227,18 @@ def main():
     print(" - Shake (Z-axis) for volume.")
     print("Press Ctrl+C to stop.")
 
+    output_queue.start()
     try:
-        server.serve_forever()
+        server.run()
     except KeyboardInterrupt:
         print("\nStopping OSC Server...")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        # The frames received just before stopping
+        play_events(sensor_stage.flush())
+        output_queue.stop()
+        print(f"Server stats: {server.stats()}")
 
 if __name__ == "__main__":
     main()
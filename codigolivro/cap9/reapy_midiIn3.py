@@ -1,6 +1,9 @@
 import reapy
 import time
 import sys
+import mido
+
+from midi_input_monitor import MidiInputMonitor
 
 def printEvent(event, channel, data1, data2):
     """
@@ -16,67 +19,53 @@ def printEvent(event, channel, data1, data2):
     else:
         print(f"Got another MIDI message: {event} {channel} {data1} {data2}")
 
+def printSystemMessage(status_byte):
+    """
+    Callback function that prints the system messages, which have no channel.
+    """
+    print(f"Got System Message: {status_byte}")
+
 def main():
     """
-    Main function to monitor MIDI input using REAPER API (via reapy).
+    Main function to monitor MIDI input.
+    By default, the MIDI input port is read directly with mido (event-driven,
+    no calls to REAPER), run with "--reaper" to poll REAPER's MIDI input
+    instead (as the original script did, but draining all pending messages
+    at each poll).
     """
-    try:
-        # Check connection
-        project = reapy.Project()
-        print("Connected to REAPER.")
-    except Exception:
-        print("Error: Could not connect to REAPER.")
+    backend = "reaper" if "--reaper" in sys.argv else "mido"
+
+    if backend == "reaper":
+        try:
+            # Check connection
+            project = reapy.Project()
+            print("Connected to REAPER.")
+        except Exception:
+            print("Error: Could not connect to REAPER.")
+            return
+    elif not mido.get_input_names():
+        print("No MIDI input ports found.")
         return
 
-    print("Monitoring MIDI Input on Device 0...")
+    monitor = MidiInputMonitor(backend=backend)
+    monitor.add_handler(printEvent)
+    monitor.add_system_handler(printSystemMessage)
     print("Press Ctrl+C to stop.")
 
     try:
+        monitor.start()
         while True:
-            # Poll for MIDI messages from hardware input 0
-            # GetMIDIInputMessage returns (retval, buffer, timestamp)
-            # We use a buffer size of 1024 (though messages are usually short)
-            # The '0' is the device index. Change if needed.
-            res = reapy.RPR.GetMIDIInputMessage(0, 1024, 0)
-            
-            if res[0]: # retval is True if message received
-                msg = res[1]
-                
-                # REAPER returns a string of bytes or byte-like object
-                # We need to handle potential string/byte differences in Python versions/REAPER
-                if isinstance(msg, str):
-                   # In some reapy versions/contexts it might be a string
-                   status_byte = ord(msg[0])
-                   data1 = ord(msg[1]) if len(msg) > 1 else 0
-                   data2 = ord(msg[2]) if len(msg) > 2 else 0
-                else: 
-                   # bytes or bytearray
-                   status_byte = msg[0]
-                   data1 = msg[1] if len(msg) > 1 else 0
-                   data2 = msg[2] if len(msg) > 2 else 0
-
-                # Extract channel (lower nibble) and event type (upper nibble)
-                # Channel is 0-15 in data, but usually 1-16 in display
-                channel = (status_byte & 0x0F) + 1
-                event_type = status_byte & 0xF0
-
-                # Filter out active sensing (0xFE) or clock (0xF8) if necessary, 
-                # but original script used ALL_EVENTS.
-                # Only System Realtime messages (0xF8-0xFF) don't have channels.
-                # For this script we focus on channel messages.
-                if status_byte < 0xF0:
-                    printEvent(event_type, channel, data1, data2)
-                else:
-                    # System messages
-                    print(f"Got System Message: {status_byte}")
-
-            # Short sleep to prevent high CPU usage
-            time.sleep(0.001)
-
+            # The messages are dispatched by the monitor, we only wake up
+            # to print the stats
+            time.sleep(10)
+            print(f"Monitor stats: {monitor.stats()}")
     except KeyboardInterrupt:
         print("\nStopping MIDI monitor...")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        monitor.stop()
+        print(f"Monitor stats: {monitor.stats()}")
 
 if __name__ == "__main__":
     main()
@@ -13,10 +13,16 @@ import time
 import sys
 import mido
 
+from midi_output_queue import MidiOutputQueue
+
 # Constants for MIDI messages
 NOTE_ON = 0x90
 NOTE_OFF = 0x80
 
+# The notes are sent to the Virtual MIDI Keyboard by a worker thread, a
+# chord played at once goes to REAPER in a single call
+output_queue = MidiOutputQueue()
+
 def beginNote(channel, note, velocity):
     """
     Start this note on internal MIDI synthesizer.
@@ -32,7 +38,7 @@ def beginNote(channel, note, velocity):
     
     # StuffMIDIMessage(mode, msg1, msg2, msg3)
     # mode 0: Virtual MIDI Keyboard
-    reapy.RPR.StuffMIDIMessage(0, status, note, velocity)
+    output_queue.put(status, note, velocity)
     # print(f"Note On: {note} vel: {velocity} ch: {channel}")
 
 def endNote(channel, note, velocity):
@@ -43,7 +49,7 @@ def endNote(channel, note, velocity):
     # Ensure channel is 0-15
     status = NOTE_OFF | (channel & 0x0F)
     
-    reapy.RPR.StuffMIDIMessage(0, status, note, velocity)
+    output_queue.put(status, note, velocity)
     # print(f"Note Off: {note} vel: {velocity} ch: {channel}")
 
 
@@ -71,6 +77,7 @@ def main():
     print("Ensure a track is armed and monitoring the Virtual MIDI Keyboard or All Inputs.")
     print("Press Ctrl+C to stop.")
 
+    output_queue.start()
     try:
         with mido.open_input(port_name) as inport:
             for msg in inport:
@@ -86,6 +93,9 @@ def main():
         print("\nStopping MIDI synthesizer...")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        output_queue.stop()
+        print(f"Output queue stats: {output_queue.stats()}")
 
 if __name__ == "__main__":
     main()
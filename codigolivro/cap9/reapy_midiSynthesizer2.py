@@ -13,6 +13,8 @@ import time
 import sys
 import mido
 
+from midi_output_queue import MidiOutputQueue
+
 # Constants for MIDI messages
 NOTE_ON = 0x90
 NOTE_OFF = 0x80
@@ -22,19 +24,23 @@ PROGRAM_CHANGE = 0xC0
 # (same as data1 value sent when turning this knob on the MIDI controller)
 KNOB_CC = 16
 
+# The notes and program changes are sent by a worker thread, in order,
+# so turning the knob while playing never delays the notes
+output_queue = MidiOutputQueue()
+
 def beginNote(channel, note, velocity):
     """
     Start this note on internal MIDI synthesizer.
     """
     status = NOTE_ON | (channel & 0x0F)
-    reapy.RPR.StuffMIDIMessage(0, status, note, velocity)
+    output_queue.put(status, note, velocity)
 
 def endNote(channel, note, velocity):
     """
     Stop this note on internal MIDI synthesizer.
     """
     status = NOTE_OFF | (channel & 0x0F)
-    reapy.RPR.StuffMIDIMessage(0, status, note, velocity)
+    output_queue.put(status, note, velocity)
 
 def changeInstrument(channel, instrument):
     """
@@ -44,7 +50,7 @@ def changeInstrument(channel, instrument):
     status = PROGRAM_CHANGE | (channel & 0x0F)
     
     # StuffMIDIMessage(mode, msg1, msg2, msg3)
-    reapy.RPR.StuffMIDIMessage(0, status, instrument, 0)
+    output_queue.put(status, instrument, 0)
     
     print(f"Instrument set to Program #{instrument}")
 
@@ -73,6 +79,7 @@ def main():
     print("Ensure a track with a GM-compatible synth is armed.")
     print("Press Ctrl+C to stop.")
 
+    output_queue.start()
     try:
         with mido.open_input(port_name) as inport:
             for msg in inport:
@@ -91,6 +98,9 @@ def main():
         print("\nStopping MIDI synthesizer...")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        output_queue.stop()
+        print(f"Output queue stats: {output_queue.stats()}")
 
 if __name__ == "__main__":
     main()
@@ -4,14 +4,18 @@ reapy_pianoSimpleOSC.py
 Demonstrates how to build a simple piano instrument playable
 through sending OSC messages (e.g. from TouchOSC app).
 
+The OSC messages are received by an asyncio server, the key handlers run
+in a worker thread and the MIDI messages are sent to REAPER from the
+output queue, so a slow REAPER call never delays the next key.
+
 Ported from pianoSimpleOSC.py
 """
 
 import reapy
 import time
 import sys
-from pythonosc.dispatcher import Dispatcher
-from pythonosc.osc_server import BlockingOSCUDPServer
+from async_osc_server import AsyncOSCServer
+from midi_output_queue import MidiOutputQueue
 
 # Constants for MIDI messages
 NOTE_ON = 0x90
@@ -35,6 +39,9 @@ NOTE_MAP = {
     "/1/push13": 72  # C5
 }
 
+# Sends the MIDI messages to REAPER from a worker thread
+output_queue = MidiOutputQueue()
+
 def play_note(address, *args):
     """
     Callback function called when a message about an OSC piano key arrives.
@@ -53,12 +60,12 @@ def play_note(address, *args):
     if value == 1.0:
         # Note On
         status = NOTE_ON  # Channel 1 (0)
-        reapy.RPR.StuffMIDIMessage(0, status, note, 100)
+        output_queue.put(status, note, 100)
         print(f"Note On: {note} (Address: {address})")
     else:
         # Note Off
         status = NOTE_OFF # Channel 1 (0)
-        reapy.RPR.StuffMIDIMessage(0, status, note, 0)
+        output_queue.put(status, note, 0)
         print(f"Note Off: {note} (Address: {address})")
 
 def main():
@@ -73,24 +80,26 @@ def main():
     ip = "0.0.0.0"
     port = 8000
 
-    dispatcher = Dispatcher()
+    server = AsyncOSCServer(ip, port)
     # Register handlers for all keys in our map
     for address in NOTE_MAP.keys():
-        dispatcher.map(address, play_note)
-
-    server = BlockingOSCUDPServer((ip, port), dispatcher)
+        server.map(address, play_note)
     print(f"Serving at {ip}:{port}")
     print("Use an OSC client (e.g., TouchOSC) to send messages.")
     print("Addresses: /1/push1 (C4) to /1/push13 (C5)")
     print("Values: 1.0 (Note On), 0.0 (Note Off)")
     print("Press Ctrl+C to stop.")
 
+    output_queue.start()
     try:
-        server.serve_forever()
+        server.run()
     except KeyboardInterrupt:
         print("\nStopping OSC Server...")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        output_queue.stop()
+        print(f"Server stats: {server.stats()}")
 
 if __name__ == "__main__":
     main()
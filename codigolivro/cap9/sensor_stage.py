@@ -0,0 +1,173 @@
+"""
+sensor_stage.py
+
+A streaming DSP stage turning high-rate sensor frames (e.g. accelerometer
+x, y, z from an OSC app) into musical events.
+
+Receiving a frame only copies it into a preallocated buffer. The pending
+frames are processed together, as a NumPy block, when the block is full
+or when the oldest pending frame waits for more than max_latency (checked
+when a frame is pushed, and by a timer when the stream stops, which
+passes its events to on_events):
+- moving average smoothing over the last window frames,
+- hysteresis trigger on one channel: an event when its magnitude rises
+  above on_threshold, re-armed only once it falls below off_threshold,
+  so a noisy signal around the threshold doesn't retrigger,
+- cooldown between two events.
+
+Only the events are returned, with the smoothed frame at the event time,
+so a 1 kHz sensor produces a few calls to REAPER instead of one per packet.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class SensorStage:
+
+    def __init__(self, channels=3, window=8, block_size=32,
+                 max_latency=0.02, trigger_channel=0, on_threshold=0.3,
+                 off_threshold=0.2, cooldown=0.2, on_events=None):
+        """
+        Creates the stage.
+
+        channels: number of values in a frame
+        window: number of frames of the moving average
+        block_size: max number of frames processed together
+        max_latency: max seconds a frame waits before being processed
+        trigger_channel: index of the channel triggering the events
+        on_threshold, off_threshold: hysteresis thresholds on the magnitude
+        of the smoothed trigger channel
+        cooldown: min seconds between two events
+        on_events: function called with the events of the frames processed
+        by the max_latency timer, when no frame is pushed in time (if None,
+        there is no timer, call flush() to process the pending frames)
+        """
+        self.channels = channels
+        self.window = window
+        self.block_size = block_size
+        self.max_latency = max_latency
+        self.trigger_channel = trigger_channel
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.cooldown = cooldown
+        self.on_events = on_events
+        # The first window - 1 rows hold the last frames of the previous
+        # block, so the moving average continues across blocks
+        self._history = window - 1
+        self._frames = np.zeros((self._history + block_size, channels))
+        self._times = np.zeros(block_size)
+        self._count = 0
+        self._started = False
+        self._active = False
+        self._last_event_time = -np.inf
+        self._lock = threading.Lock()
+        # The timer flushing the pending frames after max_latency, and the
+        # id of the pending block it's for (a newer id cancels it)
+        self._timer = None
+        self._deadline_id = 0
+        self.received = 0
+        self.blocks = 0
+        self.events = 0
+
+    def push(self, frame, timestamp=None):
+        """
+        Adds a frame, returns the list of (time, smoothed frame) events
+        detected if the pending frames were processed, else an empty list.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self._lock:
+            if not self._started:
+                # Starts the moving average from the first frame
+                self._frames[:self._history] = frame[:self.channels]
+                self._started = True
+            self._frames[self._history + self._count] = frame[:self.channels]
+            self._times[self._count] = timestamp
+            self._count += 1
+            self.received += 1
+            if (self._count < self.block_size
+                    and timestamp - self._times[0] < self.max_latency):
+                if self._count == 1 and self.on_events is not None:
+                    self._start_timer()
+                return []
+            return self._process()
+
+    def _start_timer(self):
+        # Called with the lock held, for the first pending frame
+        self._deadline_id += 1
+        self._timer = threading.Timer(self.max_latency, self._on_deadline,
+                                      (self._deadline_id,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_deadline(self, deadline_id):
+        with self._lock:
+            if deadline_id != self._deadline_id or not self._count:
+                # The block was processed in the meantime
+                return
+            events = self._process()
+        if events:
+            self.on_events(events)
+
+    def flush(self):
+        """
+        Processes the pending frames, returns the detected events.
+        """
+        with self._lock:
+            return self._process() if self._count else []
+
+    def _process(self):
+        # Cancels the timer of the pending block
+        self._deadline_id += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        count = self._count
+        frames = self._frames[:self._history + count]
+        times = self._times[:count]
+
+        # Moving average from the cumulative sum over history + block
+        cumsum = np.cumsum(frames, axis=0)
+        cumsum = np.vstack([np.zeros((1, self.channels)), cumsum])
+        smoothed = (cumsum[self.window:] - cumsum[:-self.window]) / self.window
+
+        # Hysteresis: 1 above on, 0 below off, -1 (keep the state) between,
+        # the state of each frame being the last 1 or 0 before it
+        magnitude = np.abs(smoothed[:, self.trigger_channel])
+        marks = np.where(magnitude > self.on_threshold, 1,
+                         np.where(magnitude < self.off_threshold, 0, -1))
+        marks = np.concatenate([[int(self._active)], marks])
+        indices = np.where(marks >= 0, np.arange(len(marks)), 0)
+        states = marks[np.maximum.accumulate(indices)]
+        rising = np.flatnonzero((states[1:] == 1) & (states[:-1] == 0))
+        self._active = bool(states[-1])
+
+        events = []
+        for index in rising:
+            if times[index] - self._last_event_time >= self.cooldown:
+                self._last_event_time = times[index]
+                events.append((times[index], smoothed[index].copy()))
+
+        # Keeps the last frames as the history of the next block
+        if self._history:
+            self._frames[:self._history] = frames[-self._history:]
+        self._count = 0
+        self.blocks += 1
+        self.events += len(events)
+        return events
+
+    def stats(self):
+        """
+        Returns the number of frames received, blocks processed and events
+        emitted.
+        """
+        with self._lock:
+            return {
+                "received": self.received,
+                "blocks": self.blocks,
+                "events": self.events,
+            }
@@ -0,0 +1,134 @@
+"""
+scales.py
+
+Scale quantization shared by the generators of the different chapters.
+
+For each scale (root and mode), a 128-entry lookup table maps every MIDI
+pitch to its quantized pitch: the nearest scale note in the same octave
+(relative to the root), the lower one on a tie. The tables are built once
+and cached by scale, so quantizing a note is a single lookup, and a whole
+array of pitches is quantized with a single NumPy indexing operation.
+
+To use it from a chapter directory, import the shared.py of the chapter
+first (see shared_modules.py):
+
+    import shared
+    from scales import quantize
+"""
+
+import time
+from functools import lru_cache
+from numbers import Number
+
+import numpy as np
+
+# Intervals (semitones from the root) of the scale modes
+MODES = {
+    "major": (0, 2, 4, 5, 7, 9, 11),
+    "minor": (0, 2, 3, 5, 7, 8, 10),
+    "dorian": (0, 2, 3, 5, 7, 9, 10),
+    "phrygian": (0, 1, 3, 5, 7, 8, 10),
+    "lydian": (0, 2, 4, 6, 7, 9, 11),
+    "mixolydian": (0, 2, 4, 5, 7, 9, 10),
+    "locrian": (0, 1, 3, 5, 6, 8, 10),
+    "major_pentatonic": (0, 2, 4, 7, 9),
+    "minor_pentatonic": (0, 3, 5, 7, 10),
+    "chromatic": tuple(range(12)),
+}
+
+
+def get_intervals(mode):
+    """
+    Returns the intervals of the mode, given by name (see MODES) or as
+    a list of intervals (the octave, 12, is ignored).
+    """
+    if isinstance(mode, str):
+        return MODES[mode]
+    return tuple(sorted({interval % 12 for interval in mode}))
+
+
+@lru_cache(maxsize=None)
+def _get_table(root, intervals):
+    pitches = np.arange(128)
+    octaves, notes = np.divmod(pitches - root, 12)
+    # Distance of each note to each interval, argmin takes the first
+    # (lower) interval on a tie, like min(scale, key=...)
+    intervals = np.array(intervals)
+    closest = intervals[np.argmin(np.abs(notes[:, None] - intervals[None, :]),
+                                  axis=1)]
+    table = np.clip(octaves * 12 + closest + root, 0, 127)
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def _get_tuple(root, intervals):
+    # For the single pitch lookups, faster than indexing the array
+    return tuple(_get_table(root, intervals).tolist())
+
+
+def get_table(root=0, mode="major"):
+    """
+    Returns the (cached, read-only) 128-entry lookup table mapping each
+    MIDI pitch to its quantized pitch in the scale.
+
+    root: the root pitch class, 0 for C
+    mode: the mode name (see MODES) or a list of intervals
+    """
+    return _get_table(root % 12, get_intervals(mode))
+
+
+def quantize(pitches, root=0, mode="major"):
+    """
+    Quantizes a MIDI pitch (an int, returns an int) or an array of MIDI
+    pitches (returns an array) to the scale. The pitches are clipped
+    to 0-127.
+    """
+    if isinstance(pitches, Number):
+        table = _get_tuple(root % 12, get_intervals(mode))
+        return table[min(127, max(0, int(pitches)))]
+    table = get_table(root, mode)
+    return table[np.clip(np.asarray(pitches, dtype=np.int64), 0, 127)]
+
+
+def get_scale_notes(root=0, mode="major", bottom_midi=0, top_midi=127):
+    """
+    Returns the list of the scale notes between bottom_midi and top_midi
+    (inclusive).
+    """
+    table = get_table(root, mode)
+    pitches = np.arange(bottom_midi, top_midi + 1)
+    return pitches[table[pitches] == pitches].tolist()
+
+
+def benchmark(size=1000000):
+    """
+    Quantizes size random pitches with min(scale, key=...) per note, with
+    a lookup per note and with a single array lookup, and prints the times.
+    """
+    scale = list(MODES["major"])
+    pitches = np.random.randint(0, 128, size)
+    pitch_list = pitches.tolist()
+
+    start = time.perf_counter()
+    expected = [(pitch // 12) * 12 + min(scale, key=lambda x: abs(x - pitch % 12))
+                for pitch in pitch_list]
+    min_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    looked_up = [quantize(pitch) for pitch in pitch_list]
+    lookup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    quantized = quantize(pitches)
+    array_time = time.perf_counter() - start
+
+    identical = expected == looked_up == quantized.tolist()
+    print(f"Quantized {size} pitches, identical: {identical}, "
+          f"min() per note {min_time:.3f} s, "
+          f"lookup per note {lookup_time:.3f} s, "
+          f"array lookup {array_time:.4f} s")
+
+
+if __name__ == "__main__":
+    benchmark()
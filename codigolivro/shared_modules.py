@@ -0,0 +1,29 @@
+"""
+shared_modules.py
+
+The directories of the modules shared by the chapters, added to sys.path
+when this module is imported:
+- codigolivro: scales.py
+- codigolivro/cap9: midi_output_queue.py (the MIDI output queue of the
+  chapter 9 instruments, also used by the chapter 8 instruments)
+
+The chapter directories using them have a shared.py, which finds this
+module from the chapter directory, so a script only needs:
+
+    import shared
+    from scales import quantize
+"""
+
+import os
+import sys
+
+CODIGOLIVRO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SHARED_DIRS = [
+    CODIGOLIVRO_DIR,
+    os.path.join(CODIGOLIVRO_DIR, "cap9"),
+]
+
+for directory in SHARED_DIRS:
+    if directory not in sys.path:
+        sys.path.append(directory)
@@ -1,24 +1,84 @@
+import hashlib
+import json
 import os
 import time
-from typing import Optional, Any, List
+from multiprocessing.pool import Pool
+from typing import Optional, Any, Dict, List, Tuple
 
 import librosa
 import librosa.display
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import LinearSegmentedColormap
-from skimage.transform import resize
+from scipy.ndimage import gaussian_filter1d
+
+from encoding_store import EncodingStore, INDEX_FILENAME
 
 
 def timestretch(encodings: np.ndarray,
-                factor: float) -> np.ndarray:
+                factor: float,
+                anti_aliasing: bool = True,
+                float32: bool = False) -> np.ndarray:
   """
   Returns the given encodings timestretch by the given factor.
 
+  The whole (batch, time, channels) tensor is stretched at once using
+  linear interpolation along the time axis, with the same sample mapping,
+  edge handling and anti-aliasing as skimage.transform.resize (order 1,
+  mode "reflect", which corresponds to the "mirror" mode of scipy.ndimage).
+  Since the interpolation is linear, there is no need to normalize the
+  encodings beforehand. See check_timestretch for the comparison with the
+  previous skimage implementation.
+
   :param encodings: the encodings
   :param factor: the timestretch factor, bigger is faster, 1 is idempotent
-  :return:
+  :param anti_aliasing: applies a gaussian filter on the time axis before
+  downsampling (factor smaller than 1) to avoid aliasing artifacts
+  :param float32: computes the result in float32 instead of float64,
+  reusing the intermediate buffers in place, halving the memory usage
+  :return: the timestretched encodings
+  :raises ValueError: if the factor isn't positive, or if the stretched
+  encodings would have no time step
   """
+  if not factor > 0:
+    raise ValueError(f"The timestretch factor must be positive: {factor}")
+  dtype = np.float32 if float32 else np.float64
+  encodings = np.asarray(encodings, dtype=dtype)
+  num_steps = encodings.shape[1]
+  num_steps_stretched = int(num_steps * factor)
+  if num_steps_stretched == 0:
+    raise ValueError(f"The timestretch factor {factor} is too small for "
+                     f"{num_steps} time steps, the result would be empty")
+  scale = num_steps / num_steps_stretched
+
+  if anti_aliasing and scale > 1:
+    encodings = gaussian_filter1d(encodings,
+                                  sigma=(scale - 1) / 2,
+                                  axis=1,
+                                  mode="mirror")
+
+  # Maps each output step to its (fractional) position in the input,
+  # mirroring the positions that fall outside of the input at the edges
+  positions = (np.arange(num_steps_stretched, dtype=dtype) + 0.5) * scale - 0.5
+  np.abs(positions, out=positions)
+  np.minimum(positions, 2 * (num_steps - 1) - positions, out=positions)
+  lower = positions.astype(np.intp)
+  upper = np.minimum(lower + 1, num_steps - 1)
+  weights = (positions - lower)[np.newaxis, :, np.newaxis]
+
+  # Interpolates as lower + (upper - lower) * weights, in place
+  timestretches = encodings[:, lower]
+  deltas = encodings[:, upper]
+  deltas -= timestretches
+  deltas *= weights
+  timestretches += deltas
+  return timestretches
+
+
+def _timestretch_resize(encodings: np.ndarray,
+                        factor: float) -> np.ndarray:
+  # The previous implementation, resizing each example with skimage
+  from skimage.transform import resize
   min_encodings, max_encodings = encodings.min(), encodings.max()
   encodings_norms = (encodings - min_encodings) / (
       max_encodings - min_encodings)
@@ -34,32 +94,91 @@ def timestretch(encodings: np.ndarray,
   return np.array(timestretches)
 
 
+def check_timestretch(batch_size: int = 64,
+                      num_steps: int = 125,
+                      num_channels: int = 16,
+                      factors: List[float] = (0.37, 0.5, 0.8, 1, 1.25, 2.3),
+                      repeat: int = 10) -> bool:
+  """
+  Checks that timestretch returns the same encodings as the previous
+  skimage implementation (skimage.transform.resize on each example), on
+  random encodings of the given shape (the default being 64 four-second
+  encodings), and prints the max difference and the time taken by both.
+
+  :param batch_size: the number of encodings
+  :param num_steps: the number of time steps of each encoding
+  :param num_channels: the number of channels of each encoding
+  :param factors: the timestretch factors to check
+  :param repeat: the number of runs timed for each implementation
+  :return: True if the results are equivalent (float64)
+  """
+  random_state = np.random.RandomState(42)
+  encodings = random_state.randn(batch_size, num_steps, num_channels)
+  equivalent = True
+  for factor in factors:
+    expected = _timestretch_resize(encodings, factor)
+    timestretches = timestretch(encodings, factor)
+    timestretches_float32 = timestretch(encodings, factor, float32=True)
+    difference = np.abs(timestretches - expected).max()
+    difference_float32 = np.abs(timestretches_float32 - expected).max()
+    times = []
+    for stretch in (_timestretch_resize,
+                    timestretch,
+                    lambda *args: timestretch(*args, float32=True)):
+      start_time = time.perf_counter()
+      for _ in range(repeat):
+        stretch(encodings, factor)
+      times.append((time.perf_counter() - start_time) / repeat * 1000)
+    print(f"Factor {factor}: {expected.shape} max difference "
+          f"{difference:.1e} (float32 {difference_float32:.1e}), "
+          f"skimage {times[0]:.2f} ms, vectorized {times[1]:.2f} ms "
+          f"(float32 {times[2]:.2f} ms)")
+    equivalent = (equivalent
+                  and timestretches.shape == expected.shape
+                  and np.allclose(timestretches, expected, atol=1e-9))
+  return equivalent
+
+
+def _get_encoding_name(filename: str) -> str:
+  return filename[:-len(".npy")] if filename.endswith(".npy") else filename
+
+
 def save_encoding(encodings: List[np.ndarray],
                   filenames: List[str],
                   output_dir: str = "encodings") -> None:
   """
-  Saves the given encodings in the given output_dir with
-  their corresponding filenames.
+  Saves the given encodings in the EncodingStore of the given output_dir
+  with their corresponding filenames. The encodings already present in the
+  store are kept as is, since the store is append-only.
 
   :param encodings: the list of encodings to save
   :param filenames: the list of filename to save the encodings with,
-  will add ".npy" if not present
+  the ".npy" extension is removed if present
   :param output_dir: the output dir
   """
-  os.makedirs(output_dir, exist_ok=True)
-  for encoding, filename in zip(encodings, filenames):
-    filename = filename if filename.endswith(".npy") else filename + ".npy"
-    np.save(os.path.join(output_dir, filename), encoding)
+  store = EncodingStore(output_dir)
+  names = [_get_encoding_name(filename) for filename in filenames]
+  new_encodings = [(encoding, name)
+                   for encoding, name in zip(encodings, names)
+                   if name not in store]
+  if new_encodings:
+    store.extend(*zip(*new_encodings))
 
 
 def load_encodings(filenames: List[str],
                    input_dir: str = "encodings") -> List[np.ndarray]:
   """
-  Loads the encodings from the given filenames and the given input_dir.
+  Loads the encodings from the given filenames and the given input_dir, as
+  read-only views on the EncodingStore of the input_dir, or from the
+  ".npy" files of the input_dir if there is no store.
 
   :param filenames: the list of filename to load the encodings from
   :param input_dir: the input dir
   """
+  if os.path.exists(os.path.join(input_dir, INDEX_FILENAME)):
+    store = EncodingStore(input_dir)
+    return [store.load(_get_encoding_name(filename))
+            for filename in filenames]
   encodings = []
   for filename in filenames:
     encoding = np.load(os.path.join(input_dir, filename))
@@ -88,10 +207,147 @@ def save_encoding_plot(encoding: np.ndarray,
   plt.close()
 
 
+RAINBOWGRAM_PEAK = 70
+
+PREVIEW_DPI = 100
+
+# The colormap used to mask the rainbowgram dphase with its magnitude,
+# created once and passed directly to matshow (not registered globally)
+_RAINBOWGRAM_COLOR_MASK = LinearSegmentedColormap("ColorMask", {
+  "red": ((0.0, 0.0, 0.0),
+          (1.0, 0.0, 0.0)),
+  "green": ((0.0, 0.0, 0.0),
+            (1.0, 0.0, 0.0)),
+  "blue": ((0.0, 0.0, 0.0),
+           (1.0, 0.0, 0.0)),
+  "alpha": ((0.0, 1.0, 1.0),
+            (1.0, 0.0, 0.0))
+})
+
+
+def _get_spectrogram_cqt_params() -> Dict[str, Any]:
+  # Pitch min and max corresponds to the pitch min and max
+  # of the wavenet training checkpoint
+  pitch_min = np.min(36)
+  pitch_max = np.max(84)
+  frequency_min = librosa.midi_to_hz(pitch_min)
+  frequency_max = 2 * librosa.midi_to_hz(pitch_max)
+  octaves = int(np.ceil(np.log2(frequency_max) - np.log2(frequency_min)))
+  bins_per_octave = 32
+  num_bins = int(bins_per_octave * octaves)
+  hop_length = 2048
+  return {"hop_length": hop_length,
+          "fmin": float(frequency_min),
+          "n_bins": num_bins,
+          "bins_per_octave": bins_per_octave}
+
+
+def _get_rainbowgram_cqt_params() -> Dict[str, Any]:
+  # Configuration from https://arxiv.org/abs/1704.01279
+  # and https://gist.github.com/jesseengel/e223622e255bd5b8c9130407397a0494
+  hop_length = 256
+  over_sample = 4
+  res_factor = 0.8
+  octaves = 6
+  notes_per_octave = 10
+  bins_per_octave = int(notes_per_octave * over_sample)
+  num_bins = int(octaves * notes_per_octave * over_sample)
+  return {"hop_length": hop_length,
+          "bins_per_octave": bins_per_octave,
+          "n_bins": num_bins,
+          "filter_scale": res_factor,
+          "fmin": float(librosa.note_to_hz("C2"))}
+
+
+def _compute_spectrogram(audio: np.ndarray,
+                         sample_rate: int,
+                         cqt_params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+  constant_q_transform = librosa.cqt(audio, sr=sample_rate, **cqt_params)
+  db = librosa.amplitude_to_db(np.abs(constant_q_transform), ref=np.max)
+  return {"db": db}
+
+
+def _compute_rainbowgram(audio: np.ndarray,
+                         sample_rate: int,
+                         cqt_params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+  peak = RAINBOWGRAM_PEAK
+  constant_q_transform = librosa.cqt(audio, sr=sample_rate, **cqt_params)
+  mag, phase = librosa.core.magphase(constant_q_transform)
+  phase_angle = np.angle(phase)
+  phase_unwrapped = np.unwrap(phase_angle)
+  dphase = phase_unwrapped[:, 1:] - phase_unwrapped[:, :-1]
+  dphase = np.concatenate([phase_unwrapped[:, 0:1], dphase], axis=1) / np.pi
+  mag = (librosa.amplitude_to_db(mag,
+                                 amin=1e-13,
+                                 top_db=peak,
+                                 ref=np.max) / peak) + 1
+  return {"mag": mag, "dphase": dphase}
+
+
+SPECTRAL_FEATURES = {
+  "spectrogram": (_compute_spectrogram, _get_spectrogram_cqt_params),
+  "rainbowgram": (_compute_rainbowgram, _get_rainbowgram_cqt_params),
+}
+
+
+def get_spectral_features(audio: Any,
+                          kind: str,
+                          sample_rate: int = 16000,
+                          cache_dir: Optional[str] = None) \
+    -> Dict[str, np.ndarray]:
+  """
+  Returns the spectral features of the given audio, the dB-scaled CQT
+  magnitude ("db") for the "spectrogram" kind, or the normalized
+  CQT magnitude and phase derivative ("mag" and "dphase") for the
+  "rainbowgram" kind.
+
+  If a cache_dir is given, the features are saved there, keyed by the hash
+  of the audio, the sample rate and the CQT parameters, and are returned
+  memory-mapped (read-only) when already present.
+
+  :param audio: the audio content, as a floating point time series
+  :param kind: the kind of features, "spectrogram" or "rainbowgram"
+  :param sample_rate: the sampling rate of the file
+  :param cache_dir: the optional cache dir
+  """
+  compute_features, get_cqt_params = SPECTRAL_FEATURES[kind]
+  cqt_params = get_cqt_params()
+  if not cache_dir:
+    return compute_features(audio, sample_rate, cqt_params)
+
+  audio = np.ascontiguousarray(audio)
+  key = hashlib.sha1(audio.tobytes())
+  key.update(json.dumps({"kind": kind,
+                         "dtype": audio.dtype.str,
+                         "sample_rate": sample_rate,
+                         "cqt_params": cqt_params},
+                        sort_keys=True).encode())
+  key = key.hexdigest()
+  names = ("db",) if kind == "spectrogram" else ("mag", "dphase")
+  paths = {name: os.path.join(cache_dir, f"{key}_{name}.npy")
+           for name in names}
+  if all(os.path.exists(path) for path in paths.values()):
+    return {name: np.load(path, mmap_mode="r")
+            for name, path in paths.items()}
+
+  features = compute_features(audio, sample_rate, cqt_params)
+  os.makedirs(cache_dir, exist_ok=True)
+  for name, path in paths.items():
+    # Writes to a temporary file first, another process might be reading
+    # or writing the same features
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as temp_file:
+      np.save(temp_file, features[name])
+    os.replace(temp_path, path)
+  return features
+
+
 def save_spectrogram_plot(audio: Any,
                           sample_rate: int = 16000,
                           filename: Optional[str] = None,
-                          output_dir: str = "output") -> None:
+                          output_dir: str = "output",
+                          cache_dir: Optional[str] = None,
+                          preview: bool = False) -> None:
   """
   Saves the spectrogram plot of the given audio to the given filename in
   the given output_dir. The resulting plot is a Constant-Q transform (CQT)
@@ -102,44 +358,35 @@ def save_spectrogram_plot(audio: Any,
   :param sample_rate: the sampling rate of the file
   :param filename: the optional filename, set to "%Y-%m-%d_%H%M%S".png if None
   :param output_dir: the output dir
+  :param cache_dir: the optional spectral features cache dir,
+  see get_spectral_features
+  :param preview: renders at a low resolution (PREVIEW_DPI), which is much
+  faster than the default 600 dpi
   """
   os.makedirs(output_dir, exist_ok=True)
 
-  # Pitch min and max corresponds to the pitch min and max
-  # of the wavenet training checkpoint
-  pitch_min = np.min(36)
-  pitch_max = np.max(84)
-  frequency_min = librosa.midi_to_hz(pitch_min)
-  frequency_max = 2 * librosa.midi_to_hz(pitch_max)
-  octaves = int(np.ceil(np.log2(frequency_max) - np.log2(frequency_min)))
-  bins_per_octave = 32
-  num_bins = int(bins_per_octave * octaves)
-  hop_length = 2048
-  constant_q_transform = librosa.cqt(
-    audio,
-    sr=sample_rate,
-    hop_length=hop_length,
-    fmin=frequency_min,
-    n_bins=num_bins,
-    bins_per_octave=bins_per_octave)
+  features = get_spectral_features(audio,
+                                   "spectrogram",
+                                   sample_rate=sample_rate,
+                                   cache_dir=cache_dir)
   plt.figure()
   plt.axis("off")
-  librosa.display.specshow(
-    librosa.amplitude_to_db(constant_q_transform, ref=np.max),
-    sr=sample_rate)
+  librosa.display.specshow(features["db"], sr=sample_rate)
 
   if not filename:
     date_and_time = time.strftime("%Y-%m-%d_%H%M%S")
     filename = f"{date_and_time}.png"
   path = os.path.join(output_dir, filename)
-  plt.savefig(fname=path, dpi=600)
+  plt.savefig(fname=path, dpi=PREVIEW_DPI if preview else 600)
   plt.close()
 
 
 def save_rainbowgram_plot(audio,
                           sample_rate: int = 16000,
                           filename: str = None,
-                          output_dir: str = "output") -> None:
+                          output_dir: str = "output",
+                          cache_dir: Optional[str] = None,
+                          preview: bool = False) -> None:
   """
   Saves the spectrogram plot of the given audio to the given filename in
   the given output_dir. The resulting plot is a Constant-Q transform (CQT)
@@ -153,59 +400,90 @@ def save_rainbowgram_plot(audio,
   :param sample_rate: the sampling rate of the file
   :param filename: the optional filename, set to "%Y-%m-%d_%H%M%S".png if None
   :param output_dir: the output dir
+  :param cache_dir: the optional spectral features cache dir,
+  see get_spectral_features
+  :param preview: renders at a low resolution (PREVIEW_DPI), which is much
+  faster than the default 600 dpi
   """
   os.makedirs(output_dir, exist_ok=True)
 
-  # Configuration from https://arxiv.org/abs/1704.01279
-  # and https://gist.github.com/jesseengel/e223622e255bd5b8c9130407397a0494
-  peak = 70
-  hop_length = 256
-  over_sample = 4
-  res_factor = 0.8
-  octaves = 6
-  notes_per_octave = 10
-  color_dict = {
-    "red": ((0.0, 0.0, 0.0),
-            (1.0, 0.0, 0.0)),
-    "green": ((0.0, 0.0, 0.0),
-              (1.0, 0.0, 0.0)),
-    "blue": ((0.0, 0.0, 0.0),
-             (1.0, 0.0, 0.0)),
-    "alpha": ((0.0, 1.0, 1.0),
-              (1.0, 0.0, 0.0))
-  }
-  color_mask = LinearSegmentedColormap("ColorMask", color_dict)
-  plt.register_cmap(cmap=color_mask)
+  features = get_spectral_features(audio,
+                                   "rainbowgram",
+                                   sample_rate=sample_rate,
+                                   cache_dir=cache_dir)
 
   # Init subplots, there is only one plot but we have to use 2 cmap,
   # which means 2 call to ax.matshow that wouldn"t work with a single plot.
   fig, ax = plt.subplots()
   plt.axis("off")
 
-  bins_per_octave = int(notes_per_octave * over_sample)
-  num_bins = int(octaves * notes_per_octave * over_sample)
-  constant_q_transform = librosa.cqt(audio,
-                                     sr=sample_rate,
-                                     hop_length=hop_length,
-                                     bins_per_octave=bins_per_octave,
-                                     n_bins=num_bins,
-                                     filter_scale=res_factor,
-                                     fmin=librosa.note_to_hz("C2"))
-  mag, phase = librosa.core.magphase(constant_q_transform)
-  phase_angle = np.angle(phase)
-  phase_unwrapped = np.unwrap(phase_angle)
-  dphase = phase_unwrapped[:, 1:] - phase_unwrapped[:, :-1]
-  dphase = np.concatenate([phase_unwrapped[:, 0:1], dphase], axis=1) / np.pi
-  mag = (librosa.amplitude_to_db(mag,
-                                 amin=1e-13,
-                                 top_db=peak,
-                                 ref=np.max) / peak) + 1
-  ax.matshow(dphase[::-1, :], cmap=plt.cm.rainbow)
-  ax.matshow(mag[::-1, :], cmap=color_mask)
+  ax.matshow(features["dphase"][::-1, :], cmap=plt.cm.rainbow)
+  ax.matshow(features["mag"][::-1, :], cmap=_RAINBOWGRAM_COLOR_MASK)
 
   if not filename:
     date_and_time = time.strftime("%Y-%m-%d_%H%M%S")
     filename = f"{date_and_time}.png"
   path = os.path.join(output_dir, filename)
-  plt.savefig(fname=path, dpi=600)
+  plt.savefig(fname=path, dpi=PREVIEW_DPI if preview else 600)
   plt.close(fig)
+
+
+def _save_plot_worker(task: Tuple[str, str, int, str, Optional[str], bool]) \
+    -> str:
+  audio_path, kind, sample_rate, output_dir, cache_dir, preview = task
+  audio, _ = librosa.load(audio_path, sr=sample_rate)
+  filename = os.path.splitext(os.path.basename(audio_path))[0] + ".png"
+  save_plot = (save_spectrogram_plot if kind == "spectrogram"
+               else save_rainbowgram_plot)
+  save_plot(audio,
+            sample_rate=sample_rate,
+            filename=filename,
+            output_dir=output_dir,
+            cache_dir=cache_dir,
+            preview=preview)
+  return os.path.join(output_dir, filename)
+
+
+def save_plots(input_dir: str,
+               kind: str = "spectrogram",
+               sample_rate: int = 16000,
+               output_dir: str = "output",
+               cache_dir: Optional[str] = "cache",
+               preview: bool = False,
+               num_workers: Optional[int] = None) -> List[str]:
+  """
+  Saves the spectrogram or rainbowgram plots of all the WAV files in the
+  given input_dir to the given output_dir, with the same filenames and
+  "png" as extension. The spectral features are computed and plotted in a
+  pool of worker processes, and cached in the cache_dir.
+
+  :param input_dir: the input dir containing the WAV files
+  :param kind: the kind of plot, "spectrogram" or "rainbowgram"
+  :param sample_rate: the sampling rate to load the files with
+  :param output_dir: the output dir
+  :param cache_dir: the optional spectral features cache dir,
+  see get_spectral_features
+  :param preview: renders at a low resolution, see save_spectrogram_plot
+  :param num_workers: the number of worker processes, defaults to the
+  number of CPUs
+  :return: the paths of the plots
+  """
+  if kind not in SPECTRAL_FEATURES:
+    raise ValueError(f"Unknown kind of plot: {kind}")
+  tasks = [(os.path.join(input_dir, filename), kind, sample_rate,
+            output_dir, cache_dir, preview)
+           for filename in sorted(os.listdir(input_dir))
+           if filename.lower().endswith(".wav")]
+  paths = []
+  start_time = time.time()
+  with Pool(num_workers, initializer=plt.switch_backend,
+            initargs=("Agg",)) as pool:
+    for path in pool.imap_unordered(_save_plot_worker, tasks):
+      paths.append(path)
+      print(f"Saved plot {len(paths)}/{len(tasks)}: {path}")
+  print(f"Saved {len(paths)} plots in {time.time() - start_time:.1f} sec")
+  return paths
+
+
+if __name__ == "__main__":
+  print(f"Equivalent: {check_timestretch()}")
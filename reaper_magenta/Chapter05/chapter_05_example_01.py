@@ -4,16 +4,24 @@ This example shows how to use NSynth to interpolate between pairs of sounds.
 VERSION: Magenta 2.1.2
 """
 
+import multiprocessing
 import os
 import tarfile
-from typing import List, Tuple
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 import tensorflow as tf
 from magenta.models.nsynth import utils
 from magenta.models.nsynth.wavenet import fastgen
+from magenta.models.nsynth.wavenet.h512_bo16 import Config
 from six.moves import urllib
 
+from audio_utils import save_encoding
+from encoding_store import EncodingStore
+
 FLAGS = tf.compat.v1.app.flags.FLAGS
 
 tf.compat.v1.app.flags.DEFINE_string(
@@ -87,34 +95,106 @@ def encode(wav_filenames: List[str],
   return encodings
 
 
+def _get_encoding_pairs(encodings_name: List[str]) \
+    -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Returns the indexes of the first and second encodings of each ordered pair
+  of encodings with different names, in the order of a nested loop.
+
+  :param encodings_name: the list of encodings names
+  """
+  names = np.array(encodings_name, dtype=object)
+  different = names[:, np.newaxis] != names[np.newaxis, :]
+  indexes1, indexes2 = np.nonzero(different)
+  return indexes1, indexes2
+
+
+def _get_encoding_mix_name(encoding1_name: str, encoding2_name: str) -> str:
+  """
+  Merges the beginning of the track names of the two encodings.
+
+  :param encoding1_name: the name of the first encoding
+  :param encoding2_name: the name of the second encoding
+  """
+  if "_" in encoding1_name and "_" in encoding2_name:
+    return (f"{encoding1_name.split('_', 1)[0]}_"
+            f"{encoding2_name.split('_', 1)[0]}")
+  return f"{encoding1_name}_{encoding2_name}"
+
+
+def _mix_encodings(encodings: np.ndarray,
+                   indexes1: np.ndarray,
+                   indexes2: np.ndarray,
+                   ratio: float) -> np.ndarray:
+  """
+  Interpolates the encodings at indexes1 with the encodings at indexes2,
+  in a single array operation.
+
+  :param encodings: the encodings, as a (encodings, time, channels) array
+  :param indexes1: the indexes of the first encoding of each pair
+  :param indexes2: the indexes of the second encoding of each pair
+  :param ratio: the interpolation ratio, 0 gives the first encoding and 1
+  gives the second encoding
+  """
+  encodings_mix = encodings[indexes1] * (1 - ratio)
+  encodings_mix += encodings[indexes2] * ratio
+  return encodings_mix
+
+
 def mix_encoding_pairs(encodings: List[np.ndarray],
-                       encodings_name: List[str]) \
+                       encodings_name: List[str],
+                       ratio: float = 0.5) \
     -> Tuple[np.ndarray, List[str]]:
   """
-  Mixes each elements of the encodings two by two, by adding the encodings
-  together and returning them, with their resulting mixed filename.
+  Mixes each elements of the encodings two by two, by interpolating the
+  encodings together and returning them, with their resulting mixed filename.
+
+  All the mixes are computed at once, see iterate_encoding_pairs to compute
+  them in batches for a large number of encodings.
+
+  :param encodings: the list of encodings
+  :param encodings_name: the list of encodings names
+  :param ratio: the interpolation ratio, 0 gives the first encoding and 1
+  gives the second encoding, 0.5 averages the pair
+  """
+  encodings = np.asarray(encodings)
+  indexes1, indexes2 = _get_encoding_pairs(encodings_name)
+  encodings_mix = _mix_encodings(encodings, indexes1, indexes2, ratio)
+  encodings_mix_name = [_get_encoding_mix_name(encodings_name[index1],
+                                               encodings_name[index2])
+                        for index1, index2 in zip(indexes1, indexes2)]
+  return encodings_mix, encodings_mix_name
+
+
+def iterate_encoding_pairs(encodings: List[np.ndarray],
+                           encodings_name: List[str],
+                           batch_size: int = 16,
+                           ratio: float = 0.5) \
+    -> Iterator[Tuple[np.ndarray, List[str]]]:
+  """
+  Same as mix_encoding_pairs but lazily yields the mixes in batches of at
+  most batch_size, so that the memory stays bounded for a large number of
+  encodings (N encodings makes N * (N - 1) mixes).
 
   :param encodings: the list of encodings
   :param encodings_name: the list of encodings names
+  :param batch_size: the maximum number of mixes per batch
+  :param ratio: the interpolation ratio, see mix_encoding_pairs
   """
-  encodings_mix = []
-  encodings_mix_name = []
-  # Takes the pair of encodings two by two
-  for encoding1, encoding1_name in zip(encodings, encodings_name):
-    for encoding2, encoding2_name in zip(encodings, encodings_name):
-      if encoding1_name == encoding2_name:
-        continue
-      # Adds the encodings together
-      encoding_mix = encoding1 + encoding2 / 2.0
-      encodings_mix.append(encoding_mix)
-      # Merges the beginning of the track names
-      if "_" in encoding1_name and "_" in encoding2_name:
-        encoding_name = (f"{encoding1_name.split('_', 1)[0]}_"
-                         f"{encoding2_name.split('_', 1)[0]}")
-      else:
-        encoding_name = f"{encoding1_name}_{encoding2_name}"
-      encodings_mix_name.append(encoding_name)
-  return np.array(encodings_mix), encodings_mix_name
+  encodings = np.asarray(encodings)
+  indexes1, indexes2 = _get_encoding_pairs(encodings_name)
+  for start in range(0, len(indexes1), batch_size):
+    batch_indexes1 = indexes1[start:start + batch_size]
+    batch_indexes2 = indexes2[start:start + batch_size]
+    encodings_mix = _mix_encodings(encodings,
+                                   batch_indexes1,
+                                   batch_indexes2,
+                                   ratio)
+    encodings_mix_name = [_get_encoding_mix_name(encodings_name[index1],
+                                                 encodings_name[index2])
+                          for index1, index2 in zip(batch_indexes1,
+                                                    batch_indexes2)]
+    yield encodings_mix, encodings_mix_name
 
 
 def synthesize(encodings_mix: np.ndarray,
@@ -138,19 +218,147 @@ def synthesize(encodings_mix: np.ndarray,
                      save_paths=encodings_mix_name)
 
 
+def synthesize_batches(batches: Iterable[Tuple[np.ndarray, List[str]]],
+                       checkpoint: str = "checkpoints/wavenet-ckpt/"
+                                         "model.ckpt-200000") -> None:
+  """
+  Synthetizes the batches of encodings one after the other, so that only
+  a single batch is in memory at a time. See synthesize.
+
+  :param batches: the (encodings_mix, encodings_mix_name) batches to synth,
+  see iterate_encoding_pairs
+  :param checkpoint: the checkpoint folder
+  """
+  for encodings_mix, encodings_mix_name in batches:
+    synthesize(encodings_mix, encodings_mix_name, checkpoint=checkpoint)
+
+
+def _init_synthesize_worker() -> None:
+  tf.compat.v1.disable_v2_behavior()
+  tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.WARN)
+
+
+def _synthesize_worker(task: Tuple[np.ndarray, str, str]) \
+    -> Tuple[int, str, int, float]:
+  """
+  Synthetizes a single (encoding_mix, path, checkpoint) task, returning the
+  worker pid, the path, the number of samples generated and the elapsed time.
+  """
+  encoding_mix, path, checkpoint = task
+  start_time = time.time()
+  fastgen.synthesize(encoding_mix[np.newaxis],
+                     checkpoint_path=checkpoint,
+                     save_paths=[path])
+  num_samples = encoding_mix.shape[0] * Config().ae_hop_length
+  return os.getpid(), path, num_samples, time.time() - start_time
+
+
+def synthesize_parallel(batches: Iterable[Tuple[np.ndarray, List[str]]],
+                        num_workers: Optional[int] = None,
+                        checkpoint: str = "checkpoints/wavenet-ckpt/"
+                                          "model.ckpt-200000",
+                        output_dir: str = os.path.join("output", "nsynth"),
+                        max_pending: Optional[int] = None) -> None:
+  """
+  Synthetizes the batches of encodings using a pool of worker processes,
+  each encoding being synthesized on its own by a worker. The encodings of
+  all the batches are fed to the workers as a single stream, so a worker
+  starts the next encoding as soon as it is done, without waiting for the
+  rest of its batch. Each WAV file is written as soon as it is completed,
+  and its name is recorded in the "completed.txt" file of the output_dir,
+  so that a rerun skips it (the WAV files are saved periodically during
+  synthesis, so an existing file might be incomplete).
+
+  :param batches: the (encodings_mix, encodings_mix_name) batches to synth,
+  see iterate_encoding_pairs and mix_encoding_pairs
+  :param num_workers: the number of worker processes, defaults to the
+  number of CPUs
+  :param checkpoint: the checkpoint folder
+  :param output_dir: the output dir
+  :param max_pending: the max number of encodings sent to the workers and
+  not completed yet, defaults to twice the number of workers, which bounds
+  the number of batches in memory
+  """
+  os.makedirs(output_dir, exist_ok=True)
+  completed_path = os.path.join(output_dir, "completed.txt")
+  completed = set()
+  if os.path.exists(completed_path):
+    with open(completed_path) as completed_file:
+      completed = set(line.strip() for line in completed_file)
+
+  num_workers = num_workers or os.cpu_count()
+  max_pending = max_pending or 2 * num_workers
+  # The pool reads the tasks as fast as it can, each task waits for a
+  # slot, released when a task is completed
+  slots = threading.Semaphore(max_pending)
+  stopped = False
+
+  def iterate_tasks() -> Iterator[Tuple[np.ndarray, str, str]]:
+    for encodings_mix, encodings_mix_name in batches:
+      for encoding_mix, encoding_mix_name in zip(encodings_mix,
+                                                 encodings_mix_name):
+        if encoding_mix_name in completed:
+          continue
+        slots.acquire()
+        if stopped:
+          return
+        yield (encoding_mix,
+               os.path.join(output_dir, encoding_mix_name + ".wav"),
+               checkpoint)
+
+  worker_stats = defaultdict(lambda: [0, 0.0])
+  # Tensorflow doesn't support being forked after import, we spawn the
+  # workers instead
+  context = multiprocessing.get_context("spawn")
+  with context.Pool(num_workers,
+                    initializer=_init_synthesize_worker) as pool, \
+      open(completed_path, "a") as completed_file:
+    try:
+      # A single stream of tasks, one encoding per task since each
+      # synthesis takes minutes
+      for pid, path, num_samples, elapsed in \
+          pool.imap_unordered(_synthesize_worker, iterate_tasks(),
+                              chunksize=1):
+        slots.release()
+        encoding_mix_name = os.path.splitext(os.path.basename(path))[0]
+        completed_file.write(encoding_mix_name + "\n")
+        completed_file.flush()
+        completed.add(encoding_mix_name)
+        worker_stats[pid][0] += num_samples
+        worker_stats[pid][1] += elapsed
+        print(f"Synthesized {path} on worker {pid} "
+              f"({int(num_samples / elapsed)} samples/sec)")
+    finally:
+      # Unblocks the task iteration if a task failed, the pool waits for
+      # it when terminated
+      stopped = True
+      slots.release(max_pending)
+
+  for pid, (num_samples, elapsed) in worker_stats.items():
+    print(f"Worker {pid}: {num_samples} samples in {int(elapsed)} sec "
+          f"({int(num_samples / elapsed)} samples/sec)")
+
+
 def app(unused_argv):
   # Downloads and extracts the checkpoint to "checkpoints/wavenet-ckpt"
   download_checkpoint("wavenet-ckpt")
 
-  # Encodes the wav files into 4 encodings (and saves them for later use)
-  encodings = encode(WAV_FILENAMES)
+  # Encodes the wav files that aren't already in the encoding store, and
+  # saves them for later use
+  store = EncodingStore("encodings")
+  wav_filenames = [wav_filename for wav_filename in WAV_FILENAMES
+                   if wav_filename not in store]
+  save_encoding(encode(wav_filenames), wav_filenames)
+
+  # Loads the 4 encodings as a single array, a read-only view on the store
+  store.refresh()
+  encodings = store.load_batch(WAV_FILENAMES)
 
-  # Mix the 4 encodings pairs into 12 encodings
-  encodings_mix, encodings_mix_name = mix_encoding_pairs(encodings,
-                                                         WAV_FILENAMES)
+  # Mix the 4 encodings pairs into 12 encodings, in batches
+  batches = iterate_encoding_pairs(encodings, WAV_FILENAMES)
 
-  # Synthesize the 12 encodings into wavs
-  synthesize(encodings_mix, encodings_mix_name)
+  # Synthesize the 12 encodings into wavs, using all the CPUs
+  synthesize_parallel(batches)
 
 
 if __name__ == "__main__":
@@ -8,18 +8,23 @@ VERSION: Magenta 2.1.2
 import os
 import time
 import zipfile
+from typing import Tuple
 
 import numpy as np
 import tensorflow as tf
 from magenta.models.gansynth.lib import flags as lib_flags
 from magenta.models.gansynth.lib import model as lib_model
-from magenta.models.gansynth.lib.generate_util import combine_notes
+from magenta.models.gansynth.lib.generate_util import MAX_NOTE_LENGTH
+from magenta.models.gansynth.lib.generate_util import MAX_VELOCITY
+from magenta.models.gansynth.lib.generate_util import get_envelope
 from magenta.models.gansynth.lib.generate_util import get_random_instruments
 from magenta.models.gansynth.lib.generate_util import get_z_notes
 from magenta.models.gansynth.lib.generate_util import load_midi
 from magenta.models.gansynth.lib.generate_util import save_wav
+from magenta.models.gansynth.lib.generate_util import slerp
 from six.moves import urllib
 
+from audio_mixer import mix
 from audio_utils import save_spectrogram_plot
 
 FLAGS = tf.compat.v1.app.flags.FLAGS
@@ -67,6 +72,28 @@ def get_midi_notes(midi_filename: str = "cs1-1pre-short.mid") -> dict:
   return notes
 
 
+def _get_note_snippet(audio_note: np.ndarray,
+                      start_time: float,
+                      end_time: float,
+                      sample_rate: int = 16000) -> np.ndarray:
+  """
+  Returns the audio note with its amplitude envelope applied and normalized,
+  as in combine_notes, the velocity is applied by the mixer.
+  """
+  envelope = get_envelope(end_time - start_time, sr=sample_rate)
+  snippet = audio_note[:len(envelope)] * envelope
+  snippet /= snippet.max()
+  return snippet
+
+
+def _get_note_offsets(notes: dict, sample_rate: int = 16000) -> np.ndarray:
+  return (notes["start_times"] * sample_rate).astype(np.int64)
+
+
+def _get_note_gains(notes: dict) -> np.ndarray:
+  return notes["velocities"] / MAX_VELOCITY
+
+
 def generate_audio(notes: dict,
                    seconds_per_instrument: int = 5,
                    batch_size: int = 16,
@@ -98,12 +125,122 @@ def generate_audio(notes: dict,
   # Generate audio for each note
   audio_notes = model.generate_samples_from_z(z_notes, notes["pitches"])
 
-  # Make a single audio clip
-  audio_clip = combine_notes(audio_notes,
-                             notes["start_times"],
-                             notes["end_times"],
-                             notes["velocities"])
+  # Make a single audio clip, with the same envelope and normalization
+  # as magenta.models.gansynth.lib.generate_util.combine_notes
+  snippets = [_get_note_snippet(audio_note, start_time, end_time)
+              for audio_note, start_time, end_time
+              in zip(audio_notes, notes["start_times"], notes["end_times"])]
+  clip_length = notes["end_times"].max() + MAX_NOTE_LENGTH
+  audio_clip = mix(snippets,
+                   _get_note_offsets(notes),
+                   _get_note_gains(notes),
+                   length=int(clip_length) * 16000)
+  audio_clip /= audio_clip.max()
+  audio_clip /= 2.0
+
+  return audio_clip
+
+
+def _get_unique_note_keys(notes: dict,
+                          t_instruments: np.ndarray,
+                          interpolation_steps: int) \
+    -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Returns the unique (instrument index, interpolation step, pitch) keys for
+  the notes, and the index of the key of each note. The interpolation
+  between the instruments surrounding each note is quantized to the given
+  number of steps, so that close notes of the same pitch share their key.
+
+  :param notes: the notes dictionary, see generate_audio
+  :param t_instruments: the instrument times, see get_random_instruments
+  :param interpolation_steps: the number of interpolation steps between
+  two instruments
+  """
+  start_times = notes["start_times"]
+  # Same instrument lookup as get_z_notes, for all the notes at once
+  indexes = np.searchsorted(t_instruments, start_times, side="left") - 1
+  indexes[indexes == t_instruments.size - 1] -= 1
+  t_left = t_instruments[indexes]
+  t_right = t_instruments[indexes + 1]
+  interps = (start_times - t_left) / (t_right - t_left)
+  steps = np.round(interps * interpolation_steps).astype(np.int64)
+  keys = np.stack([indexes, steps, notes["pitches"]], axis=1)
+  unique_keys, note_keys = np.unique(keys, axis=0, return_inverse=True)
+  return unique_keys, note_keys.reshape(-1)
+
+
+def generate_audio_streaming(notes: dict,
+                             seconds_per_instrument: int = 5,
+                             batch_size: int = 16,
+                             interpolation_steps: int = 16,
+                             checkpoint_dir: str = "checkpoints/"
+                                                   "acoustic_only",
+                             sample_rate: int = 16000) -> np.ndarray:
+  """
+  Same as generate_audio, but each unique (latent instrument, pitch) pair
+  is generated only once, in batches of batch_size, and the notes using
+  it are mixed into a preallocated audio clip as soon as its batch is
+  generated. The memory usage doesn't depend on the number of notes, and
+  repeated pitches are only generated once.
+
+  :param notes: the notes dictionary, must come
+  from magenta.models.gansynth.lib.generate_util.load_midi
+  :param seconds_per_instrument: the number of seconds for each instrument
+  :param batch_size: the batch size for the model, also the number of
+  unique pairs generated at a time
+  :param interpolation_steps: the number of interpolation steps between two
+  instruments, a bigger value is closer to generate_audio, but has less
+  duplicated pairs
+  :param checkpoint_dir: the checkpoint folder
+  :param sample_rate: the sample rate of the model
+  """
+  flags = lib_flags.Flags({"batch_size_schedule": [batch_size]})
+  model = lib_model.Model.load_from_path(checkpoint_dir, flags)
+
+  # Distribute latent vectors linearly in time
+  z_instruments, t_instruments = get_random_instruments(
+    model,
+    notes["end_times"][-1],
+    secs_per_instrument=seconds_per_instrument)
 
+  # Groups the notes by their (latent instrument, pitch) pair
+  unique_keys, note_keys = _get_unique_note_keys(notes,
+                                                 t_instruments,
+                                                 interpolation_steps)
+  notes_order = np.argsort(note_keys, kind="stable")
+  notes_bounds = np.searchsorted(note_keys[notes_order],
+                                 np.arange(len(unique_keys) + 1))
+  print(f"Generating {len(unique_keys)} unique pairs "
+        f"for {len(note_keys)} notes")
+
+  note_offsets = _get_note_offsets(notes, sample_rate=sample_rate)
+  note_gains = _get_note_gains(notes)
+  clip_length = notes["end_times"].max() + MAX_NOTE_LENGTH
+  audio_clip = np.zeros(int(clip_length) * sample_rate, dtype=np.float32)
+  for batch_start in range(0, len(unique_keys), batch_size):
+    batch_keys = unique_keys[batch_start:batch_start + batch_size]
+    z_batch = np.vstack([slerp(z_instruments[index],
+                               z_instruments[index + 1],
+                               step / interpolation_steps)
+                         for index, step, _ in batch_keys])
+    audio_batch = model.generate_samples_from_z(z_batch, batch_keys[:, 2])
+    snippets, snippets_notes = [], []
+    for key_offset, audio_note in enumerate(audio_batch):
+      key = batch_start + key_offset
+      for note in notes_order[notes_bounds[key]:notes_bounds[key + 1]]:
+        snippets.append(_get_note_snippet(audio_note,
+                                          notes["start_times"][note],
+                                          notes["end_times"][note],
+                                          sample_rate=sample_rate))
+        snippets_notes.append(note)
+    mix(snippets,
+        note_offsets[snippets_notes],
+        note_gains[snippets_notes],
+        out=audio_clip)
+
+  # Normalize
+  audio_clip /= audio_clip.max()
+  audio_clip /= 2.0
   return audio_clip
 
 
@@ -135,7 +272,7 @@ def app(unused_argv):
   notes = get_midi_notes()
 
   # Generates the audio clip from the notes dictionary
-  audio_clip = generate_audio(notes)
+  audio_clip = generate_audio_streaming(notes)
 
   # Saves the audio plot and the audio file
   save_audio(audio_clip)
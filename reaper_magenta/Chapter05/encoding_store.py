@@ -0,0 +1,185 @@
+"""
+Append-only, memory-mapped store for NSynth encodings.
+
+All the encodings are written one after the other in a single binary data
+file, with a "name -> offset" index appended as JSON lines in a separate
+file. Loading an encoding returns a read-only zero-copy view on the
+memory-mapped data file, which means a store can be opened in many worker
+processes that will share the same pages from the OS cache.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+DATA_FILENAME = "encodings.dat"
+INDEX_FILENAME = "index.jsonl"
+
+
+class EncodingStore(object):
+  """
+  An append-only encoding store, the encodings are indexed by their name
+  and can only be written once.
+  """
+
+  def __init__(self,
+               store_dir: str = "encodings",
+               dtype: np.dtype = np.float32):
+    """
+    Constructs the store, creating the store_dir if it doesn't exist and
+    reading the index if it does.
+
+    :param store_dir: the directory containing the data and index files
+    :param dtype: the dtype the new encodings will be written with,
+    already written encodings keep their own dtype
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    self._data_path = os.path.join(store_dir, DATA_FILENAME)
+    self._index_path = os.path.join(store_dir, INDEX_FILENAME)
+    self._dtype = np.dtype(dtype)
+    self._index: Dict[str, Tuple[int, Tuple[int, ...], str]] = {}
+    self._index_position = 0
+    self._data = None
+    self.refresh()
+
+  def __getstate__(self):
+    # The memory map is opened again lazily in the receiving process
+    state = self.__dict__.copy()
+    state["_data"] = None
+    return state
+
+  def __contains__(self, name: str) -> bool:
+    return name in self._index
+
+  def __len__(self) -> int:
+    return len(self._index)
+
+  def names(self) -> List[str]:
+    """
+    Returns the names of the encodings in the store, in insertion order.
+    """
+    return list(self._index.keys())
+
+  def refresh(self) -> None:
+    """
+    Reads the index entries appended since the last refresh, for example
+    by another process writing to the same store.
+    """
+    if not os.path.exists(self._index_path):
+      return
+    with open(self._index_path, "rb") as index_file:
+      index_file.seek(self._index_position)
+      while True:
+        line = index_file.readline()
+        # Ignores a partially written trailing line, it will be read
+        # on the next refresh when complete
+        if not line.endswith(b"\n"):
+          break
+        entry = json.loads(line)
+        self._index[entry["name"]] = (entry["offset"],
+                                      tuple(entry["shape"]),
+                                      entry["dtype"])
+        self._index_position = index_file.tell()
+    self._data = None
+
+  def extend(self,
+             encodings: Iterable[np.ndarray],
+             names: Iterable[str]) -> None:
+    """
+    Appends the given encodings to the store with their corresponding names.
+
+    :param encodings: the encodings to append
+    :param names: the names of the encodings, without the ".npy" extension
+    :raises ValueError: if a name is already present in the store
+    """
+    encodings, names = list(encodings), list(names)
+    for name in names:
+      if name in self._index:
+        raise ValueError(f"Encoding {name} is already in the store")
+    if len(set(names)) != len(names):
+      raise ValueError(f"Duplicate encoding names in {names}")
+    entries = []
+    with open(self._data_path, "ab") as data_file:
+      offset = data_file.tell()
+      for encoding, name in zip(encodings, names):
+        encoding = np.ascontiguousarray(encoding, dtype=self._dtype)
+        data_file.write(encoding.tobytes())
+        entries.append((name, offset, encoding.shape))
+        offset += encoding.nbytes
+    # The index is written after the data, a reader will never see an
+    # entry pointing to data that isn't there yet
+    with open(self._index_path, "a") as index_file:
+      for name, offset, shape in entries:
+        index_file.write(json.dumps({"name": name,
+                                     "offset": offset,
+                                     "shape": list(shape),
+                                     "dtype": self._dtype.str}) + "\n")
+    self.refresh()
+
+  def append(self, encoding: np.ndarray, name: str) -> None:
+    """
+    Appends the given encoding to the store. See EncodingStore.extend.
+
+    :param encoding: the encoding to append
+    :param name: the name of the encoding
+    """
+    self.extend([encoding], [name])
+
+  def _get_data(self) -> np.memmap:
+    if self._data is None:
+      self._data = np.memmap(self._data_path, dtype=np.uint8, mode="r")
+    return self._data
+
+  def load(self, name: str) -> np.ndarray:
+    """
+    Returns the encoding of the given name as a read-only view on the memory
+    mapped data file, the data is only read from disk when accessed.
+
+    :param name: the name of the encoding
+    :raises KeyError: if the name is not present in the store
+    """
+    offset, shape, dtype = self._index[name]
+    return np.ndarray(shape, dtype=dtype, buffer=self._get_data(),
+                      offset=offset)
+
+  def load_batch(self, names: List[str]) -> np.ndarray:
+    """
+    Returns the encodings of the given names in a single array, the
+    encodings need to be of the same shape and dtype. When the encodings
+    are evenly spaced in the data file (for example consecutive names in
+    insertion order), the array is a read-only view on the memory mapped
+    data file, otherwise the encodings are copied from the memory map with
+    a single fancy indexing.
+
+    :param names: the names of the encodings
+    :raises KeyError: if a name is not present in the store
+    :raises ValueError: if the encodings don't have the same shape and dtype
+    """
+    if not names:
+      return np.empty((0,))
+    entries = [self._index[name] for name in names]
+    _, shape, dtype = entries[0]
+    if any((entry_shape, entry_dtype) != (shape, dtype)
+           for _, entry_shape, entry_dtype in entries):
+      raise ValueError(f"Encodings {names} don't have the same shape "
+                       f"and dtype")
+    dtype = np.dtype(dtype)
+    offsets = np.array([offset for offset, _, _ in entries], dtype=np.int64)
+    data = self._get_data()
+
+    steps = np.diff(offsets)
+    if len(steps) == 0 or np.all(steps == steps[0]):
+      # Evenly spaced, a strided view with the first axis stepping between
+      # the encodings
+      step = int(steps[0]) if len(steps) else 0
+      encoding_strides = np.empty(shape, dtype=dtype).strides
+      return np.ndarray((len(names),) + shape, dtype=dtype, buffer=data,
+                        offset=int(offsets[0]),
+                        strides=(step,) + encoding_strides)
+
+    # Gathers the bytes of each encoding from the memory map
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    encodings = data[offsets[:, np.newaxis] + np.arange(nbytes)]
+    return encodings.view(dtype).reshape((len(names),) + shape)
@@ -8,23 +8,22 @@ VERSION: Magenta 2.1.2
 
 import argparse
 import os
-import time
-from decimal import Decimal
 
 import mido
 import tensorflow as tf
-from magenta.common import concurrency
 from magenta.interfaces.midi.midi_hub import MidiHub
-from magenta.interfaces.midi.midi_interaction import adjust_sequence_times
 from magenta.models.drums_rnn import drums_rnn_sequence_generator
 from magenta.models.shared import sequence_generator_bundle
 from note_seq import constants
 from note_seq import midi_io
 from note_seq import notebook_utils
 from note_seq.protobuf import generator_pb2
-from note_seq.protobuf import music_pb2
 from visual_midi import Plotter
 
+from loop_player import LoopPlayer
+from loop_player import compile_sequence
+from loop_scheduler import LoopScheduler
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--midi_port", type=str, default="FLUID Synth")
 args = parser.parse_args()
@@ -88,50 +87,35 @@ def generate(unused_argv):
                      output_midi_ports=output_ports,
                      texture_type=None)
 
-  # Start on a empty sequence, allowing the update of the
-  # sequence for later.
-  empty_sequence = music_pb2.NoteSequence()
-  player = midi_hub.start_playback(empty_sequence,
-                                   allow_updates=True)
-  player._channel = 9
+  # Start a looping player on the hub output port, the sequences are
+  # compiled once with times relative to the loop start, the player
+  # adding the loop start time when sending each message
+  player = LoopPlayer(midi_hub._outport, channel=9)
+  player.start()
 
   # We want a period in seconds of 4 bars (which is the loop
   # length). Using 240 / qpm, we have a period of 1 bar, or
   # 2 seconds at 120 qpm. We multiply that by 4 bars.
-  # (using the Decimal class for more accuracy)
-  period = Decimal(240) / qpm
+  period = 240 / qpm
   period = period * (num_bars + 1)
-  sleeper = concurrency.Sleeper()
-  while True:
-    try:
-      # We get the next tick time by using the period
-      # to find the absolute tick number (since epoch),
-      # and multiplying by the period length. This is
-      # used to sleep until that time.
-      # We also find the current tick time for the player
-      # to update.
-      # (using the Decimal class for more accuracy)
-      now = Decimal(time.time())
-      tick_number = int(now // period)
-      tick_number_next = tick_number + 1
-      tick_time = tick_number * period
-      tick_time_next = tick_number_next * period
-
-      print(f"now {now} tick_time {tick_time} tick_time_next {tick_time_next}")
-
-      # Update the player time to the current tick time
-      sequence_adjusted = music_pb2.NoteSequence()
-      sequence_adjusted.CopyFrom(sequence)
-      sequence_adjusted = adjust_sequence_times(sequence_adjusted,
-                                                float(tick_time))
-      player.update_sequence(sequence_adjusted,
-                             start_time=float(tick_time))
-
-      # Sleep until the next tick time
-      sleeper.sleep_until(float(tick_time_next))
-    except KeyboardInterrupt:
-      print(f"Stopping")
-      return 0
+
+  def play(sequence, start_time, index):
+    # Update the player time to the current cycle start time,
+    # without copying the sequence
+    player.update(sequence, start_time)
+    print(f"cycle {index} start_time {start_time} "
+          f"lateness {scheduler.stats[-1].wakeup_lateness:.4f}")
+
+  # The scheduler loops on the cycles using a monotonic clock, so the
+  # time spent in each cycle doesn't drift the next cycles
+  scheduler = LoopScheduler(period, play)
+  try:
+    scheduler.run(compile_sequence(sequence, channel=9))
+  except KeyboardInterrupt:
+    print(f"Stopping")
+    print(f"Latency stats: {scheduler.summary()}")
+    player.stop()
+    return 0
 
 
 if __name__ == "__main__":
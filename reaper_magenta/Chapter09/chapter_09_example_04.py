@@ -7,57 +7,284 @@ VERSION: Magenta 2.1.2
 
 import argparse
 import time
-from decimal import Decimal
+from threading import Lock
 from threading import Thread
+from typing import Dict, List, Tuple
 
 import mido
-from magenta.common.concurrency import Sleeper
 from magenta.interfaces.midi.midi_hub import MidiHub
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--midi_port", type=str, default="magenta_out")
+parser.add_argument("--loopback", action="store_true",
+                    help="measures the clock jitter on a loopback port "
+                         "instead of sending to the MIDI port")
 args = parser.parse_args()
 
 
+class JitterHistogram(object):
+  """
+  A fixed bins histogram of the deviation between the scheduled and actual
+  tick times, in microseconds, from which the mean and percentiles
+  are computed.
+  """
+
+  def __init__(self, bin_width_us: int = 10, max_us: int = 5000):
+    """
+    Constructs the histogram with the given arguments
+
+    :param bin_width_us: the width of a bin in microseconds
+    :param max_us: the max deviation, bigger deviations are
+    counted in the last bin
+    """
+    self._bin_width_us = bin_width_us
+    self._bins = [0] * (max_us // bin_width_us + 1)
+    self._count = 0
+    self._total_us = 0.0
+    self._lock = Lock()
+
+  def add(self, deviation_ns: int) -> None:
+    """
+    Adds a deviation to the histogram
+
+    :param deviation_ns: the deviation in nanoseconds
+    """
+    deviation_us = abs(deviation_ns) / 1000
+    index = min(int(deviation_us // self._bin_width_us), len(self._bins) - 1)
+    with self._lock:
+      self._bins[index] += 1
+      self._count += 1
+      self._total_us += deviation_us
+
+  def percentile(self, percentile: float) -> float:
+    """
+    Returns the upper bound of the bin containing the given percentile,
+    in microseconds
+
+    :param percentile: the percentile, between 0 and 100
+    """
+    with self._lock:
+      threshold = self._count * percentile / 100
+      cumulative = 0
+      for index, count in enumerate(self._bins):
+        cumulative += count
+        if count and cumulative >= threshold:
+          return (index + 1) * self._bin_width_us
+      return 0
+
+  def summary(self) -> Dict[str, float]:
+    """
+    Returns the number of ticks and the mean, p50, p99 and max deviation
+    in microseconds.
+    """
+    with self._lock:
+      count, total_us = self._count, self._total_us
+    return {"ticks": count,
+            "mean_us": total_us / count if count else 0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            "max_us": self.percentile(100)}
+
+
 class Metronome(Thread):
 
-  def __init__(self, outport, qpm):
+  def __init__(self, outport, qpm, ppqn: int = 24, spin_ns: int = 1000000):
+    """
+    Constructs the metronome with the given arguments
+
+    :param outport: the output port to send the clock messages to
+    :param qpm: the tempo in quarters per minute
+    :param ppqn: the number of clock pulses per quarter note, 24 for the
+    MIDI clock
+    :param spin_ns: the time before each tick for which the metronome
+    busy waits instead of sleeping, since the OS sleep isn't precise
+    enough for the final sub-millisecond
+    """
     super(Metronome, self).__init__()
     self._message_clock = mido.Message(type='clock')
     self._message_start = mido.Message(type='start')
     self._message_stop = mido.Message(type='stop')
     self._message_reset = mido.Message(type='reset')
     self._outport = outport
-    # Period of 4 ticks per bar, or 1 tick per beat
-    self._period = Decimal(2.5) / qpm
+    self._ppqn = ppqn
+    self._spin_ns = spin_ns
+    # Period in nanoseconds between two clock pulses
+    self._period_ns = 60e9 / qpm / ppqn
+    self._anchor_ns = None
+    self._anchor_tick = 0
+    self._tick = 0
+    self._lock = Lock()
     self._stop_signal = False
+    self.jitter = JitterHistogram()
 
-  def run(self):
-    sleeper = Sleeper()
+  def set_qpm(self, qpm) -> None:
+    """
+    Changes the tempo from the last tick onwards, without phase jump.
+
+    :param qpm: the new tempo in quarters per minute
+    """
+    with self._lock:
+      if self._anchor_ns is not None:
+        # Re-anchors on the last tick, the next ticks follow the new period
+        self._anchor_ns = self._tick_time_ns(self._tick)
+        self._anchor_tick = self._tick
+      self._period_ns = 60e9 / qpm / self._ppqn
 
+  def _tick_time_ns(self, tick: int) -> int:
+    return self._anchor_ns + round((tick - self._anchor_tick)
+                                   * self._period_ns)
+
+  def _wait_until(self, deadline_ns: int) -> None:
+    # Sleeps for most of the wait, then spins until the deadline
+    remaining_ns = deadline_ns - time.monotonic_ns()
+    if remaining_ns > self._spin_ns:
+      time.sleep((remaining_ns - self._spin_ns) / 1e9)
+    while time.monotonic_ns() < deadline_ns:
+      pass
+
+  def run(self):
     # Sends reset and the start, we could also
     # use the "continue" message
     self._outport.send(self._message_reset)
     self._outport.send(self._message_start)
+    with self._lock:
+      self._anchor_ns = time.monotonic_ns()
+      self._anchor_tick = 0
 
     # Loops until the stop signal is True
     while not self._stop_signal:
-      # Calculates the next tick for current time
-      now = Decimal(time.time())
-      tick_number = max(0, int(now // self._period) + 1)
-      tick_time = tick_number * self._period
-      sleeper.sleep_until(float(tick_time))
+      # Calculates the next tick time from the anchor, so that
+      # the errors don't accumulate
+      with self._lock:
+        self._tick += 1
+        tick_time_ns = self._tick_time_ns(self._tick)
+      self._wait_until(tick_time_ns)
 
       # Sends the clock message as soon it wakeup
       self._outport.send(self._message_clock)
+      self.jitter.add(time.monotonic_ns() - tick_time_ns)
 
-      # Sends a stop message when finished
+    # Sends a stop message when finished
     self._outport.send(self._message_stop)
 
   def stop(self):
     self._stop_signal = True
 
 
+class LoopbackPort(object):
+  """
+  A stand-in for a virtual MIDI output port, recording the time at which
+  each message is received, used to measure the metronome jitter
+  without a MIDI device.
+  """
+
+  def __init__(self):
+    self.received: List[Tuple[int, mido.Message]] = []
+
+  def send(self, message: mido.Message) -> None:
+    self.received.append((time.monotonic_ns(), message))
+
+
+def _get_tick_times(start_ns: int,
+                    num_ticks: int,
+                    tempos: List[Tuple[int, float]],
+                    ppqn: int) -> List[float]:
+  """
+  Returns the expected times of the ticks 1 to num_ticks, from the start
+  time and the (tick, qpm) tempos, each tempo applying to the ticks after
+  its tick.
+  """
+  tick_times = []
+  time_ns = start_ns
+  tempo_index = 0
+  for tick in range(1, num_ticks + 1):
+    while (tempo_index + 1 < len(tempos)
+           and tick > tempos[tempo_index + 1][0]):
+      tempo_index += 1
+    time_ns += 60e9 / tempos[tempo_index][1] / ppqn
+    tick_times.append(time_ns)
+  return tick_times
+
+
+def get_loopback_jitter(received: List[Tuple[int, mido.Message]],
+                        qpm: float,
+                        tempo_changes: List[Tuple[int, float]] = (),
+                        ppqn: int = 24) -> JitterHistogram:
+  """
+  Returns the histogram of the deviation between the reception time of
+  each clock message on the loopback port and its expected time on the
+  tick grid, computed from the received messages only (independently of
+  the metronome's own measure). The grid starts at the reception of the
+  start message, and a tempo change applies after the tick pending when
+  it was made, the next one to be received (or the last one received, if
+  the change came right after it, whichever fits the received ticks best).
+
+  :param received: the (time_ns, message) received on the loopback port
+  :param qpm: the initial tempo in quarters per minute
+  :param tempo_changes: the (time_ns, qpm) of the tempo changes, in order
+  :param ppqn: the number of clock pulses per quarter note
+  """
+  start_ns = next(time_ns for time_ns, message in received
+                  if message.type == "start")
+  clock_times = [time_ns for time_ns, message in received
+                 if message.type == "clock"]
+
+  def get_error(tempos, num_ticks):
+    tick_times = _get_tick_times(start_ns, num_ticks, tempos, ppqn)
+    return sum(abs(clock_time - tick_time) for clock_time, tick_time
+               in zip(clock_times, tick_times))
+
+  tempos = [(0, qpm)]
+  changes = list(tempo_changes)
+  for index, (change_ns, change_qpm) in enumerate(changes):
+    received_ticks = sum(1 for clock_time in clock_times
+                         if clock_time < change_ns)
+    # The ticks up to the next change decide where this change applies
+    if index + 1 < len(changes):
+      num_ticks = sum(1 for clock_time in clock_times
+                      if clock_time < changes[index + 1][0])
+    else:
+      num_ticks = len(clock_times)
+    tempos = min((tempos + [(tick, change_qpm)]
+                  for tick in (received_ticks, received_ticks + 1)),
+                 key=lambda candidate: get_error(candidate, num_ticks))
+
+  jitter = JitterHistogram()
+  tick_times = _get_tick_times(start_ns, len(clock_times), tempos, ppqn)
+  for clock_time, tick_time in zip(clock_times, tick_times):
+    jitter.add(round(clock_time - tick_time))
+  return jitter
+
+
+def measure_jitter(qpm: int = 120, seconds: int = 10) -> Dict[str, float]:
+  """
+  Runs the metronome on a loopback port for the given number of seconds,
+  changing the tempo halfway, and prints the jitter stats measured on the
+  loopback port from the received messages (see get_loopback_jitter),
+  next to the metronome's own measure. Returns the loopback jitter stats.
+
+  :param qpm: the tempo in quarters per minute
+  :param seconds: the duration of the measure
+  """
+  loopback_port = LoopbackPort()
+  metronome = Metronome(loopback_port, qpm)
+  metronome.start()
+  time.sleep(seconds / 2)
+  tempo_changes = [(time.monotonic_ns(), qpm * 1.5)]
+  metronome.set_qpm(qpm * 1.5)
+  time.sleep(seconds / 2)
+  metronome.stop()
+  metronome.join()
+  loopback_jitter = get_loopback_jitter(loopback_port.received,
+                                        qpm,
+                                        tempo_changes)
+  summary = loopback_jitter.summary()
+  print(f"Received {summary['ticks']} clock messages, "
+        f"loopback jitter: {summary}")
+  print(f"Metronome jitter: {metronome.jitter.summary()}")
+  return summary
+
+
 def send_clock():
   # We find the proper input port for the software synth
   # (which is the output port for Magenta)
@@ -81,9 +308,13 @@ def send_clock():
   # Waits for 16 seconds and send the stop command
   metronome.join(timeout=16)
   metronome.stop()
+  print(f"Clock jitter: {metronome.jitter.summary()}")
 
   return 0
 
 
 if __name__ == "__main__":
-  send_clock()
+  if args.loopback:
+    measure_jitter()
+  else:
+    send_clock()
@@ -7,14 +7,10 @@ VERSION: Magenta 2.1.2
 """
 import argparse
 import os
-import time
-from decimal import Decimal
 
 import mido
 import tensorflow as tf
-from magenta.common import concurrency
 from magenta.interfaces.midi.midi_hub import MidiHub
-from magenta.interfaces.midi.midi_interaction import adjust_sequence_times
 from magenta.models.drums_rnn import drums_rnn_sequence_generator
 from magenta.models.shared import sequence_generator_bundle
 from note_seq import constants
@@ -22,9 +18,12 @@ from note_seq import midi_io
 from note_seq import trim_note_sequence
 from note_seq import notebook_utils
 from note_seq.protobuf import generator_pb2
-from note_seq.protobuf import music_pb2
 from visual_midi import Plotter
 
+from loop_player import LoopPlayer
+from loop_player import compile_sequence
+from loop_scheduler import LoopScheduler
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--midi_port", type=str, default="FLUID Synth")
 args = parser.parse_args()
@@ -88,55 +87,59 @@ def generate(unused_argv):
                      output_midi_ports=output_ports,
                      texture_type=None)
 
-  # Start on a empty sequence, allowing the update of the
-  # sequence for later.
-  empty_sequence = music_pb2.NoteSequence()
-  player = midi_hub.start_playback(empty_sequence,
-                                   allow_updates=True)
-  player._channel = 9
+  # Start a looping player on the hub output port, the sequences are
+  # compiled once with times relative to the loop start, the player
+  # adding the loop start time when sending each message
+  player = LoopPlayer(midi_hub._outport, channel=9)
+  player.start()
 
   # We want a period in seconds of 4 bars
-  period = Decimal(240) / qpm
+  period = 240 / qpm
   period = period * (num_bars + 1)
-  sleeper = concurrency.Sleeper()
-  index = 0
-  while True:
-    try:
-      # We get the next tick time by using the period
-      # to find the absolute tick number.
-      now = Decimal(time.time())
-      tick_number = int(now // period)
-      tick_number_next = tick_number + 1
-      tick_time = tick_number * period
-      tick_time_next = tick_number_next * period
-
-      # Update the player time to the current tick time
-      sequence_adjusted = music_pb2.NoteSequence()
-      sequence_adjusted.CopyFrom(sequence)
-      sequence_adjusted = adjust_sequence_times(sequence_adjusted,
-                                                float(tick_time))
-      player.update_sequence(sequence_adjusted,
-                             start_time=float(tick_time))
-
-      # Generate a new sequence based on the previous sequence
-      index = index + 1
-      generator_options = generator_pb2.GeneratorOptions()
-      generator_options.args['temperature'].float_value = 1
-      generation_start_time = index * period
-      generation_end_time = generation_start_time + period
-      generator_options.generate_sections.add(
-        start_time=generation_start_time,
-        end_time=generation_end_time)
-      sequence = generator.generate(sequence, generator_options)
-      sequence = trim_note_sequence(sequence,
-                                    generation_start_time,
-                                    generation_end_time)
-
-      # Sleep until the next tick time
-      sleeper.sleep_until(float(tick_time_next))
-    except KeyboardInterrupt:
-      print(f"Stopping")
-      return 0
+
+  def play(sequences, start_time, index):
+    _, compiled_sequence = sequences
+    # Update the player time to the current cycle start time,
+    # without copying the sequence
+    player.update(compiled_sequence, start_time)
+    stats = scheduler.stats[-1]
+    print(f"cycle {index} generation_latency {stats.generation_latency} "
+          f"headroom {stats.headroom} missed {stats.missed}"
+          + (f" error {stats.error}" if stats.error else ""))
+
+  def generate_next(sequences, index):
+    sequence, _ = sequences
+    # Generate a new sequence based on the previous sequence
+    generator_options = generator_pb2.GeneratorOptions()
+    generator_options.args['temperature'].float_value = 1
+    generation_start_time = index * period
+    generation_end_time = generation_start_time + period
+    generator_options.generate_sections.add(
+      start_time=generation_start_time,
+      end_time=generation_end_time)
+    sequence = generator.generate(sequence, generator_options)
+    sequence = trim_note_sequence(sequence,
+                                  generation_start_time,
+                                  generation_end_time)
+    # Compiles the sequence here, in the background worker, the trimmed
+    # sequence starting at the generation start time
+    compiled_sequence = compile_sequence(sequence,
+                                         origin=generation_start_time,
+                                         channel=9)
+    return sequence, compiled_sequence
+
+  # The scheduler plays the current sequence at each cycle, while the
+  # sequence for the next cycle is generated in a background worker. If
+  # the generation isn't finished at the next cycle, the current sequence
+  # is played again.
+  scheduler = LoopScheduler(period, play, generate=generate_next)
+  try:
+    scheduler.run((sequence, compile_sequence(sequence, channel=9)))
+  except KeyboardInterrupt:
+    print(f"Stopping")
+    print(f"Latency stats: {scheduler.summary()}")
+    player.stop()
+    return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+Looping MIDI player working on precompiled, time-relative event lists.
+
+The MIDI hub player needs a NoteSequence with absolute (wall clock) times,
+which means copying and shifting the whole sequence at each loop. Here, a
+sequence is compiled once into a list of messages with times relative to
+the start of the loop, and the loop start time is only added when each
+message is dispatched, so updating the player at each loop is O(1).
+"""
+
+import bisect
+import threading
+import time
+from typing import List, NamedTuple, Set
+
+import mido
+
+
+class CompiledSequence(NamedTuple):
+  """
+  A sequence compiled to MIDI messages sorted by time, the times being
+  relative to the start of the loop.
+
+  :param times: the relative time of each message, in seconds
+  :param messages: the MIDI messages
+  """
+  times: List[float]
+  messages: List[mido.Message]
+
+
+def compile_sequence(sequence,
+                     origin: float = 0.0,
+                     channel: int = 0) -> CompiledSequence:
+  """
+  Compiles the notes of the given sequence to note on and note off messages
+  sorted by time (note offs first), with times relative to the given origin.
+
+  :param sequence: the NoteSequence to compile
+  :param origin: the time in the sequence corresponding to the start of
+  the loop
+  :param channel: the MIDI channel of the messages
+  """
+  events = []
+  for note in sequence.notes:
+    events.append((note.start_time - origin,
+                   True,
+                   note.pitch,
+                   mido.Message(type="note_on",
+                                note=note.pitch,
+                                velocity=note.velocity,
+                                channel=channel)))
+    events.append((note.end_time - origin,
+                   False,
+                   note.pitch,
+                   mido.Message(type="note_off",
+                                note=note.pitch,
+                                channel=channel)))
+  # At the same time, the note offs come before the note ons, so that a
+  # repeated note is closed before being played again
+  events.sort(key=lambda event: event[:3])
+  return CompiledSequence([event[0] for event in events],
+                          [event[3] for event in events])
+
+
+class LoopPlayer(threading.Thread):
+  """
+  A thread playing compiled sequences on a MIDI output port, the played
+  sequence and its start time being updated at each loop.
+  """
+
+  def __init__(self,
+               outport,
+               channel: int = 0,
+               late_tolerance: float = 0.1):
+    """
+    Constructs the player with the given arguments
+
+    :param outport: the Mido port for sending messages
+    :param channel: the MIDI channel used to close the open notes
+    :param late_tolerance: the time in seconds after which a message that
+    should have been sent before the update is skipped instead of being
+    sent late
+    """
+    super(LoopPlayer, self).__init__(daemon=True)
+    self._outport = outport
+    self._channel = channel
+    self._late_tolerance = late_tolerance
+    self._sequence = CompiledSequence([], [])
+    self._start_time = 0.0
+    self._cursor = 0
+    self._open_notes: Set[int] = set()
+    self._lock = threading.Lock()
+    self._update_cv = threading.Condition(self._lock)
+    self._stop_signal = False
+
+  def update(self, sequence: CompiledSequence, start_time: float) -> None:
+    """
+    Plays the given compiled sequence from the given start time, the
+    events more than late_tolerance before the current time are skipped,
+    and the notes still open from the previous sequence are closed.
+
+    :param sequence: the compiled sequence, see compile_sequence
+    :param start_time: the wall clock time of the start of the loop
+    """
+    with self._lock:
+      for note in self._open_notes:
+        self._outport.send(mido.Message(type="note_off",
+                                        note=note,
+                                        channel=self._channel))
+      self._open_notes.clear()
+      self._sequence = sequence
+      self._start_time = start_time
+      self._cursor = bisect.bisect_left(
+        sequence.times, time.time() - start_time - self._late_tolerance)
+      self._update_cv.notify()
+
+  def run(self) -> None:
+    with self._lock:
+      while not self._stop_signal:
+        if self._cursor >= len(self._sequence.times):
+          self._update_cv.wait()
+          continue
+        delta = (self._start_time + self._sequence.times[self._cursor]
+                 - time.time())
+        if delta > 0:
+          self._update_cv.wait(timeout=delta)
+          continue
+        message = self._sequence.messages[self._cursor]
+        self._cursor += 1
+        if message.type == "note_on":
+          self._open_notes.add(message.note)
+        else:
+          self._open_notes.discard(message.note)
+        self._outport.send(message)
+
+  def stop(self) -> None:
+    """
+    Stops the player and closes the open notes.
+    """
+    with self._lock:
+      self._stop_signal = True
+      for note in self._open_notes:
+        self._outport.send(mido.Message(type="note_off",
+                                        note=note,
+                                        channel=self._channel))
+      self._open_notes.clear()
+      self._update_cv.notify()
+    self.join()
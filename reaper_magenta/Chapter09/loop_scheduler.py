@@ -0,0 +1,173 @@
+"""
+Drift-free loop scheduler for live generation loops.
+
+The cycle boundaries are computed from a monotonic clock, as an absolute
+offset from the first cycle, so the time taken by each cycle never
+accumulates. The generation of the sequence for the next cycle runs in a
+background worker while the current cycle plays, and if it misses the next
+cycle boundary or fails, the last sequence is played again.
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+
+
+class CycleStats(NamedTuple):
+  """
+  The timing statistics of a single cycle, in seconds.
+
+  :param index: the cycle index
+  :param wakeup_lateness: the time between the cycle boundary and the
+  actual wakeup of the scheduler (0 for the first cycle, which starts
+  in the middle of its period)
+  :param generation_latency: the time taken by the generation that
+  provided the sequence for this cycle, None if there was no new sequence
+  :param headroom: the time remaining before the cycle boundary when the
+  generation finished, None if there was no new sequence
+  :param missed: True if a generation was pending at the cycle boundary,
+  or failed, in which case the last sequence is played again
+  :param error: the error of the generation if it failed, None otherwise
+  """
+  index: int
+  wakeup_lateness: float
+  generation_latency: Optional[float]
+  headroom: Optional[float]
+  missed: bool
+  error: Optional[str] = None
+
+
+class LoopScheduler(object):
+  """
+  Plays a sequence at each cycle of the given period, optionally
+  generating the sequence of the next cycle in a background worker.
+  """
+
+  def __init__(self,
+               period: float,
+               play: Callable[[Any, float, int], None],
+               generate: Optional[Callable[[Any, int], Any]] = None,
+               max_stats: int = 1000):
+    """
+    Constructs the scheduler with the given arguments
+
+    :param period: the period of a cycle in seconds
+    :param play: the play function, called at the start of each cycle with
+    the sequence, the cycle start time (wall clock, in seconds since epoch,
+    as used by the MIDI player) and the cycle index
+    :param generate: the optional generate function, called in a
+    background worker with the previous sequence and the index of the cycle
+    the generated sequence will be played at
+    :param max_stats: the number of cycle stats to keep
+    """
+    self._period = period
+    self._play = play
+    self._generate = generate
+    self._stats: Deque[CycleStats] = deque(maxlen=max_stats)
+    self._stop_event = threading.Event()
+
+  @property
+  def stats(self) -> Deque[CycleStats]:
+    """
+    Returns the stats of the last cycles.
+    """
+    return self._stats
+
+  def _generate_timed(self, sequence: Any, index: int):
+    start_time = time.monotonic()
+    sequence = self._generate(sequence, index)
+    end_time = time.monotonic()
+    return sequence, end_time - start_time, end_time
+
+  def run(self, sequence: Any) -> None:
+    """
+    Runs the loop until stop is called, starting with the given sequence.
+    The cycles are aligned on the period since epoch, like the wall clock
+    loops of the MIDI player.
+
+    :param sequence: the sequence to play for the first cycle
+    """
+    # The wall clock is only read once, to align the first cycle and to
+    # convert the monotonic cycle boundaries to the player's time
+    wall_offset = time.time() - time.monotonic()
+    first_index = int((time.monotonic() + wall_offset) // self._period)
+    executor = ThreadPoolExecutor(max_workers=1)
+    pending: Optional[Future] = None
+    generation_latency, headroom = None, None
+    index = first_index
+    try:
+      while not self._stop_event.is_set():
+        cycle_time = index * self._period - wall_offset
+        wakeup_lateness = (max(0.0, time.monotonic() - cycle_time)
+                           if index != first_index else 0.0)
+
+        # Takes the generated sequence if it is ready, or plays the
+        # last sequence again if the generation missed the deadline or
+        # failed (a new generation is then started for the next cycle)
+        missed, error = False, None
+        if pending:
+          if pending.done():
+            try:
+              sequence, generation_latency, end_time = pending.result()
+              headroom = cycle_time - end_time
+            except Exception as e:
+              missed, error = True, f"{type(e).__name__}: {e}"
+            pending = None
+          else:
+            missed = True
+        self._stats.append(CycleStats(index - first_index,
+                                      wakeup_lateness,
+                                      generation_latency,
+                                      headroom,
+                                      missed,
+                                      error))
+        generation_latency, headroom = None, None
+
+        self._play(sequence, cycle_time + wall_offset, index - first_index)
+
+        # Generates the next sequence while this one plays
+        if self._generate and not pending:
+          pending = executor.submit(self._generate_timed,
+                                    sequence,
+                                    index - first_index + 1)
+
+        # Sleeps until the next cycle boundary
+        index += 1
+        next_cycle_time = index * self._period - wall_offset
+        self._stop_event.wait(max(0.0, next_cycle_time - time.monotonic()))
+    finally:
+      executor.shutdown(wait=False)
+
+  def stop(self) -> None:
+    """
+    Stops the loop, the current cycle finishes playing.
+    """
+    self._stop_event.set()
+
+  def summary(self) -> Dict[str, float]:
+    """
+    Returns the latency statistics of the last cycles: the mean and max
+    wakeup lateness and generation latency, the min headroom, the
+    number of missed deadlines and the number of failed generations
+    (counted in the missed deadlines too).
+    """
+    lateness = [stats.wakeup_lateness for stats in self._stats]
+    latencies = [stats.generation_latency for stats in self._stats
+                 if stats.generation_latency is not None]
+    headrooms = [stats.headroom for stats in self._stats
+                 if stats.headroom is not None]
+    return {
+      "cycles": len(self._stats),
+      "wakeup_lateness_mean": statistics.mean(lateness) if lateness else 0,
+      "wakeup_lateness_max": max(lateness, default=0),
+      "generation_latency_mean": (statistics.mean(latencies)
+                                  if latencies else 0),
+      "generation_latency_max": max(latencies, default=0),
+      "headroom_min": min(headrooms, default=0),
+      "missed": sum(stats.missed for stats in self._stats),
+      "errors": sum(stats.error is not None for stats in self._stats),
+    }